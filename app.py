@@ -1,1415 +1,6397 @@
-import streamlit as st
-import pandas as pd
-import numpy as np
-import requests
-from io import BytesIO
-import base64
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime
-import time
-
-# ========================
-# НАСТРОЙКИ СТРАНИЦЫ
-# ========================
-st.set_page_config(
-    page_title="DDMRP Система управления остатками",
-    page_icon="📊",
-    layout="wide"
-)
-
-# ========================
-# СТИЛИЗАЦИЯ
-# ========================
-
-def apply_custom_styles():
-    """Применение пользовательских CSS стилей"""
-    st.markdown("""
-    <style>
-        /* Общие стили */
-        .main {
-            background-color: #f8f9fa;
-        }
-
-        /* Заголовки */
-        h1 {
-            color: #1e3a8a;
-            font-weight: 700;
-            padding-bottom: 10px;
-            border-bottom: 3px solid #3b82f6;
-        }
-
-        h2 {
-            color: #1e40af;
-            font-weight: 600;
-        }
-
-        h3 {
-            color: #2563eb;
-            font-weight: 500;
-        }
-
-        /* Метрики */
-        [data-testid="stMetricValue"] {
-            font-size: 28px;
-            font-weight: 700;
-        }
-
-        [data-testid="stMetricLabel"] {
-            font-size: 14px;
-            font-weight: 500;
-            color: #64748b;
-        }
-
-        /* Кнопки */
-        .stButton > button {
-            background-color: #3b82f6;
-            color: white;
-            border-radius: 8px;
-            padding: 0.5rem 2rem;
-            font-weight: 600;
-            border: none;
-            transition: all 0.3s ease;
-        }
-
-        .stButton > button:hover {
-            background-color: #2563eb;
-            box-shadow: 0 4px 6px rgba(59, 130, 246, 0.3);
-            transform: translateY(-2px);
-        }
-
-        /* Боковая панель */
-        [data-testid="stSidebar"] {
-            background-color: #f1f5f9;
-        }
-
-        [data-testid="stSidebar"] h2 {
-            color: #1e40af;
-        }
-
-        /* Таблицы */
-        .dataframe {
-            font-size: 13px;
-        }
-
-        .dataframe thead tr th {
-            background-color: #3b82f6 !important;
-            color: white !important;
-            font-weight: 600;
-            padding: 12px 8px;
-        }
-
-        .dataframe tbody tr:nth-child(even) {
-            background-color: #f8fafc;
-        }
-
-        .dataframe tbody tr:hover {
-            background-color: #e0f2fe;
-            transition: background-color 0.2s ease;
-        }
-
-        /* Вкладки */
-        .stTabs [data-baseweb="tab-list"] {
-            gap: 8px;
-            background-color: #e2e8f0;
-            padding: 8px;
-            border-radius: 8px;
-        }
-
-        .stTabs [data-baseweb="tab"] {
-            background-color: white;
-            border-radius: 6px;
-            padding: 8px 20px;
-            font-weight: 500;
-        }
-
-        .stTabs [aria-selected="true"] {
-            background-color: #3b82f6;
-            color: white;
-        }
-
-        /* Информационные блоки */
-        .stAlert {
-            border-radius: 8px;
-            padding: 1rem;
-        }
-
-        /* Карточки */
-        div[data-testid="metric-container"] {
-            background-color: white;
-            padding: 15px;
-            border-radius: 10px;
-            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-            transition: transform 0.2s ease, box-shadow 0.2s ease;
-        }
-
-        div[data-testid="metric-container"]:hover {
-            transform: translateY(-4px);
-            box-shadow: 0 4px 12px rgba(0,0,0,0.15);
-        }
-
-        /* Статусы буферов */
-        .status-red {
-            background-color: #fee2e2;
-            color: #991b1b;
-            padding: 4px 12px;
-            border-radius: 6px;
-            font-weight: 600;
-        }
-
-        .status-yellow {
-            background-color: #fef3c7;
-            color: #92400e;
-            padding: 4px 12px;
-            border-radius: 6px;
-            font-weight: 600;
-        }
-
-        .status-green {
-            background-color: #d1fae5;
-            color: #065f46;
-            padding: 4px 12px;
-            border-radius: 6px;
-            font-weight: 600;
-        }
-
-        .status-excess {
-            background-color: #dbeafe;
-            color: #1e40af;
-            padding: 4px 12px;
-            border-radius: 6px;
-            font-weight: 600;
-        }
-
-        /* Загрузчик файлов */
-        [data-testid="stFileUploader"] {
-            background-color: white;
-            padding: 20px;
-            border-radius: 8px;
-            border: 2px dashed #cbd5e1;
-        }
-
-        /* Текстовые поля */
-        .stTextInput > div > div > input {
-            border-radius: 6px;
-            border: 2px solid #e2e8f0;
-        }
-
-        .stTextInput > div > div > input:focus {
-            border-color: #3b82f6;
-            box-shadow: 0 0 0 3px rgba(59, 130, 246, 0.1);
-        }
-
-        /* Разделитель */
-        hr {
-            margin: 2rem 0;
-            border: none;
-            border-top: 2px solid #e2e8f0;
-        }
-
-        /* Графики */
-        .js-plotly-plot {
-            border-radius: 8px;
-            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        }
-    </style>
-    """, unsafe_allow_html=True)
-
-
-def style_dataframe(df):
-    """Применение стилизации к DataFrame с цветовым кодированием статусов"""
-
-    def highlight_status(row):
-        """Раскраска строк по статусу буфера"""
-        if 'Buffer_Status' not in row.index:
-            return [''] * len(row)
-
-        status = row['Buffer_Status']
-
-        if status == 'RED':
-            return ['background-color: #fee2e2'] * len(row)
-        elif status == 'YELLOW':
-            return ['background-color: #fef3c7'] * len(row)
-        elif status == 'GREEN':
-            return ['background-color: #d1fae5'] * len(row)
-        elif status == 'EXCESS':
-            return ['background-color: #dbeafe'] * len(row)
-        else:
-            return [''] * len(row)
-
-    def color_status_cell(val):
-        """Раскраска ячеек статуса"""
-        if val == 'RED':
-            return 'background-color: #ef4444; color: white; font-weight: bold; text-align: center'
-        elif val == 'YELLOW':
-            return 'background-color: #eab308; color: white; font-weight: bold; text-align: center'
-        elif val == 'GREEN':
-            return 'background-color: #22c55e; color: white; font-weight: bold; text-align: center'
-        elif val == 'EXCESS':
-            return 'background-color: #3b82f6; color: white; font-weight: bold; text-align: center'
-        return ''
-
-    def color_priority(val):
-        """Раскраска приоритета"""
-        if val == 1:
-            return 'background-color: #dc2626; color: white; font-weight: bold; text-align: center'
-        elif val == 2:
-            return 'background-color: #f59e0b; color: white; font-weight: bold; text-align: center'
-        elif val == 3:
-            return 'background-color: #16a34a; color: white; font-weight: bold; text-align: center'
-        elif val == 4:
-            return 'background-color: #2563eb; color: white; font-weight: bold; text-align: center'
-        return ''
-
-    # Применяем стили
-    styled_df = df.style
-
-    # Если есть колонка Buffer_Status, раскрашиваем её
-    if 'Buffer_Status' in df.columns:
-        styled_df = styled_df.applymap(color_status_cell, subset=['Buffer_Status'])
-
-    # Если есть колонка Priority, раскрашиваем её
-    if 'Priority' in df.columns:
-        styled_df = styled_df.applymap(color_priority, subset=['Priority'])
-
-    # Форматирование числовых колонок
-    format_dict = {}
-
-    if 'Current_Stock' in df.columns:
-        format_dict['Current_Stock'] = '{:.0f}'
-
-    if 'Order_Qty' in df.columns:
-        format_dict['Order_Qty'] = '{:.0f}'
-
-    if 'Stock_Value' in df.columns:
-        format_dict['Stock_Value'] = '{:,.2f}₴'
-
-    if 'Buffer_Fill_Percent' in df.columns:
-        format_dict['Buffer_Fill_Percent'] = '{:.1f}%'
-
-    if 'Days_Until_Stockout' in df.columns:
-        format_dict['Days_Until_Stockout'] = '{:.1f}'
-
-    if format_dict:
-        styled_df = styled_df.format(format_dict, na_rep='-')
-
-    return styled_df
-
-
-# ========================
-# ФУНКЦИИ ЗАГРУЗКИ ДАННЫХ
-# ========================
-
-def download_google_sheet(sheet_url, max_retries=3):
-    """Загрузка торговой матрицы из Google Sheets с улучшенной обработкой ошибок"""
-
-    # Валидация URL
-    if not sheet_url or not isinstance(sheet_url, str):
-        st.error("❌ Некорректный URL Google Sheets")
-        return None
-
-    if 'docs.google.com/spreadsheets' not in sheet_url:
-        st.error("❌ URL должен вести на Google Sheets (docs.google.com/spreadsheets)")
-        return None
-
-    try:
-        # Преобразование URL в формат экспорта CSV
-        if '/edit' in sheet_url:
-            csv_url = sheet_url.replace('/edit?gid=', '/export?format=csv&gid=')
-            csv_url = csv_url.replace('/edit#gid=', '/export?format=csv&gid=')
-            csv_url = csv_url.replace('/edit', '/export?format=csv')
-            csv_url = csv_url.split('#')[0]
-        else:
-            csv_url = sheet_url
-
-        # Retry механизм с экспоненциальной задержкой
-        for attempt in range(max_retries):
-            try:
-                # Запрос с таймаутом
-                response = requests.get(csv_url, timeout=30)
-
-                # Проверка статуса
-                if response.status_code == 200:
-                    # Проверка на пустой ответ
-                    if not response.content:
-                        st.error("❌ Google Sheets вернул пустой файл")
-                        return None
-
-                    # Чтение CSV
-                    df = pd.read_csv(BytesIO(response.content))
-
-                    # Проверка на пустой DataFrame
-                    if df.empty:
-                        st.error("❌ Google Sheets не содержит данных")
-                        return None
-
-                    # Проверка на минимальное количество строк
-                    if len(df) < 1:
-                        st.error("❌ Google Sheets содержит недостаточно данных")
-                        return None
-
-                    # Очистка названий колонок от пробелов
-                    df.columns = df.columns.str.strip()
-
-                    # Вывод информации о найденных колонках для отладки
-                    st.info(f"📋 Найденные колонки в Google Sheets: {', '.join(df.columns.tolist())}")
-
-                    # Маппинг альтернативных названий колонок
-                    column_mapping = {
-                        'article': 'Article',
-                        'ARTICLE': 'Article',
-                        'Артикул': 'Article',
-                        'артикул': 'Article',
-                        'describe': 'Describe',
-                        'DESCRIBE': 'Describe',
-                        'Description': 'Describe',
-                        'Описание': 'Describe',
-                        'описание': 'Describe',
-                        'Store_ID': 'Store_ID',
-                        'store_id': 'Store_ID',
-                        'STORE_ID': 'Store_ID',
-                        'Magazin': 'Store_ID',
-                        'magazin': 'Store_ID',
-                        'Магазин': 'Store_ID',
-                        'магазин': 'Store_ID',
-                        'Red_Zone': 'Red_Zone',
-                        'red_zone': 'Red_Zone',
-                        'RED_ZONE': 'Red_Zone',
-                        'RedZone': 'Red_Zone',
-                        'Yellow_Zone': 'Yellow_Zone',
-                        'yellow_zone': 'Yellow_Zone',
-                        'YELLOW_ZONE': 'Yellow_Zone',
-                        'YellowZone': 'Yellow_Zone',
-                        'Green_Zone': 'Green_Zone',
-                        'green_zone': 'Green_Zone',
-                        'GREEN_ZONE': 'Green_Zone',
-                        'GreenZone': 'Green_Zone',
-                        'Brand': 'Brand',
-                        'brand': 'Brand',
-                        'Бренд': 'Brand',
-                        'бренд': 'Brand',
-                        'Retail_Price': 'Retail_Price',
-                        'retail_price': 'Retail_Price',
-                        'Price': 'Retail_Price',
-                        'price': 'Retail_Price',
-                        'Цена': 'Retail_Price',
-                        'цена': 'Retail_Price',
-                        'Avg_Daily_Usage': 'Avg_Daily_Usage',
-                        'avg_daily_usage': 'Avg_Daily_Usage',
-                        'ABC_Class': 'ABC_Class',
-                        'abc_class': 'ABC_Class',
-                        'ABC': 'ABC_Class',
-                        'Model': 'Model',
-                        'model': 'Model',
-                        'Модель': 'Model',
-                        'модель': 'Model',
-                        'Segment': 'Segment',
-                        'segment': 'Segment',
-                        'SEGMENT': 'Segment',
-                        'Сегмент': 'Segment',
-                        'сегмент': 'Segment',
-                        'Category': 'Segment',
-                        'category': 'Segment',
-                        'Категорія': 'Segment',
-                        'категорія': 'Segment'
-                    }
-
-                    # Применение маппинга
-                    df = df.rename(columns=column_mapping)
-
-                    st.success(f"✅ Загружено {len(df)} строк из Google Sheets")
-                    return df
-
-                elif response.status_code == 403:
-                    st.error("❌ Доступ запрещен. Проверьте настройки доступа к Google Sheets (должен быть 'Доступен всем, у кого есть ссылка')")
-                    return None
-
-                elif response.status_code == 404:
-                    st.error("❌ Google Sheets не найден. Проверьте корректность URL")
-                    return None
-
-                else:
-                    # Для других кодов ошибок пробуем retry
-                    if attempt < max_retries - 1:
-                        wait_time = 2 ** attempt  # Экспоненциальная задержка: 1, 2, 4 секунды
-                        st.warning(f"⚠️ Ошибка {response.status_code}. Повторная попытка через {wait_time} сек...")
-                        time.sleep(wait_time)
-                        continue
-                    else:
-                        st.error(f"❌ Ошибка загрузки после {max_retries} попыток: HTTP {response.status_code}")
-                        return None
-
-            except requests.exceptions.Timeout:
-                if attempt < max_retries - 1:
-                    wait_time = 2 ** attempt
-                    st.warning(f"⚠️ Превышено время ожидания. Повторная попытка через {wait_time} сек...")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    st.error(f"❌ Превышено время ожидания после {max_retries} попыток")
-                    return None
-
-            except requests.exceptions.ConnectionError:
-                if attempt < max_retries - 1:
-                    wait_time = 2 ** attempt
-                    st.warning(f"⚠️ Ошибка подключения. Повторная попытка через {wait_time} сек...")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    st.error(f"❌ Ошибка подключения после {max_retries} попыток. Проверьте интернет-соединение")
-                    return None
-
-    except pd.errors.EmptyDataError:
-        st.error("❌ Google Sheets содержит некорректные данные (пустой CSV)")
-        return None
-
-    except pd.errors.ParserError as e:
-        st.error(f"❌ Ошибка парсинга CSV из Google Sheets: {str(e)}")
-        return None
-
-    except Exception as e:
-        st.error(f"❌ Непредвиденная ошибка при загрузке Google Sheets: {str(e)}")
-        return None
-
-
-def load_stock_file(uploaded_file):
-    """Загрузка файла остатков Excel с улучшенной обработкой ошибок"""
-
-    # Проверка наличия файла
-    if uploaded_file is None:
-        st.error("❌ Файл не загружен")
-        return None
-
-    try:
-        # Чтение Excel файла
-        try:
-            df = pd.read_excel(uploaded_file)
-        except ValueError as e:
-            st.error(f"❌ Ошибка формата файла. Убедитесь, что файл имеет формат .xlsx или .xls: {str(e)}")
-            return None
-        except Exception as e:
-            st.error(f"❌ Не удалось прочитать Excel файл: {str(e)}")
-            return None
-
-        # Проверка на пустой файл
-        if df.empty:
-            st.error("❌ Excel файл не содержит данных")
-            return None
-
-        # Вывод информации о найденных колонках для отладки
-        st.info(f"📋 Найденные колонки: {', '.join(df.columns.tolist())}")
-
-        # Маппинг колонок (поддержка различных вариантов названий)
-        column_mapping = {
-            'Art': 'Article',
-            'art': 'Article',
-            'Артикул': 'Article',
-            'артикул': 'Article',
-            'Magazin': 'Store_ID',
-            'magazin': 'Store_ID',
-            'Магазин': 'Store_ID',
-            'магазин': 'Store_ID',
-            'Store': 'Store_ID',
-            'Describe': 'Describe',
-            'describe': 'Describe',
-            'Description': 'Describe',
-            'Описание': 'Describe',
-            'описание': 'Describe',
-            'к-во': 'Current_Stock',
-            'кво': 'Current_Stock',
-            'Количество': 'Current_Stock',
-            'количество': 'Current_Stock',
-            'Qty': 'Current_Stock',
-            'qty': 'Current_Stock',
-            'Stock': 'Current_Stock',
-            'Model': 'Model',
-            'model': 'Model',
-            'Модель': 'Model',
-            'модель': 'Model'
-        }
-
-        # Применение маппинга
-        df = df.rename(columns=column_mapping)
-
-        # Проверка обязательных колонок
-        required_cols = ['Article', 'Store_ID', 'Describe', 'Current_Stock']
-        missing_cols = [col for col in required_cols if col not in df.columns]
-
-        if missing_cols:
-            st.error(f"❌ Отсутствуют обязательные колонки: {', '.join(missing_cols)}")
-            st.info("💡 Убедитесь, что файл содержит колонки: Art, Magazin, Describe, к-во")
-            return None
-
-        # Очистка и валидация данных
-        try:
-            # Очистка Current_Stock
-            df['Current_Stock'] = pd.to_numeric(df['Current_Stock'], errors='coerce')
-
-            # Подсчет невалидных значений
-            invalid_stock_count = df['Current_Stock'].isna().sum()
-            if invalid_stock_count > 0:
-                st.warning(f"⚠️ Найдено {invalid_stock_count} невалидных значений в колонке 'к-во'. Заменены на 0")
-
-            df['Current_Stock'] = df['Current_Stock'].fillna(0)
-
-            # Проверка на отрицательные значения
-            negative_stock = (df['Current_Stock'] < 0).sum()
-            if negative_stock > 0:
-                st.warning(f"⚠️ Найдено {negative_stock} отрицательных значений остатков. Заменены на 0")
-                df['Current_Stock'] = df['Current_Stock'].clip(lower=0)
-
-            # Очистка Store_ID
-            df['Store_ID'] = df['Store_ID'].astype(str).str.strip()
-            df['Store_ID'] = df['Store_ID'].replace('nan', '')
-
-            # Удаление строк с пустым Store_ID
-            empty_store_count = (df['Store_ID'] == '').sum()
-            if empty_store_count > 0:
-                st.warning(f"⚠️ Удалено {empty_store_count} строк с пустым номером магазина")
-                df = df[df['Store_ID'] != '']
-
-            # Очистка Article
-            df['Article'] = df['Article'].astype(str).str.strip()
-            df['Article'] = df['Article'].replace('nan', '')
-
-            # Удаление строк с пустым артикулом
-            empty_article_count = (df['Article'] == '').sum()
-            if empty_article_count > 0:
-                st.warning(f"⚠️ Удалено {empty_article_count} строк с пустым артикулом")
-                df = df[df['Article'] != '']
-
-            # Очистка Describe
-            df['Describe'] = df['Describe'].astype(str).str.strip()
-            df['Describe'] = df['Describe'].replace('nan', 'Без описания')
-
-        except Exception as e:
-            st.error(f"❌ Ошибка при очистке данных: {str(e)}")
-            return None
-
-        # Финальная проверка
-        if df.empty:
-            st.error("❌ После очистки данных не осталось валидных строк")
-            return None
-
-        st.success(f"✅ Загружено {len(df)} строк из Excel файла")
-        return df
-
-    except Exception as e:
-        st.error(f"❌ Непредвиденная ошибка при загрузке Excel: {str(e)}")
-        return None
-
-
-def validate_matrix(df):
-    """Валидация торговой матрицы с улучшенной проверкой данных"""
-
-    # Создаем копию для безопасной обработки
-    df = df.copy()
-
-    required_cols = ['Article', 'Describe', 'Store_ID', 'Red_Zone', 'Yellow_Zone', 'Green_Zone']
-    missing_cols = [col for col in required_cols if col not in df.columns]
-
-    if missing_cols:
-        st.error(f"❌ В торговой матрице отсутствуют колонки: {', '.join(missing_cols)}")
-        st.info(f"💡 Доступные колонки: {', '.join(df.columns.tolist())}")
-        return None
-
-    # Проверка типов данных
-    df['Red_Zone'] = pd.to_numeric(df['Red_Zone'], errors='coerce')
-    df['Yellow_Zone'] = pd.to_numeric(df['Yellow_Zone'], errors='coerce')
-    df['Green_Zone'] = pd.to_numeric(df['Green_Zone'], errors='coerce')
-    df['Store_ID'] = df['Store_ID'].astype(str).str.strip()
-    df['Article'] = df['Article'].astype(str).str.strip()
-
-    # Подсчет невалидных значений в зонах
-    red_invalid = df['Red_Zone'].isna().sum()
-    yellow_invalid = df['Yellow_Zone'].isna().sum()
-    green_invalid = df['Green_Zone'].isna().sum()
-
-    if red_invalid > 0 or yellow_invalid > 0 or green_invalid > 0:
-        st.warning(f"⚠️ Найдены невалидные значения: Red_Zone: {red_invalid}, Yellow_Zone: {yellow_invalid}, Green_Zone: {green_invalid}")
-
-    # Замена NaN на 0 для зон
-    df['Red_Zone'] = df['Red_Zone'].fillna(0)
-    df['Yellow_Zone'] = df['Yellow_Zone'].fillna(0)
-    df['Green_Zone'] = df['Green_Zone'].fillna(0)
-
-    # Проверка на отрицательные значения
-    negative_red = (df['Red_Zone'] < 0).sum()
-    negative_yellow = (df['Yellow_Zone'] < 0).sum()
-    negative_green = (df['Green_Zone'] < 0).sum()
-
-    if negative_red > 0:
-        st.warning(f"⚠️ Найдено {negative_red} отрицательных значений в Red_Zone. Заменены на 0")
-        df['Red_Zone'] = df['Red_Zone'].clip(lower=0)
-
-    if negative_yellow > 0:
-        st.warning(f"⚠️ Найдено {negative_yellow} отрицательных значений в Yellow_Zone. Заменены на 0")
-        df['Yellow_Zone'] = df['Yellow_Zone'].clip(lower=0)
-
-    if negative_green > 0:
-        st.warning(f"⚠️ Найдено {negative_green} отрицательных значений в Green_Zone. Заменены на 0")
-        df['Green_Zone'] = df['Green_Zone'].clip(lower=0)
-
-    # Проверка на нулевые буферы (все три зоны равны 0)
-    zero_buffers = ((df['Red_Zone'] == 0) & (df['Yellow_Zone'] == 0) & (df['Green_Zone'] == 0)).sum()
-    if zero_buffers > 0:
-        st.warning(f"⚠️ Найдено {zero_buffers} позиций с нулевыми буферами (все зоны = 0)")
-
-    # Проверка на пустые значения в Article и Store_ID
-    empty_articles = df['Article'].isna().sum()
-    empty_stores = df['Store_ID'].isna().sum()
-
-    if empty_articles > 0:
-        st.warning(f"⚠️ Найдено {empty_articles} пустых артикулов")
-
-    if empty_stores > 0:
-        st.warning(f"⚠️ Найдено {empty_stores} пустых номеров магазинов")
-
-    st.success(f"✅ Торговая матрица валидирована: {len(df)} строк")
-    return df
-
-
-# ========================
-# DDMRP ЛОГИКА
-# ========================
-
-def calculate_ddmrp_status(matrix_df, stock_df):
-    """
-    Расчет статуса буферов DDMRP для каждого товара в каждом магазине с улучшенной обработкой ошибок
-    """
-    try:
-        # Проверка входных данных
-        if matrix_df is None or matrix_df.empty:
-            st.error("❌ Матрица пуста")
-            return None
-
-        if stock_df is None or stock_df.empty:
-            st.error("❌ Данные остатков пусты")
-            return None
-
-        # Подготовка данных для объединения
-        stock_cols = ['Article', 'Store_ID', 'Current_Stock']
-        if 'Model' in stock_df.columns:
-            stock_cols.append('Model')
-
-        # Объединяем матрицу и остатки
-        merged = matrix_df.merge(
-            stock_df[stock_cols],
-            on=['Article', 'Store_ID'],
-            how='left'
-        )
-
-        # Проверка результата объединения
-        if merged.empty:
-            st.error("❌ После объединения данных не осталось строк. Проверьте соответствие артикулов и магазинов")
-            return None
-
-        # Заполняем отсутствующие остатки нулями
-        merged['Current_Stock'] = pd.to_numeric(merged['Current_Stock'], errors='coerce').fillna(0)
-
-        # Убедимся, что зоны числовые и неотрицательные
-        merged['Red_Zone'] = pd.to_numeric(merged['Red_Zone'], errors='coerce').fillna(0).clip(lower=0)
-        merged['Yellow_Zone'] = pd.to_numeric(merged['Yellow_Zone'], errors='coerce').fillna(0).clip(lower=0)
-        merged['Green_Zone'] = pd.to_numeric(merged['Green_Zone'], errors='coerce').fillna(0).clip(lower=0)
-
-        # Расчет стоимости остатков (Retail_Price * Current_Stock)
-        if 'Retail_Price' in merged.columns:
-            merged['Retail_Price'] = pd.to_numeric(merged['Retail_Price'], errors='coerce').fillna(0).clip(lower=0)
-            merged['Stock_Value'] = merged['Retail_Price'] * merged['Current_Stock']
-        else:
-            merged['Stock_Value'] = 0
-
-        # Расчет Top of Green (максимальный уровень запаса)
-        # Формула: Top_of_Green = Red_Zone + Yellow_Zone + Green_Zone
-        merged['Top_of_Green'] = merged['Red_Zone'] + merged['Yellow_Zone'] + merged['Green_Zone']
-
-        # Расчет границ зон
-        merged['Red_Zone_Max'] = merged['Red_Zone']
-        merged['Yellow_Zone_Max'] = merged['Red_Zone'] + merged['Yellow_Zone']
-        merged['Green_Zone_Max'] = merged['Top_of_Green']
-
-        # Определение статуса буфера
-        def get_buffer_status(row):
-            stock = row['Current_Stock']
-            red_max = row['Red_Zone_Max']
-            yellow_max = row['Yellow_Zone_Max']
-            green_max = row['Green_Zone_Max']
-
-            # Проверка на нулевой буфер
-            if green_max == 0:
-                return 'N/A'  # Нет данных о буфере
-
-            # Определение зоны
-            if stock <= red_max:
-                return 'RED'
-            elif stock <= yellow_max:
-                return 'YELLOW'
-            elif stock <= green_max:
-                return 'GREEN'
-            else:
-                return 'EXCESS'  # Излишек
-
-        merged['Buffer_Status'] = merged.apply(get_buffer_status, axis=1)
-
-        # Расчет процента заполнения буфера (защита от деления на ноль)
-        # Формула: Buffer_Fill_Percent = (Current_Stock / Top_of_Green) * 100
-        merged['Buffer_Fill_Percent'] = np.where(
-            merged['Top_of_Green'] > 0,
-            (merged['Current_Stock'] / merged['Top_of_Green'] * 100).round(1),
-            0
-        )
-
-        # Расчет количества для заказа
-        # Формула: Order_Qty = Top_of_Green - Current_Stock (только для RED и YELLOW)
-        def calculate_order_qty(row):
-            if row['Buffer_Status'] in ['RED', 'YELLOW']:
-                # Заказываем до Top of Green
-                order_qty = row['Top_of_Green'] - row['Current_Stock']
-                return max(0, round(order_qty, 0))
-            return 0
-
-        merged['Order_Qty'] = merged.apply(calculate_order_qty, axis=1)
-
-        # Приоритет заказа (RED = 1, YELLOW = 2, GREEN = 3, EXCESS = 4, N/A = 5)
-        priority_map = {'RED': 1, 'YELLOW': 2, 'GREEN': 3, 'EXCESS': 4, 'N/A': 5}
-        merged['Priority'] = merged['Buffer_Status'].map(priority_map)
-
-        # Расчет дней до исчерпания запаса (если есть Avg_Daily_Usage)
-        if 'Avg_Daily_Usage' in merged.columns:
-            merged['Avg_Daily_Usage'] = pd.to_numeric(merged['Avg_Daily_Usage'], errors='coerce').fillna(0).clip(lower=0)
-
-            # Защита от деления на ноль
-            merged['Days_Until_Stockout'] = np.where(
-                merged['Avg_Daily_Usage'] > 0,
-                (merged['Current_Stock'] / merged['Avg_Daily_Usage']).round(1),
-                np.inf
-            )
-        else:
-            merged['Days_Until_Stockout'] = np.nan
-
-        # Финальная валидация
-        if merged.empty:
-            st.error("❌ После расчетов не осталось данных")
-            return None
-
-        st.success(f"✅ Рассчитано {len(merged)} позиций")
-        return merged
-
-    except Exception as e:
-        st.error(f"❌ Ошибка при расчете DDMRP: {str(e)}")
-        return None
-
-
-def generate_order_report(ddmrp_df):
-    """Генерация отчета по заказам"""
-    # Фильтруем только товары, требующие заказа
-    orders = ddmrp_df[ddmrp_df['Order_Qty'] > 0].copy()
-    
-    if orders.empty:
-        return pd.DataFrame()
-    
-    # Сортировка по приоритету и магазину
-    orders = orders.sort_values(['Priority', 'Store_ID', 'Article'])
-    
-    # Выбираем нужные колонки для отчета
-    report_columns = [
-        'Store_ID', 'Article', 'Describe', 'Brand', 'Model',
-        'Current_Stock', 'Stock_Value', 'Top_of_Green', 'Order_Qty', 
-        'Buffer_Status', 'Priority', 'Days_Until_Stockout'
-    ]
-    
-    # Проверяем наличие колонок
-    available_columns = [col for col in report_columns if col in orders.columns]
-    
-    return orders[available_columns].reset_index(drop=True)
-
-
-# ========================
-# ВИЗУАЛИЗАЦИЯ
-# ========================
-
-def create_buffer_status_chart(ddmrp_df):
-    """График распределения статусов буферов"""
-    status_counts = ddmrp_df['Buffer_Status'].value_counts()
-    
-    colors = {
-        'RED': '#FF4444',
-        'YELLOW': '#FFD700',
-        'GREEN': '#44FF44',
-        'EXCESS': '#4444FF'
-    }
-    
-    fig = px.pie(
-        values=status_counts.values,
-        names=status_counts.index,
-        title='Распределение статусов буферов',
-        color=status_counts.index,
-        color_discrete_map=colors
-    )
-    
-    return fig
-
-
-def create_store_summary_chart(ddmrp_df):
-    """График сводки по магазинам"""
-    store_summary = ddmrp_df.groupby(['Store_ID', 'Buffer_Status']).size().reset_index(name='Count')
-    
-    fig = px.bar(
-        store_summary,
-        x='Store_ID',
-        y='Count',
-        color='Buffer_Status',
-        title='Статусы буферов по магазинам',
-        color_discrete_map={
-            'RED': '#FF4444',
-            'YELLOW': '#FFD700',
-            'GREEN': '#44FF44',
-            'EXCESS': '#4444FF'
-        },
-        barmode='stack'
-    )
-    
-    fig.update_layout(xaxis_title='Магазин', yaxis_title='Количество товаров')
-    
-    return fig
-
-
-def create_top_orders_chart(orders_df, top_n=20):
-    """График топ товаров для заказа"""
-    if orders_df.empty:
-        return None
-    
-    top_orders = orders_df.nlargest(top_n, 'Order_Qty')
-    
-    fig = px.bar(
-        top_orders,
-        x='Order_Qty',
-        y='Describe',
-        color='Buffer_Status',
-        title=f'Топ-{top_n} товаров для заказа',
-        orientation='h',
-        color_discrete_map={
-            'RED': '#FF4444',
-            'YELLOW': '#FFD700'
-        }
-    )
-    
-    fig.update_layout(yaxis={'categoryorder': 'total ascending'})
-    
-    return fig
-
-
-# ========================
-# ЭКСПОРТ ДАННЫХ
-# ========================
-
-def create_excel_download(df, filename):
-    """Создание ссылки для скачивания Excel"""
-    if df is None or df.empty:
-        return ""
-    
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Data')
-    
-    excel_data = output.getvalue()
-    b64 = base64.b64encode(excel_data).decode()
-    href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="{filename}">📥 Скачать {filename}</a>'
-    return href
-
-
-# ========================
-# STREAMLIT ИНТЕРФЕЙС
-# ========================
-
-def main():
-    # Применение пользовательских стилей
-    apply_custom_styles()
-
-    st.title("📊 DDMRP: Система управления остатками")
-    st.markdown("**Динамическое управление буферами запасов по методологии DDMRP**")
-    st.markdown("---")
-    
-    # ========================
-    # БОКОВАЯ ПАНЕЛЬ
-    # ========================
-    st.sidebar.header("📂 Загрузка данных")
-    
-    # Google Sheets URL
-    google_sheet_url = st.sidebar.text_input(
-        "Google Sheets URL (торговая матрица):",
-        value="",
-        help="Ссылка на Google Sheets с торговой матрицей"
-    )
-    
-    # Загрузка Excel файла
-    uploaded_file = st.sidebar.file_uploader(
-        "Загрузите Excel с остатками",
-        type=['xlsx', 'xls'],
-        help="Файл с фактическими остатками по магазинам"
-    )
-    
-    # Кнопка загрузки
-    load_button = st.sidebar.button("🔄 Загрузить и рассчитать", type="primary")
-    
-    st.sidebar.markdown("---")
-    st.sidebar.markdown("### 📖 Легенда статусов")
-    st.sidebar.markdown("🔴 **RED** - Критический уровень")
-    st.sidebar.markdown("🟡 **YELLOW** - Требуется заказ")
-    st.sidebar.markdown("🟢 **GREEN** - Норма")
-    st.sidebar.markdown("🔵 **EXCESS** - Излишек")
-    
-    # ========================
-    # ЗАГРУЗКА И ОБРАБОТКА
-    # ========================
-    
-    if load_button:
-        if not google_sheet_url:
-            st.error("❌ Укажите URL Google Sheets")
-            return
-        
-        if uploaded_file is None:
-            st.error("❌ Загрузите Excel файл с остатками")
-            return
-        
-        with st.spinner("⏳ Загрузка данных..."):
-            # Загрузка торговой матрицы
-            matrix_df = download_google_sheet(google_sheet_url)
-            
-            if matrix_df is not None:
-                # Валидация и обработка торговой матрицы
-                matrix_df = validate_matrix(matrix_df)
-
-                if matrix_df is None:
-                    return
-
-                # Загрузка остатков
-                stock_df = load_stock_file(uploaded_file)
-
-                if stock_df is not None:
-                    # Расчет DDMRP
-                    with st.spinner("🔄 Расчет буферов DDMRP..."):
-                        ddmrp_df = calculate_ddmrp_status(matrix_df, stock_df)
-
-                        if ddmrp_df is None:
-                            return
-
-                        orders_df = generate_order_report(ddmrp_df)
-                    
-                    # Сохранение в session_state
-                    st.session_state['ddmrp_df'] = ddmrp_df
-                    st.session_state['orders_df'] = orders_df
-                    st.session_state['matrix_df'] = matrix_df
-                    st.session_state['stock_df'] = stock_df
-                    
-                    st.success("✅ Расчеты выполнены успешно!")
-    
-    # ========================
-    # ОТОБРАЖЕНИЕ РЕЗУЛЬТАТОВ
-    # ========================
-    
-    if 'ddmrp_df' in st.session_state:
-        ddmrp_df = st.session_state['ddmrp_df']
-        orders_df = st.session_state['orders_df']
-        
-        # ========================
-        # КЛЮЧЕВЫЕ МЕТРИКИ
-        # ========================
-        
-        col1, col2, col3, col4, col5, col6 = st.columns(6)
-        
-        with col1:
-            total_items = len(ddmrp_df)
-            st.metric("📦 Всего позиций", total_items)
-        
-        with col2:
-            red_count = len(ddmrp_df[ddmrp_df['Buffer_Status'] == 'RED'])
-            st.metric("🔴 Критичных", red_count)
-        
-        with col3:
-            yellow_count = len(ddmrp_df[ddmrp_df['Buffer_Status'] == 'YELLOW'])
-            st.metric("🟡 Требуют заказа", yellow_count)
-        
-        with col4:
-            green_count = len(ddmrp_df[ddmrp_df['Buffer_Status'] == 'GREEN'])
-            st.metric("🟢 В норме", green_count)
-        
-        with col5:
-            total_order_qty = orders_df['Order_Qty'].sum() if not orders_df.empty else 0
-            st.metric("📋 К заказу (шт)", f"{int(total_order_qty)}")
-        
-        with col6:
-            total_stock_value = ddmrp_df['Stock_Value'].sum() if 'Stock_Value' in ddmrp_df.columns else 0
-            st.metric("💰 Остатки (₴)", f"{total_stock_value:,.0f}")
-        
-        st.markdown("---")
-        
-        # ========================
-        # ВКЛАДКИ
-        # ========================
-        
-        tab1, tab2, tab3, tab4, tab5 = st.tabs([
-            "📋 Заказы",
-            "📊 Все товары",
-            "🏪 По магазинам",
-            "📈 Аналитика",
-            "⚙️ Детали расчета"
-        ])
-        
-        # ========================
-        # TAB 1: ЗАКАЗЫ
-        # ========================
-        with tab1:
-            st.subheader("📋 Список товаров для заказа")
-            
-            if not orders_df.empty:
-                # Фильтры
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    selected_stores = st.multiselect(
-                        "Фильтр по магазинам:",
-                        options=sorted(orders_df['Store_ID'].unique()),
-                        default=sorted(orders_df['Store_ID'].unique())
-                    )
-                
-                with col2:
-                    selected_status = st.multiselect(
-                        "Фильтр по статусу:",
-                        options=['RED', 'YELLOW'],
-                        default=['RED', 'YELLOW']
-                    )
-                
-                # Применение фильтров
-                filtered_orders = orders_df[
-                    (orders_df['Store_ID'].isin(selected_stores)) &
-                    (orders_df['Buffer_Status'].isin(selected_status))
-                ]
-                
-                st.dataframe(
-                    filtered_orders,
-                    use_container_width=True,
-                    hide_index=True
-                )
-                
-                # Скачивание
-                st.markdown(
-                    create_excel_download(filtered_orders, f"orders_{datetime.now().strftime('%Y%m%d')}.xlsx"),
-                    unsafe_allow_html=True
-                )
-                
-                # График топ заказов
-                st.markdown("---")
-                fig = create_top_orders_chart(filtered_orders)
-                if fig:
-                    st.plotly_chart(fig, use_container_width=True)
-                
-            else:
-                st.success("🎉 Все товары в норме! Заказов не требуется.")
-        
-        # ========================
-        # TAB 2: ВСЕ ТОВАРЫ
-        # ========================
-        with tab2:
-            st.subheader("📊 Полный список товаров и статусы буферов")
-            
-            # Фильтры
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                filter_stores = st.multiselect(
-                    "Магазины:",
-                    options=sorted(ddmrp_df['Store_ID'].unique()),
-                    default=sorted(ddmrp_df['Store_ID'].unique()),
-                    key='all_stores'
-                )
-            
-            with col2:
-                filter_status = st.multiselect(
-                    "Статус буфера:",
-                    options=['RED', 'YELLOW', 'GREEN', 'EXCESS'],
-                    default=['RED', 'YELLOW', 'GREEN', 'EXCESS'],
-                    key='all_status'
-                )
-            
-            with col3:
-                search_article = st.text_input("Поиск по артикулу/описанию:")
-            
-            # Применение фильтров
-            filtered_all = ddmrp_df[
-                (ddmrp_df['Store_ID'].isin(filter_stores)) &
-                (ddmrp_df['Buffer_Status'].isin(filter_status))
-            ]
-            
-            if search_article:
-                filtered_all = filtered_all[
-                    filtered_all['Article'].str.contains(search_article, case=False, na=False) |
-                    filtered_all['Describe'].str.contains(search_article, case=False, na=False)
-                ]
-            
-            st.dataframe(
-                filtered_all,
-                use_container_width=True,
-                hide_index=True
-            )
-            
-            st.markdown(
-                create_excel_download(filtered_all, f"all_items_{datetime.now().strftime('%Y%m%d')}.xlsx"),
-                unsafe_allow_html=True
-            )
-        
-        # ========================
-        # TAB 3: ПО МАГАЗИНАМ
-        # ========================
-        with tab3:
-            st.subheader("🏪 Анализ по магазинам")
-            
-            # Выбор магазина
-            selected_store = st.selectbox(
-                "Выберите магазин:",
-                options=sorted(ddmrp_df['Store_ID'].unique())
-            )
-            
-            store_data = ddmrp_df[ddmrp_df['Store_ID'] == selected_store]
-            
-            # Метрики магазина
-            col1, col2, col3, col4, col5 = st.columns(5)
-            
-            with col1:
-                st.metric("Всего SKU", len(store_data))
-            
-            with col2:
-                red_store = len(store_data[store_data['Buffer_Status'] == 'RED'])
-                st.metric("🔴 Критичных", red_store)
-            
-            with col3:
-                yellow_store = len(store_data[store_data['Buffer_Status'] == 'YELLOW'])
-                st.metric("🟡 Требуют заказа", yellow_store)
-            
-            with col4:
-                order_qty_store = store_data['Order_Qty'].sum()
-                st.metric("К заказу (шт)", int(order_qty_store))
-            
-            with col5:
-                store_value = store_data['Stock_Value'].sum() if 'Stock_Value' in store_data.columns else 0
-                st.metric("💰 Остатки (₴)", f"{store_value:,.0f}")
-            
-            st.markdown("---")
-            
-            # Таблица товаров магазина
-            st.dataframe(
-                store_data,
-                use_container_width=True,
-                hide_index=True
-            )
-            
-            st.markdown(
-                create_excel_download(store_data, f"store_{selected_store}_{datetime.now().strftime('%Y%m%d')}.xlsx"),
-                unsafe_allow_html=True
-            )
-        
-        # ========================
-        # TAB 4: АНАЛИТИКА
-        # ========================
-        with tab4:
-            st.subheader("📈 Аналитические графики")
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                # График распределения статусов
-                fig1 = create_buffer_status_chart(ddmrp_df)
-                st.plotly_chart(fig1, use_container_width=True)
-            
-            with col2:
-                # График по магазинам
-                fig2 = create_store_summary_chart(ddmrp_df)
-                st.plotly_chart(fig2, use_container_width=True)
-            
-            # График стоимости остатков по магазинам
-            if 'Stock_Value' in ddmrp_df.columns:
-                st.markdown("---")
-                st.subheader("💰 Стоимость остатков по магазинам")
-                
-                store_value_summary = ddmrp_df.groupby('Store_ID')['Stock_Value'].sum().reset_index()
-                store_value_summary = store_value_summary.sort_values('Stock_Value', ascending=False)
-                
-                fig_value = px.bar(
-                    store_value_summary,
-                    x='Store_ID',
-                    y='Stock_Value',
-                    title='Стоимость остатков по магазинам (₴)',
-                    labels={'Stock_Value': 'Сумма (₴)', 'Store_ID': 'Магазин'},
-                    text='Stock_Value'
-                )
-                
-                fig_value.update_traces(texttemplate='%{text:,.0f}₴', textposition='outside')
-                fig_value.update_layout(xaxis_title='Магазин', yaxis_title='Стоимость остатков (₴)')
-                
-                st.plotly_chart(fig_value, use_container_width=True)
-                
-                # Таблица с детализацией
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.dataframe(
-                        store_value_summary.style.format({'Stock_Value': '{:,.0f}₴'}),
-                        use_container_width=True,
-                        hide_index=True
-                    )
-                
-                with col2:
-                    total_value = store_value_summary['Stock_Value'].sum()
-                    st.metric("💰 Общая сумма остатков", f"{total_value:,.0f}₴")
-                    avg_value = store_value_summary['Stock_Value'].mean()
-                    st.metric("📊 Средняя сумма на магазин", f"{avg_value:,.0f}₴")
-            
-            # Дополнительная аналитика
-            if 'ABC_Class' in ddmrp_df.columns:
-                st.markdown("---")
-                st.subheader("ABC-анализ")
-                
-                abc_status = ddmrp_df.groupby(['ABC_Class', 'Buffer_Status']).size().reset_index(name='Count')
-                
-                fig3 = px.bar(
-                    abc_status,
-                    x='ABC_Class',
-                    y='Count',
-                    color='Buffer_Status',
-                    title='Статусы буферов по ABC-классам',
-                    color_discrete_map={
-                        'RED': '#FF4444',
-                        'YELLOW': '#FFD700',
-                        'GREEN': '#44FF44',
-                        'EXCESS': '#4444FF'
-                    },
-                    barmode='group'
-                )
-                
-                st.plotly_chart(fig3, use_container_width=True)
-        
-        # ========================
-        # TAB 5: ДЕТАЛИ РАСЧЕТА
-        # ========================
-        with tab5:
-            st.subheader("⚙️ Методология расчета DDMRP")
-            
-            st.markdown("""
-            ### Зоны буфера:
-            
-            - **🔴 Красная зона (Red Zone)**: Критический минимум запаса
-                - Ниже этого уровня - срочный заказ!
-                
-            - **🟡 Желтая зона (Yellow Zone)**: Зона пополнения
-                - Время сделать заказ
-                
-            - **🟢 Зеленая зона (Green Zone)**: Целевой запас
-                - Нормальный уровень запаса
-                
-            - **🔵 Излишек (Excess)**: Запас выше Top of Green
-                - Возможен избыточный запас
-            
-            ### Расчет Top of Green:
-            ```
-            Top of Green = Red Zone + Yellow Zone + Green Zone
-            ```
-            
-            ### Расчет количества для заказа:
-            ```
-            Order Qty = Top of Green - Current Stock
-            ```
-            (только для RED и YELLOW статусов)
-            
-            ### Приоритеты:
-            1. 🔴 RED - Максимальный приоритет
-            2. 🟡 YELLOW - Высокий приоритет
-            3. 🟢 GREEN - Норма (заказ не требуется)
-            4. 🔵 EXCESS - Излишек (заказ не требуется)
-            """)
-            
-            # Пример расчета
-            st.markdown("---")
-            st.subheader("📝 Пример расчета")
-            
-            example_data = {
-                'Параметр': ['Red Zone', 'Yellow Zone', 'Green Zone', 'Top of Green', 'Текущий остаток', 'Статус', 'К заказу'],
-                'Значение': ['10 шт', '20 шт', '30 шт', '60 шт', '15 шт', '🟡 YELLOW', '45 шт (60 - 15)']
-            }
-            
-            st.table(pd.DataFrame(example_data))
-    
-    else:
-        # ========================
-        # НАЧАЛЬНЫЙ ЭКРАН
-        # ========================
-        st.info("👆 Загрузите данные через боковую панель для начала работы")
-        
-        with st.expander("📖 Инструкция по использованию"):
-            st.markdown("""
-            ### Как использовать систему:
-            
-            1. **Подготовьте торговую матрицу** в Google Sheets со следующими колонками:
-               - `Article` - Артикул товара ⚠️
-               - `Describe` - Описание товара ⚠️
-               - `Store_ID` - Номер магазина (6, 9, 10...) ⚠️
-               - `Red_Zone` - Красная зона (шт) ⚠️
-               - `Yellow_Zone` - Желтая зона (шт) ⚠️
-               - `Green_Zone` - Зеленая зона (шт) ⚠️
-               - `Brand` - Бренд (опционально)
-               - `Avg_Daily_Usage` - Средний расход/день (опционально)
-               - `ABC_Class` - ABC-класс (опционально)
-               - и другие...
-            
-            2. **Подготовьте файл остатков** в Excel с колонками:
-               - `Art` → будет переименовано в `Article` ⚠️
-               - `Magazin` → будет переименовано в `Store_ID` ⚠️
-               - `Describe` - Описание ⚠️
-               - `к-во` → будет переименовано в `Current_Stock` ⚠️
-               - `Model` - Модель (опционально)
-            
-            3. **Вставьте URL** Google Sheets в боковую панель
-            
-            4. **Загрузите Excel** файл с остатками
-            
-            5. **Нажмите "Загрузить и рассчитать"**
-            
-            6. **Анализируйте результаты** во вкладках:
-               - 📋 Заказы - список товаров для заказа
-               - 📊 Все товары - полный список с буферами
-               - 🏪 По магазинам - анализ по каждому магазину
-               - 📈 Аналитика - графики и визуализация
-               - ⚙️ Детали расчета - методология DDMRP
-            
-            ### Преимущества DDMRP:
-            - ✅ Динамическое управление запасами
-            - ✅ Снижение дефицита и излишков
-            - ✅ Приоритизация заказов
-            - ✅ Визуализация статусов
-            - ✅ Автоматический расчет количества для заказа
-            """)
-        
-        with st.expander("🎯 Пример структуры данных"):
-            st.markdown("#### Торговая матрица (Google Sheets):")
-            example_matrix = pd.DataFrame({
-                'Article': ['ART001', 'ART002', 'ART003'],
-                'Describe': ['Молоко 3.2% 1л', 'Хлеб белый', 'Масло сливочное'],
-                'Store_ID': ['6', '6', '9'],
-                'Red_Zone': [10, 15, 5],
-                'Yellow_Zone': [20, 25, 10],
-                'Green_Zone': [30, 35, 15],
-                'Brand': ['Простоквашино', 'Хлебный дом', 'Вологодское']
-            })
-            st.dataframe(example_matrix, use_container_width=True)
-            
-            st.markdown("#### Остатки (Excel):")
-            example_stock = pd.DataFrame({
-                'Art': ['ART001', 'ART002', 'ART003'],
-                'Magazin': ['6', '6', '9'],
-                'Describe': ['Молоко 3.2% 1л', 'Хлеб белый', 'Масло сливочное'],
-                'к-во': [8, 45, 12],
-                'Model': ['VPL 932', 'RB 4534', 'VOL 123']
-            })
-            st.dataframe(example_stock, use_container_width=True)
-
-
-if __name__ == "__main__":
-    main()
+import streamlit as st
+import importlib
+import io
+import queue
+import asyncio
+import csv
+import bisect
+from functools import partial
+from io import BytesIO
+import base64
+from datetime import datetime, timedelta
+import time
+import os
+import hashlib
+import json
+import logging
+import math
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Журнал процесса: ошибки фоновых служб, которые не относятся к странице конкретной сессии
+LOGGER = logging.getLogger('ddmrp')
+
+# ========================
+# ОТЛОЖЕННЫЙ ИМПОРТ
+# ========================
+
+class LazyModule:
+    """Модуль, импортируемый при первом обращении к его атрибуту
+
+    Тяжелые зависимости (pandas, numpy, plotly, requests) не загружаются при импорте
+    app.py: стартовый экран и новые процессы не платят за код, который не выполняется.
+    После загрузки глобальное имя заменяется самим модулем - дальнейшие обращения
+    идут напрямую, без посредника.
+    """
+
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+            globals()[self._alias] = self._module
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = 'загружен' if self._module is not None else 'не загружен'
+        return f"<LazyModule {self._name} ({state})>"
+
+
+pd = LazyModule('pandas', 'pd')
+np = LazyModule('numpy', 'np')
+px = LazyModule('plotly.express', 'px')
+requests = LazyModule('requests', 'requests')
+
+# ========================
+# НАСТРОЙКИ СТРАНИЦЫ
+# ========================
+
+# Применяются в начале main() - импорт модуля не требует контекста Streamlit
+PAGE_CONFIG = {
+    'page_title': "DDMRP Система управления остатками",
+    'page_icon': "📊",
+    'layout': "wide"
+}
+
+# ========================
+# СТИЛИЗАЦИЯ
+# ========================
+
+# Стили приложения (добавляются в страницу один раз за сессию, см. apply_custom_styles)
+CUSTOM_CSS = """
+        /* Общие стили */
+        .main {
+            background-color: #f8f9fa;
+        }
+
+        /* Заголовки */
+        h1 {
+            color: #1e3a8a;
+            font-weight: 700;
+            padding-bottom: 10px;
+            border-bottom: 3px solid #3b82f6;
+        }
+
+        h2 {
+            color: #1e40af;
+            font-weight: 600;
+        }
+
+        h3 {
+            color: #2563eb;
+            font-weight: 500;
+        }
+
+        /* Метрики */
+        [data-testid="stMetricValue"] {
+            font-size: 28px;
+            font-weight: 700;
+        }
+
+        [data-testid="stMetricLabel"] {
+            font-size: 14px;
+            font-weight: 500;
+            color: #64748b;
+        }
+
+        /* Кнопки */
+        .stButton > button {
+            background-color: #3b82f6;
+            color: white;
+            border-radius: 8px;
+            padding: 0.5rem 2rem;
+            font-weight: 600;
+            border: none;
+            transition: all 0.3s ease;
+        }
+
+        .stButton > button:hover {
+            background-color: #2563eb;
+            box-shadow: 0 4px 6px rgba(59, 130, 246, 0.3);
+            transform: translateY(-2px);
+        }
+
+        /* Боковая панель */
+        [data-testid="stSidebar"] {
+            background-color: #f1f5f9;
+        }
+
+        [data-testid="stSidebar"] h2 {
+            color: #1e40af;
+        }
+
+        /* Таблицы */
+        .dataframe {
+            font-size: 13px;
+        }
+
+        .dataframe thead tr th {
+            background-color: #3b82f6 !important;
+            color: white !important;
+            font-weight: 600;
+            padding: 12px 8px;
+        }
+
+        .dataframe tbody tr:nth-child(even) {
+            background-color: #f8fafc;
+        }
+
+        .dataframe tbody tr:hover {
+            background-color: #e0f2fe;
+            transition: background-color 0.2s ease;
+        }
+
+        /* Вкладки */
+        .stTabs [data-baseweb="tab-list"] {
+            gap: 8px;
+            background-color: #e2e8f0;
+            padding: 8px;
+            border-radius: 8px;
+        }
+
+        .stTabs [data-baseweb="tab"] {
+            background-color: white;
+            border-radius: 6px;
+            padding: 8px 20px;
+            font-weight: 500;
+        }
+
+        .stTabs [aria-selected="true"] {
+            background-color: #3b82f6;
+            color: white;
+        }
+
+        /* Информационные блоки */
+        .stAlert {
+            border-radius: 8px;
+            padding: 1rem;
+        }
+
+        /* Карточки */
+        div[data-testid="metric-container"] {
+            background-color: white;
+            padding: 15px;
+            border-radius: 10px;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+            transition: transform 0.2s ease, box-shadow 0.2s ease;
+        }
+
+        div[data-testid="metric-container"]:hover {
+            transform: translateY(-4px);
+            box-shadow: 0 4px 12px rgba(0,0,0,0.15);
+        }
+
+        /* Статусы буферов */
+        .status-red {
+            background-color: #fee2e2;
+            color: #991b1b;
+            padding: 4px 12px;
+            border-radius: 6px;
+            font-weight: 600;
+        }
+
+        .status-yellow {
+            background-color: #fef3c7;
+            color: #92400e;
+            padding: 4px 12px;
+            border-radius: 6px;
+            font-weight: 600;
+        }
+
+        .status-green {
+            background-color: #d1fae5;
+            color: #065f46;
+            padding: 4px 12px;
+            border-radius: 6px;
+            font-weight: 600;
+        }
+
+        .status-excess {
+            background-color: #dbeafe;
+            color: #1e40af;
+            padding: 4px 12px;
+            border-radius: 6px;
+            font-weight: 600;
+        }
+
+        /* Загрузчик файлов */
+        [data-testid="stFileUploader"] {
+            background-color: white;
+            padding: 20px;
+            border-radius: 8px;
+            border: 2px dashed #cbd5e1;
+        }
+
+        /* Текстовые поля */
+        .stTextInput > div > div > input {
+            border-radius: 6px;
+            border: 2px solid #e2e8f0;
+        }
+
+        .stTextInput > div > div > input:focus {
+            border-color: #3b82f6;
+            box-shadow: 0 0 0 3px rgba(59, 130, 246, 0.1);
+        }
+
+        /* Разделитель */
+        hr {
+            margin: 2rem 0;
+            border: none;
+            border-top: 2px solid #e2e8f0;
+        }
+
+        /* Графики */
+        .js-plotly-plot {
+            border-radius: 8px;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+        }
+"""
+
+# Скрипт добавляет стили в <head> документа, если их там еще нет
+CUSTOM_STYLES_SCRIPT = f"""
+    <script>
+        if (!document.getElementById('ddmrp-styles')) {{
+            const style = document.createElement('style');
+            style.id = 'ddmrp-styles';
+            style.textContent = {json.dumps(CUSTOM_CSS)};
+            document.head.appendChild(style);
+        }}
+    </script>
+"""
+
+
+def apply_custom_styles():
+    """Применение пользовательских CSS стилей - один раз за сессию
+
+    Стили добавляются скриптом в <head> документа и остаются там при перезапусках скрипта,
+    поэтому большой статический блок не отправляется в браузер при каждом взаимодействии.
+    Перезагрузка страницы начинает новую сессию - стили добавляются снова.
+    """
+    if st.session_state.get('styles_applied'):
+        return
+
+    st.html(CUSTOM_STYLES_SCRIPT, unsafe_allow_javascript=True)
+    st.session_state['styles_applied'] = True
+
+
+def style_dataframe(df):
+    """Применение стилизации к DataFrame с цветовым кодированием статусов"""
+
+    def highlight_status(row):
+        """Раскраска строк по статусу буфера"""
+        if 'Buffer_Status' not in row.index:
+            return [''] * len(row)
+
+        status = row['Buffer_Status']
+
+        if status == 'RED':
+            return ['background-color: #fee2e2'] * len(row)
+        elif status == 'YELLOW':
+            return ['background-color: #fef3c7'] * len(row)
+        elif status == 'GREEN':
+            return ['background-color: #d1fae5'] * len(row)
+        elif status == 'EXCESS':
+            return ['background-color: #dbeafe'] * len(row)
+        else:
+            return [''] * len(row)
+
+    def color_status_cell(val):
+        """Раскраска ячеек статуса"""
+        if val == 'RED':
+            return 'background-color: #ef4444; color: white; font-weight: bold; text-align: center'
+        elif val == 'YELLOW':
+            return 'background-color: #eab308; color: white; font-weight: bold; text-align: center'
+        elif val == 'GREEN':
+            return 'background-color: #22c55e; color: white; font-weight: bold; text-align: center'
+        elif val == 'EXCESS':
+            return 'background-color: #3b82f6; color: white; font-weight: bold; text-align: center'
+        return ''
+
+    def color_priority(val):
+        """Раскраска приоритета"""
+        if val == 1:
+            return 'background-color: #dc2626; color: white; font-weight: bold; text-align: center'
+        elif val == 2:
+            return 'background-color: #f59e0b; color: white; font-weight: bold; text-align: center'
+        elif val == 3:
+            return 'background-color: #16a34a; color: white; font-weight: bold; text-align: center'
+        elif val == 4:
+            return 'background-color: #2563eb; color: white; font-weight: bold; text-align: center'
+        return ''
+
+    # Применяем стили
+    styled_df = df.style
+
+    # Если есть колонка Buffer_Status, раскрашиваем её
+    if 'Buffer_Status' in df.columns:
+        styled_df = styled_df.applymap(color_status_cell, subset=['Buffer_Status'])
+
+    # Если есть колонка Priority, раскрашиваем её
+    if 'Priority' in df.columns:
+        styled_df = styled_df.applymap(color_priority, subset=['Priority'])
+
+    # Форматирование числовых колонок
+    format_dict = {}
+
+    if 'Current_Stock' in df.columns:
+        format_dict['Current_Stock'] = '{:.0f}'
+
+    if 'Order_Qty' in df.columns:
+        format_dict['Order_Qty'] = '{:.0f}'
+
+    if 'Stock_Value' in df.columns:
+        format_dict['Stock_Value'] = '{:,.2f}₴'
+
+    if 'Buffer_Fill_Percent' in df.columns:
+        format_dict['Buffer_Fill_Percent'] = '{:.1f}%'
+
+    if 'Days_Until_Stockout' in df.columns:
+        format_dict['Days_Until_Stockout'] = '{:.1f}'
+
+    if format_dict:
+        styled_df = styled_df.format(format_dict, na_rep='-')
+
+    return styled_df
+
+
+# ========================
+# СООБЩЕНИЯ
+# ========================
+
+@st.cache_resource
+def get_message_sink():
+    """Перехваченные сообщения потоков процесса (одно хранилище на процесс)
+
+    app.py выполняется заново при каждом перезапуске страницы, а пул заданий создается один раз:
+    модульная переменная была бы своей в каждом прогоне, и notify() задания, поставленного
+    в более позднем прогоне, писал бы мимо capture_messages пула
+    """
+    return threading.local()
+
+
+def notify(level, message):
+    """Вывод сообщения (error/warning/info/success)
+
+    В фоновом задании сообщения накапливаются и показываются в интерфейсе после его завершения
+    """
+    messages = getattr(get_message_sink(), 'messages', None)
+
+    if messages is not None:
+        messages.append((level, message))
+    else:
+        getattr(st, level)(message)
+
+
+@contextmanager
+def capture_messages(messages):
+    """Перехват notify() текущего потока в список messages"""
+    sink = get_message_sink()
+    previous = getattr(sink, 'messages', None)
+    sink.messages = messages
+    try:
+        yield messages
+    finally:
+        sink.messages = previous
+
+
+def render_messages(messages):
+    """Показ накопленных сообщений"""
+    for level, message in messages:
+        getattr(st, level)(message)
+
+
+# ========================
+# МЕТРИКИ (PROMETHEUS)
+# ========================
+
+# Адрес эндпоинта /metrics (сервис не запускается, если порт не задан)
+METRICS_HOST = os.environ.get('DDMRP_METRICS_HOST', '127.0.0.1')
+METRICS_PORT = os.environ.get('DDMRP_METRICS_PORT', '')
+
+# Границы корзин гистограмм длительности (сек): от отрисовки выгрузки до утренней загрузки
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+PROMETHEUS_MIME = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _label_value(value):
+    """Экранирование значения метки в текстовом формате Prometheus"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_label_value(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    """Метрика с метками: значение на каждый набор меток
+
+    Запись - одна операция со словарем под блокировкой метрики (микросекунды),
+    текстовое представление строится только при запросе /metrics.
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        """Строки значений: (суффикс имени, метки, значение)"""
+        with self._lock:
+            return [('', key, value) for key, value in sorted(self._values.items())]
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        for suffix, key, value, *extra in self._samples():
+            labels = _format_labels(self.labelnames, key, extra[0] if extra else ())
+            lines.append(f"{self.name}{suffix}{labels} {float(value)!r}")
+
+
+class Counter(Metric):
+    """Монотонный счетчик"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными корзинами (счетчики корзин, сумма и число наблюдений)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Замер длительности блока with"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        with self._lock:
+            states = [(key, list(counts), total) for key, (counts, total) in sorted(self._values.items())]
+
+        samples = []
+        for key, counts, total in states:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else f"{bound:g}"
+                samples.append(('_bucket', key, cumulative, [('le', le)]))
+            samples.append(('_sum', key, total))
+            samples.append(('_count', key, cumulative))
+        return samples
+
+
+class Gauge(Metric):
+    """Текущее значение, снимаемое функцией в момент запроса метрик (без работы на горячем пути)
+
+    func возвращает число или словарь {кортеж значений меток: число}
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, func, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.func = func
+
+    def _samples(self):
+        value = self.func()
+        if isinstance(value, dict):
+            return [('', tuple(str(part) for part in key), item) for key, item in sorted(value.items())]
+        return [('', (), value)]
+
+
+class MetricsRegistry:
+    """Метрики процесса и их выдача в текстовом формате Prometheus
+
+    Повторная регистрация имени (app.py выполняется заново при каждом перезапуске страницы)
+    возвращает уже созданную метрику: значения накапливаются в одном объекте. У показателя
+    (gauge) обновляется только функция снятия значения.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is None:
+                self._metrics[metric.name] = metric
+                return metric
+
+        if isinstance(metric, Gauge):
+            existing.func = metric.func
+        return existing
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, func, labelnames=()):
+        return self._register(Gauge(name, help_text, func, labelnames))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        for metric in metrics:
+            try:
+                metric.render(lines)
+            except Exception:
+                # Ошибка снятия одного показателя не должна ломать выдачу остальных
+                continue
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+@st.cache_resource
+def get_metrics_registry():
+    """Единый реестр метрик процесса (его же отдает эндпоинт /metrics)"""
+    return MetricsRegistry()
+
+
+METRICS = get_metrics_registry()
+
+STAGE_DURATION = METRICS.histogram(
+    'ddmrp_stage_duration_seconds', "Длительность этапов конвейера и выгрузки", ['stage']
+)
+PIPELINE_DURATION = METRICS.histogram(
+    'ddmrp_pipeline_duration_seconds', "Длительность заданий расчета по итогу (с ожиданием в очереди)", ['status']
+)
+PIPELINE_RUNS = METRICS.counter(
+    'ddmrp_pipeline_runs_total', "Завершенные задания расчета по итогу", ['status']
+)
+DOWNLOAD_REQUESTS = METRICS.counter(
+    'ddmrp_download_requests_total', "Запросы к Google Sheets по HTTP-статусу или ошибке", ['status']
+)
+DOWNLOAD_RETRIES = METRICS.counter(
+    'ddmrp_download_retries_total', "Повторные попытки загрузки по HTTP-статусу или ошибке", ['status']
+)
+CACHE_REQUESTS = METRICS.counter(
+    'ddmrp_cache_requests_total', "Обращения к кэшам (hit - готовый результат, miss - расчет)", ['cache', 'result']
+)
+ROWS_PROCESSED = METRICS.counter(
+    'ddmrp_rows_processed_total', "Обработанные строки по источнику", ['source']
+)
+
+
+# ========================
+# ОПТИМИЗАЦИЯ ТИПОВ ДАННЫХ
+# ========================
+
+# Колонки-количества, которые хранятся в компактных типах
+QUANTITY_COLUMNS = ['Red_Zone', 'Yellow_Zone', 'Green_Zone', 'Current_Stock',
+                    'Avg_Daily_Usage', 'Top_of_Green', 'Order_Qty']
+
+BUFFER_STATUSES = ['RED', 'YELLOW', 'GREEN', 'EXCESS', 'N/A']
+
+
+def downcast_quantity(values):
+    """Сжатие количества до минимального целого типа или float32 без потери точности"""
+    values = np.asarray(values, dtype=np.float64)
+
+    if values.size == 0:
+        return values.astype(np.int8)
+
+    finite = np.isfinite(values)
+
+    # Целые значения -> минимальный знаковый целый тип
+    if finite.all() and np.array_equal(values, np.round(values)):
+        low, high = values.min(), values.max()
+        for int_type in (np.int8, np.int16, np.int32):
+            info = np.iinfo(int_type)
+            if info.min <= low and high <= info.max:
+                return values.astype(int_type)
+        return values.astype(np.int64)
+
+    # Дробные значения -> float32, только если значения представимы точно
+    as_float32 = values.astype(np.float32)
+    if np.array_equal(as_float32.astype(np.float64), values, equal_nan=True):
+        return as_float32
+
+    return values
+
+
+def check_quantity(series, downcast=True):
+    """Один проход по колонке-количеству: маски нарушений и очищенная серия
+
+    Возвращает (очищенная серия, маска невалидных, маска отрицательных)
+    """
+    numeric = pd.to_numeric(series, errors='coerce')
+    values = numeric.to_numpy(dtype=np.float64, na_value=np.nan)
+
+    invalid_mask = np.isnan(values)
+    negative_mask = values < 0
+
+    if invalid_mask.any() or negative_mask.any():
+        values = np.where(invalid_mask | negative_mask, 0.0, values)
+
+    cleaned = pd.Series(downcast_quantity(values) if downcast else values, index=series.index, name=series.name)
+    return cleaned, invalid_mask, negative_mask
+
+
+def clean_quantity(series):
+    """Однократная очистка количества: число, NaN -> 0, отрицательные -> 0, компактный тип
+
+    Возвращает (очищенная серия, кол-во невалидных, кол-во отрицательных)
+    """
+    cleaned, invalid_mask, negative_mask = check_quantity(series)
+    return cleaned, int(np.count_nonzero(invalid_mask)), int(np.count_nonzero(negative_mask))
+
+
+def is_clean_quantity(series):
+    """Проверка, что колонка уже очищена (числовая, без NaN и отрицательных значений)"""
+    if not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return False
+
+    if len(series) == 0:
+        return True
+
+    if series.hasnans:
+        return False
+
+    return series.min() >= 0
+
+
+def ensure_quantity(series):
+    """Очистка количества только если колонка еще не была провалидирована"""
+    if is_clean_quantity(series):
+        return series
+
+    cleaned, _, _ = clean_quantity(series)
+    return cleaned
+
+
+def dataset_memory_bytes(*frames):
+    """Суммарный объем памяти наборов данных (с учетом строк)"""
+    total = 0
+    for frame in frames:
+        if isinstance(frame, pd.DataFrame):
+            total += int(frame.memory_usage(index=True, deep=True).sum())
+        elif frame is not None and hasattr(frame, 'nbytes'):
+            total += int(frame.nbytes)
+    return total
+
+
+def zone_boundaries(ddmrp_df):
+    """Границы зон буфера, вычисляемые по запросу (не хранятся в наборе данных)
+
+    Red_Zone_Max = Red_Zone, Yellow_Zone_Max = Red_Zone + Yellow_Zone, Green_Zone_Max = Top_of_Green
+    """
+    red = ddmrp_df['Red_Zone'].to_numpy(dtype=np.float64)
+    yellow_max = red + ddmrp_df['Yellow_Zone'].to_numpy(dtype=np.float64)
+
+    if 'Top_of_Green' in ddmrp_df.columns:
+        green_max = ddmrp_df['Top_of_Green'].to_numpy(dtype=np.float64)
+    else:
+        green_max = yellow_max + ddmrp_df['Green_Zone'].to_numpy(dtype=np.float64)
+
+    return pd.DataFrame({
+        'Red_Zone_Max': downcast_quantity(red),
+        'Yellow_Zone_Max': downcast_quantity(yellow_max),
+        'Green_Zone_Max': downcast_quantity(green_max)
+    }, index=ddmrp_df.index)
+
+
+def with_zone_boundaries(ddmrp_df):
+    """Срез набора с границами зон после Top_of_Green - для таблиц и выгрузок (без изменения набора)"""
+    boundaries = zone_boundaries(ddmrp_df)
+    position = ddmrp_df.columns.get_loc('Top_of_Green') + 1
+    return pd.concat([ddmrp_df.iloc[:, :position], boundaries, ddmrp_df.iloc[:, position:]], axis=1)
+
+
+# ========================
+# ВАЛИДАЦИЯ ДАННЫХ
+# ========================
+
+# Правило -> (уровень, описание, действие по умолчанию)
+VALIDATION_RULES = {
+    'missing_column': ('error', "отсутствует обязательная колонка", "загрузка прервана"),
+    'invalid_number': ('warning', "невалидные числа", "заменены на 0"),
+    'negative': ('warning', "отрицательные значения", "заменены на 0"),
+    'empty_key': ('warning', "пустые значения", "оставлены"),
+    'empty_text': ('info', "пустые описания", "заменены на 'Без описания'"),
+    'zero_buffer': ('warning', "нулевые буферы (все зоны = 0)", "оставлены"),
+    'duplicate_key': ('warning', "повторяющиеся ключи (Article, Store_ID)", "оставлена последняя строка")
+}
+
+# Сколько номеров строк-примеров сохраняется по каждому нарушению
+VALIDATION_SAMPLE_ROWS = 5
+
+# Номер строки в файле = позиция + 2 (строка заголовка и нумерация с 1)
+VALIDATION_ROW_OFFSET = 2
+
+VALIDATION_ICONS = {'error': "❌", 'warning': "⚠️", 'info': "ℹ️"}
+
+# Схемы колонок: колонка -> (вид значений, альтернативные названия в файле). По схеме файл
+# читается (числовые виды - числами, остальные - строками) и проверяется (validate_columns):
+# key - ключ без пробелов по краям, text - описание (пустое -> 'Без описания'),
+# label - текст без проверки, quantity и price - неотрицательные числа.
+# Названия сравниваются без учета регистра и пробелов по краям; колонки вне схемы не читаются
+NUMERIC_KINDS = ('quantity', 'price')
+
+MATRIX_COLUMNS = {
+    'Article': ('key', ['Артикул']),
+    'Describe': ('label', ['Description', 'Описание']),
+    'Store_ID': ('key', ['Magazin', 'Магазин']),
+    'Red_Zone': ('quantity', ['RedZone']),
+    'Yellow_Zone': ('quantity', ['YellowZone']),
+    'Green_Zone': ('quantity', ['GreenZone']),
+    'Brand': ('label', ['Бренд']),
+    'Retail_Price': ('price', ['Price', 'Цена']),
+    'Avg_Daily_Usage': ('quantity', []),
+    'ABC_Class': ('label', ['ABC']),
+    'Model': ('label', ['Модель']),
+    'Segment': ('label', ['Category', 'Сегмент', 'Категорія']),
+    'Pack_Size': ('quantity', ['Pack', 'Кратность']),
+    'MOQ': ('quantity', ['Min_Order_Qty', 'Мин_партия'])
+}
+
+# Схема файла остатков (Excel, CSV, Parquet, Feather)
+STOCK_COLUMNS = {
+    'Article': ('key', ['Art', 'Артикул']),
+    'Store_ID': ('key', ['Magazin', 'Магазин', 'Store']),
+    'Describe': ('text', ['Description', 'Описание']),
+    'Current_Stock': ('quantity', ['к-во', 'кво', 'Количество', 'Qty', 'Stock']),
+    'Model': ('label', ['Модель'])
+}
+
+
+class ValidationReport:
+    """Структурированный отчет валидации: правило, колонка, число строк и примеры строк
+
+    Отчет можно вывести в интерфейс (notify), выгрузить (to_frame) или проверить в тестах (count).
+    """
+
+    COLUMNS = ['Source', 'Rule', 'Column', 'Level', 'Count', 'Sample_Rows', 'Action']
+
+    def __init__(self):
+        self.issues = []
+
+    def __len__(self):
+        return len(self.issues)
+
+    def __iter__(self):
+        return iter(self.issues)
+
+    def add(self, source, rule, column, mask, action=None, row_labels=None):
+        """Добавление нарушения по булевой маске строк; пустая маска нарушением не считается
+
+        row_labels - исходные позиции строк, если часть строк уже удалена (например, df.index)
+        """
+        positions = np.flatnonzero(mask)
+
+        if len(positions) == 0:
+            return None
+
+        sample = positions[:VALIDATION_SAMPLE_ROWS]
+        if row_labels is not None:
+            sample = np.asarray(row_labels)[sample]
+
+        return self.add_rows(source, rule, column, len(positions), sample, action)
+
+    def add_rows(self, source, rule, column, count, sample_positions, action=None):
+        """Добавление нарушения по готовому счетчику и позициям строк-примеров (например, из SQL)"""
+        level, _, default_action = VALIDATION_RULES[rule]
+
+        if count == 0:
+            return None
+
+        issue = {
+            'Source': source,
+            'Rule': rule,
+            'Column': column,
+            'Level': level,
+            'Count': int(count),
+            'Sample_Rows': [int(position) + VALIDATION_ROW_OFFSET for position in sample_positions],
+            'Action': action or default_action
+        }
+        self.issues.append(issue)
+        return issue
+
+    def merge(self, other, row_offset=0):
+        """Добавление нарушений отчета по порции строк; row_offset - позиция порции в файле"""
+        for issue in other.issues:
+            shifted = [row + row_offset for row in issue['Sample_Rows']]
+            existing = next((
+                current for current in self.issues
+                if (current['Source'], current['Rule'], current['Column']) == (issue['Source'], issue['Rule'], issue['Column'])
+            ), None)
+
+            if existing is None:
+                self.issues.append(dict(issue, Sample_Rows=shifted))
+            elif issue['Rule'] != 'missing_column':
+                existing['Count'] += issue['Count']
+                existing['Sample_Rows'] = (existing['Sample_Rows'] + shifted)[:VALIDATION_SAMPLE_ROWS]
+
+    def add_missing_columns(self, source, columns, n_rows):
+        """Отсутствующие обязательные колонки (нарушение на все строки)"""
+        level, _, action = VALIDATION_RULES['missing_column']
+        for column in columns:
+            self.issues.append({
+                'Source': source, 'Rule': 'missing_column', 'Column': column, 'Level': level,
+                'Count': n_rows, 'Sample_Rows': [], 'Action': action
+            })
+
+    def count(self, rule=None, column=None, source=None):
+        """Суммарное число строк с нарушениями (с отбором по правилу, колонке, источнику)"""
+        return sum(
+            issue['Count'] for issue in self.issues
+            if (rule is None or issue['Rule'] == rule)
+            and (column is None or issue['Column'] == column)
+            and (source is None or issue['Source'] == source)
+        )
+
+    @property
+    def has_errors(self):
+        return any(issue['Level'] == 'error' for issue in self.issues)
+
+    def to_frame(self):
+        """Отчет в виде таблицы (номера строк - строкой, для выгрузки)"""
+        frame = pd.DataFrame(self.issues, columns=self.COLUMNS)
+        frame['Sample_Rows'] = frame['Sample_Rows'].map(lambda rows: ', '.join(map(str, rows)))
+        return frame
+
+    @staticmethod
+    def format_issue(issue):
+        _, description, _ = VALIDATION_RULES[issue['Rule']]
+        message = (
+            f"{VALIDATION_ICONS[issue['Level']]} {issue['Source']}, {issue['Column']}: "
+            f"{description} - {issue['Count']} шт., {issue['Action']}"
+        )
+        if issue['Sample_Rows']:
+            more = "…" if issue['Count'] > len(issue['Sample_Rows']) else ""
+            message += f" (строки: {', '.join(map(str, issue['Sample_Rows']))}{more})"
+        return message
+
+    def notify(self, issues=None):
+        """Вывод нарушений через notify (по умолчанию - всех)"""
+        for issue in self.issues if issues is None else issues:
+            notify(issue['Level'], self.format_issue(issue))
+
+
+# Текстовые представления пустой ячейки после приведения к строке
+EMPTY_KEY_VALUES = ['', 'nan', 'None']
+
+
+def _check_key(series):
+    """Ключевая колонка: строка без пробелов по краям; пустые значения -> ''
+
+    Пропуски отмечаются до приведения к строке (в старых версиях pandas None -> 'None'),
+    строки из одних пробелов после strip() становятся пустыми
+    """
+    missing = series.isna().to_numpy(dtype=bool)
+    values = series.astype(str).str.strip()
+    empty_mask = missing | values.isin(EMPTY_KEY_VALUES).to_numpy(dtype=bool)
+
+    if empty_mask.any():
+        values = values.where(~empty_mask, '')
+
+    return values, empty_mask
+
+
+def _check_text(series):
+    """Текстовая колонка: пустые значения -> 'Без описания'"""
+    values, empty_mask = _check_key(series)
+
+    if empty_mask.any():
+        values = values.where(~empty_mask, 'Без описания')
+
+    return values, empty_mask
+
+
+def validate_columns(df, schema, source, report, drop_empty_keys=False):
+    """Проверка всех правил колонка за колонкой: каждая колонка читается и очищается один раз
+
+    Очищенные колонки записываются в df на месте. Возвращает маску строк с пустыми ключами
+    (если drop_empty_keys - строки удаляются вызывающим кодом одним отбором).
+    """
+    drop_mask = np.zeros(len(df), dtype=bool)
+    key_action = "строки удалены" if drop_empty_keys else None
+
+    for column, (kind, _) in schema.items():
+        if kind == 'label' or column not in df.columns:
+            continue
+
+        if kind == 'key':
+            df[column], empty_mask = _check_key(df[column])
+            report.add(source, 'empty_key', column, empty_mask, action=key_action)
+            drop_mask |= empty_mask
+
+        elif kind == 'text':
+            df[column], empty_mask = _check_text(df[column])
+            report.add(source, 'empty_text', column, empty_mask)
+
+        else:
+            df[column], invalid_mask, negative_mask = check_quantity(df[column], downcast=(kind == 'quantity'))
+            report.add(source, 'invalid_number', column, invalid_mask)
+            report.add(source, 'negative', column, negative_mask)
+
+    return drop_mask
+
+
+# Ключ позиции: одна строка матрицы и остатков на пару (Article, Store_ID)
+KEY_COLUMNS = ['Article', 'Store_ID']
+
+# Политика для повторяющихся строк остатков: sum - суммировать, latest - последняя строка файла
+DUPLICATE_POLICIES = ['sum', 'latest']
+STOCK_DUPLICATE_POLICY = os.environ.get('DDMRP_DUPLICATE_POLICY', 'sum')
+
+
+def consolidate_duplicates(df, source, report=None, policy='latest', sum_columns=()):
+    """Схлопывание повторяющихся ключей (Article, Store_ID) до одной строки на ключ
+
+    Дубликаты ищутся хэш-группировкой по ключу. policy='latest' оставляет последнюю строку,
+    policy='sum' - первую строку ключа с суммой sum_columns по всем его строкам.
+    Без дубликатов исходный DataFrame возвращается без копирования.
+    """
+    if policy not in DUPLICATE_POLICIES:
+        raise ValueError(f"Неизвестная политика дубликатов: {policy}")
+
+    if report is None:
+        report = ValidationReport()
+
+    collapsed = df.duplicated(KEY_COLUMNS, keep='last' if policy == 'latest' else 'first').to_numpy()
+
+    if not collapsed.any():
+        return df
+
+    # Номера строк в файле - по исходным позициям, даже если часть строк уже удалена
+    row_labels = df.index.to_numpy() if pd.api.types.is_integer_dtype(df.index) else None
+    action = "остатки суммированы в первую строку ключа" if policy == 'sum' else None
+    issue = report.add(source, 'duplicate_key', '+'.join(KEY_COLUMNS), collapsed, action=action, row_labels=row_labels)
+    report.notify([issue])
+
+    result = df[~collapsed]
+
+    if policy == 'sum' and sum_columns:
+        # groupby(sort=False) нумерует группы в порядке первого появления - как и строки result
+        totals = df.groupby(KEY_COLUMNS, sort=False, dropna=False)[list(sum_columns)].sum()
+        result = result.assign(**{
+            column: downcast_quantity(totals[column].to_numpy(dtype=np.float64)) for column in sum_columns
+        })
+
+    return result
+
+
+# ========================
+# ФУНКЦИИ ЗАГРУЗКИ ДАННЫХ
+# ========================
+
+def schema_header_aliases(schema):
+    """Название колонки в файле (casefold) -> колонка схемы"""
+    return {
+        alias.casefold(): column
+        for column, (_, aliases) in schema.items()
+        for alias in [column] + aliases
+    }
+
+
+MATRIX_HEADER_ALIASES = schema_header_aliases(MATRIX_COLUMNS)
+STOCK_HEADER_ALIASES = schema_header_aliases(STOCK_COLUMNS)
+
+
+def validate_sheet_url(sheet_url):
+    """Проверка URL Google Sheets"""
+    if not sheet_url or not isinstance(sheet_url, str):
+        notify('error', "❌ Некорректный URL Google Sheets")
+        return False
+
+    if 'docs.google.com/spreadsheets' not in sheet_url:
+        notify('error', "❌ URL должен вести на Google Sheets (docs.google.com/spreadsheets)")
+        return False
+
+    return True
+
+
+def sheet_csv_url(sheet_url):
+    """Преобразование URL в формат экспорта CSV"""
+    if '/edit' in sheet_url:
+        csv_url = sheet_url.replace('/edit?gid=', '/export?format=csv&gid=')
+        csv_url = csv_url.replace('/edit#gid=', '/export?format=csv&gid=')
+        csv_url = csv_url.replace('/edit', '/export?format=csv')
+        return csv_url.split('#')[0]
+
+    return sheet_url
+
+
+def resolve_header(names, aliases=MATRIX_HEADER_ALIASES):
+    """Колонки файла -> колонки схемы: {позиция в файле: колонка схемы}
+
+    Если несколько колонок файла соответствуют одной колонке схемы, используется точное
+    название колонки, иначе - первое альтернативное
+    """
+    claimed = {}
+    for position, name in enumerate(names):
+        alias = str(name).strip().casefold()
+        column = aliases.get(alias)
+        if column is None:
+            continue
+
+        exact = alias == column.casefold()
+        current = claimed.get(column)
+        if current is None or (exact and not current[1]):
+            claimed[column] = (position, exact)
+
+    return {position: column for column, (position, _) in sorted(claimed.items(), key=lambda item: item[1][0])}
+
+
+def normalize_matrix_columns(df):
+    """Названия колонок матрицы: без пробелов по краям, альтернативные названия - по схеме"""
+    df.columns = df.columns.str.strip()
+    resolved = resolve_header(df.columns)
+    return df.rename(columns={df.columns[position]: column for position, column in resolved.items()})
+
+
+def prepare_matrix_frame(df):
+    """Проверка прочитанной матрицы и приведение названий колонок"""
+
+    # Проверка на пустой DataFrame
+    if df.empty:
+        notify('error', "❌ Google Sheets не содержит данных")
+        return None
+
+    # Проверка на минимальное количество строк
+    if len(df) < 1:
+        notify('error', "❌ Google Sheets содержит недостаточно данных")
+        return None
+
+    # Вывод информации о найденных колонках для отладки
+    notify('info', f"📋 Найденные колонки в Google Sheets: {', '.join(df.columns.str.strip().tolist())}")
+
+    skipped_columns = df.attrs.get('skipped_columns')
+    if skipped_columns:
+        notify('info', f"ℹ️ Колонки вне схемы матрицы не загружаются: {', '.join(skipped_columns)}")
+
+    # Очистка названий колонок от пробелов и применение маппинга
+    df = normalize_matrix_columns(df)
+
+    notify('success', f"✅ Загружено {len(df)} строк из Google Sheets")
+    return df
+
+
+# Размер порции потоковой загрузки и число строк в порции разбора CSV
+DOWNLOAD_CHUNK_BYTES = 256 * 1024
+CSV_CHUNK_ROWS = 50_000
+
+# Сколько порций загрузки может ждать парсер (8 МБ): дальше загрузка ждет разбора
+STREAM_PIPE_CHUNKS = 32
+
+# Парсер CSV (матрица, остатки): pyarrow (многопоточный, типы по схеме) или pandas; без pyarrow - pandas
+CSV_ENGINE = os.environ.get('DDMRP_CSV_ENGINE', 'pyarrow')
+
+# Размер блока разбора pyarrow (байт): блок - одна порция строк
+CSV_BLOCK_BYTES = 4 * 1024 * 1024
+
+# Допустимые разделители CSV (определяются по заголовку)
+CSV_DELIMITERS = [',', ';', '\t']
+
+
+class StreamPipe(io.RawIOBase):
+    """Канал байтов между загрузкой (пишет порции) и парсером CSV (читает в другом потоке)
+
+    Очередь ограничена max_chunks порциями: при быстрой сети и медленном разборе загрузка
+    ждет парсер, а не накапливает весь файл в памяти. Ожидание прекращается, если читатель
+    закрыл канал (разбор завершился или упал) - feed тогда возвращает False
+    """
+
+    def __init__(self, max_chunks=STREAM_PIPE_CHUNKS):
+        super().__init__()
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self._buffer = memoryview(b'')
+        self._eof = False
+        self._reader_closed = threading.Event()
+
+    def readable(self):
+        return True
+
+    def close(self):
+        self._reader_closed.set()
+        super().close()
+
+    def _put(self, item):
+        while not self._reader_closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def feed(self, data):
+        return self._put(data)
+
+    def finish(self):
+        self._put(None)
+
+    def abort(self, exc):
+        # Непрочитанные порции больше не нужны: освобождаем место под ошибку
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self._put(exc)
+
+    def readinto(self, target):
+        while not self._buffer:
+            if self._eof:
+                return 0
+
+            item = self._queue.get()
+            if item is None:
+                self._eof = True
+                return 0
+            if isinstance(item, BaseException):
+                self._eof = True
+                raise item
+
+            self._buffer = memoryview(item)
+
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def sniff_csv_header(line):
+    """Заголовок CSV: (названия колонок, разделитель, кодировка)
+
+    Выгрузки учетных систем бывают с разделителем ';' или табуляцией и в кодировке cp1251:
+    разделитель - самый частый из CSV_DELIMITERS в заголовке, кодировка - utf-8, если заголовок
+    в ней читается, иначе cp1251
+    """
+    try:
+        text, encoding = line.decode('utf-8-sig'), 'utf-8'
+    except UnicodeDecodeError:
+        text, encoding = line.decode('cp1251'), 'cp1251'
+
+    text = text.rstrip('\r\n')
+    delimiter = max(CSV_DELIMITERS, key=text.count)
+    if not text.count(delimiter):
+        delimiter = ','
+
+    return next(csv.reader([text], delimiter=delimiter)), delimiter, encoding
+
+
+def _arrow_csv_chunks(stream, column_names, columns, schema, delimiter, encoding):
+    """Порции CSV через pyarrow: только колонки схемы, текст - строками, числа - float64"""
+    pa = importlib.import_module('pyarrow')
+    pa_csv = importlib.import_module('pyarrow.csv')
+    pa_compute = importlib.import_module('pyarrow.compute')
+
+    reader = pa_csv.open_csv(
+        stream,
+        read_options=pa_csv.ReadOptions(
+            column_names=column_names, block_size=CSV_BLOCK_BYTES, encoding=encoding
+        ),
+        parse_options=pa_csv.ParseOptions(delimiter=delimiter, newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=columns,
+            column_types={column: pa.string() for column in columns},
+            strings_can_be_null=True
+        )
+    )
+
+    for batch in reader:
+        arrays = []
+        for column, array in zip(batch.schema.names, batch.columns):
+            if schema[column][0] in NUMERIC_KINDS:
+                try:
+                    array = pa_compute.cast(array, pa.float64())
+                except pa.ArrowInvalid:
+                    # Нечисловые значения: порция остается строковой, их отметит валидация
+                    pass
+            arrays.append(array)
+
+        yield pa.RecordBatch.from_arrays(arrays, names=batch.schema.names).to_pandas()
+
+
+def _pandas_csv_chunks(stream, column_names, columns, schema, delimiter, encoding):
+    """Порции CSV через pandas: только колонки схемы, текст - строками без угадывания типа"""
+    text_columns = {column: str for column in columns if schema[column][0] not in NUMERIC_KINDS}
+
+    with pd.read_csv(
+        stream, header=None, names=column_names, usecols=columns, dtype=text_columns,
+        sep=delimiter, encoding=encoding, chunksize=CSV_CHUNK_ROWS
+    ) as reader:
+        yield from reader
+
+
+def read_schema_csv(stream, schema, aliases, on_rows=None, collect=True):
+    """Чтение CSV по схеме колонок (MATRIX_COLUMNS, STOCK_COLUMNS)
+
+    Заголовок разбирается первым: альтернативные названия приводятся к колонкам схемы,
+    остальные колонки файла не читаются (их список - в df.attrs['skipped_columns']).
+    Текстовые колонки, включая ключи, читаются строками, числовые - float64; порция
+    с нечисловыми значениями остается строковой, и валидация отмечает их как невалидные.
+    on_rows(chunk_df) вызывается для каждой порции (False - чтение прекращается);
+    collect=False - порции не накапливаются, возвращаются только колонки без строк
+    """
+    header_line = stream.readline()
+    if not header_line.strip():
+        return pd.DataFrame()
+
+    names, delimiter, encoding = sniff_csv_header(header_line)
+    resolved = resolve_header(names, aliases)
+    columns = list(resolved.values())
+
+    # Имена колонок для парсера: колонки схемы и уникальные заглушки для пропускаемых
+    column_names = [resolved.get(position, f"__skipped_{position}") for position in range(len(names))]
+    skipped_columns = [name.strip() for position, name in enumerate(names) if position not in resolved]
+
+    read_chunks = _pandas_csv_chunks
+    if CSV_ENGINE == 'pyarrow':
+        try:
+            importlib.import_module('pyarrow.csv')
+            read_chunks = _arrow_csv_chunks
+        except ImportError:
+            pass
+
+    collected = []
+    header = None
+
+    # Ни одной колонки схемы: строки не читаются, отсутствующие колонки отметит проверка
+    chunks = read_chunks(stream, column_names, columns, schema, delimiter, encoding) if columns else []
+
+    for chunk in chunks:
+        if collect:
+            collected.append(chunk)
+        elif header is None:
+            header = chunk.iloc[:0]
+        if on_rows is not None and on_rows(chunk) is False:
+            break
+
+    if collected:
+        df = pd.concat(collected, ignore_index=True)
+    else:
+        df = header if header is not None else pd.DataFrame(columns=columns)
+    df.attrs['skipped_columns'] = skipped_columns
+    return df
+
+
+def read_matrix_csv(stream, on_rows=None, collect=True):
+    """Чтение CSV торговой матрицы по схеме MATRIX_COLUMNS"""
+    return read_schema_csv(stream, MATRIX_COLUMNS, MATRIX_HEADER_ALIASES, on_rows, collect)
+
+
+def parse_csv_stream(pipe, on_rows=None, collect=True):
+    """Разбор CSV порциями по мере поступления байтов; on_rows(chunk_df) - для каждой порции
+    (False - разбор прекращается, загрузка прерывается)
+
+    collect=False - порции не накапливаются (их забирает on_rows, например, в SQL-движок),
+    возвращаются только колонки без строк
+    """
+    try:
+        return read_matrix_csv(io.BufferedReader(pipe, DOWNLOAD_CHUNK_BYTES), on_rows, collect)
+    finally:
+        # Загрузка не должна ждать места в очереди, которую больше никто не читает
+        pipe.close()
+
+
+async def wait_or_cancel_async(wait_time, cancel_event=None):
+    """Неблокирующая пауза между попытками; возвращает True, если работа отменена"""
+    end = time.monotonic() + wait_time
+
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            return True
+
+        left = end - time.monotonic()
+        if left <= 0:
+            return False
+
+        await asyncio.sleep(min(left, 0.1))
+
+
+async def stream_csv_response(response, interrupted, on_progress=None, on_rows=None, collect=True):
+    """Передача тела ответа в парсер CSV порциями; None - если загрузка прервана или ответ пуст"""
+    loop = asyncio.get_running_loop()
+    total_bytes = int(response.headers.get('Content-Length') or 0) or None
+    received = 0
+
+    pipe = StreamPipe()
+    parse_future = loop.run_in_executor(None, parse_csv_stream, pipe, on_rows, collect)
+    body = response.iter_content(DOWNLOAD_CHUNK_BYTES)
+
+    try:
+        while True:
+            if interrupted():
+                pipe.abort(EOFError("Загрузка прервана"))
+                await asyncio.gather(parse_future, return_exceptions=True)
+                return None
+
+            chunk = await loop.run_in_executor(None, next, body, None)
+            if chunk is None:
+                break
+
+            if chunk:
+                # Очередь парсера заполнена - ожидание в пуле потоков, не в цикле событий
+                if not await loop.run_in_executor(None, pipe.feed, chunk):
+                    break
+                received += len(chunk)
+                if on_progress is not None:
+                    on_progress(received, total_bytes)
+
+        # Проверка на пустой ответ
+        if received == 0:
+            pipe.abort(EOFError("Пустой ответ"))
+            await asyncio.gather(parse_future, return_exceptions=True)
+            notify('error', "❌ Google Sheets вернул пустой файл")
+            return None
+
+        pipe.finish()
+        return await parse_future
+
+    except BaseException:
+        pipe.abort(EOFError("Загрузка прервана"))
+        raise
+
+
+async def download_google_sheet_async(sheet_url, max_retries=3, cancel_event=None, deadline=None,
+                                      on_progress=None, on_rows=None, collect=True):
+    """Асинхронная загрузка торговой матрицы с потоковым разбором CSV
+
+    Тело ответа разбирается порциями по мере получения. deadline - момент по time.monotonic(),
+    после которого загрузка прекращается; cancel_event - threading.Event для отмены.
+    on_progress(bytes_received, total_bytes) и on_rows(chunk_df) сообщают о ходе загрузки.
+    collect=False - строки только передаются в on_rows, возвращаются колонки без строк
+    """
+
+    # Валидация URL
+    if not validate_sheet_url(sheet_url):
+        return None
+
+    loop = asyncio.get_running_loop()
+    csv_url = sheet_csv_url(sheet_url)
+
+    def cancelled():
+        return cancel_event is not None and cancel_event.is_set()
+
+    def expired():
+        return deadline is not None and time.monotonic() >= deadline
+
+    try:
+        # Retry механизм с экспоненциальной задержкой (ожидание не блокирует поток)
+        for attempt in range(max_retries):
+            if cancelled():
+                return None
+
+            if expired():
+                notify('error', "❌ Превышен допустимый срок загрузки Google Sheets")
+                return None
+
+            timeout = 30 if deadline is None else max(0.1, min(30, deadline - time.monotonic()))
+
+            try:
+                response = await loop.run_in_executor(
+                    None, partial(requests.get, csv_url, timeout=timeout, stream=True)
+                )
+
+                DOWNLOAD_REQUESTS.inc(status=response.status_code)
+
+                with response:
+                    if response.status_code == 200:
+                        df = await stream_csv_response(
+                            response, lambda: cancelled() or expired(), on_progress, on_rows, collect
+                        )
+
+                        if df is None:
+                            if expired() and not cancelled():
+                                notify('error', "❌ Превышен допустимый срок загрузки Google Sheets")
+                            return None
+
+                        if not collect:
+                            return normalize_matrix_columns(df)
+
+                        return prepare_matrix_frame(df)
+
+                    elif response.status_code == 403:
+                        notify('error', "❌ Доступ запрещен. Проверьте настройки доступа к Google Sheets (должен быть 'Доступен всем, у кого есть ссылка')")
+                        return None
+
+                    elif response.status_code == 404:
+                        notify('error', "❌ Google Sheets не найден. Проверьте корректность URL")
+                        return None
+
+                    retry_status = response.status_code
+                    retry_warning = f"⚠️ Ошибка {response.status_code}."
+                    final_error = f"❌ Ошибка загрузки после {max_retries} попыток: HTTP {response.status_code}"
+
+            except requests.exceptions.Timeout:
+                retry_status = 'timeout'
+                DOWNLOAD_REQUESTS.inc(status=retry_status)
+                retry_warning = "⚠️ Превышено время ожидания."
+                final_error = f"❌ Превышено время ожидания после {max_retries} попыток"
+
+            except requests.exceptions.ConnectionError:
+                retry_status = 'connection_error'
+                DOWNLOAD_REQUESTS.inc(status=retry_status)
+                retry_warning = "⚠️ Ошибка подключения."
+                final_error = f"❌ Ошибка подключения после {max_retries} попыток. Проверьте интернет-соединение"
+
+            if attempt == max_retries - 1:
+                notify('error', final_error)
+                return None
+
+            wait_time = 2 ** attempt  # Экспоненциальная задержка: 1, 2, 4 секунды
+            if deadline is not None and time.monotonic() + wait_time >= deadline:
+                notify('error', "❌ Превышен допустимый срок загрузки Google Sheets")
+                return None
+
+            DOWNLOAD_RETRIES.inc(status=retry_status)
+            notify('warning', f"{retry_warning} Повторная попытка через {wait_time} сек...")
+            if await wait_or_cancel_async(wait_time, cancel_event):
+                return None
+
+    except pd.errors.EmptyDataError:
+        notify('error', "❌ Google Sheets содержит некорректные данные (пустой CSV)")
+        return None
+
+    except pd.errors.ParserError as e:
+        notify('error', f"❌ Ошибка парсинга CSV из Google Sheets: {str(e)}")
+        return None
+
+    except Exception as e:
+        notify('error', f"❌ Непредвиденная ошибка при загрузке Google Sheets: {str(e)}")
+        return None
+
+
+def download_google_sheet_streaming(sheet_url, **kwargs):
+    """Потоковая загрузка матрицы из синхронного кода (фоновые задания, планировщик)"""
+    return asyncio.run(download_google_sheet_async(sheet_url, **kwargs))
+
+
+# Формат табличного файла по сигнатуре первых байтов; файл без сигнатуры читается как CSV
+# (в фоновых заданиях остатки передаются байтами, без имени файла)
+FILE_SIGNATURES = [
+    (b'PK\x03\x04', 'excel'),
+    (b'\xd0\xcf\x11\xe0', 'excel'),
+    (b'PAR1', 'parquet'),
+    (b'ARROW1', 'feather')
+]
+
+FILE_FORMAT_LABELS = {'excel': 'Excel', 'csv': 'CSV', 'parquet': 'Parquet', 'feather': 'Feather'}
+
+
+def detect_file_format(stream):
+    """Формат табличного файла: excel, csv, parquet или feather"""
+    position = stream.tell()
+    head = stream.read(8)
+    stream.seek(position)
+
+    for signature, file_format in FILE_SIGNATURES:
+        if head.startswith(signature):
+            return file_format
+    return 'csv'
+
+
+def _read_schema_excel(stream, aliases):
+    """Excel: читаются только колонки, названия которых есть в схеме"""
+    skipped_columns = []
+
+    def in_schema(name):
+        if str(name).strip().casefold() in aliases:
+            return True
+        skipped_columns.append(name)
+        return False
+
+    df = pd.read_excel(stream, usecols=in_schema)
+    resolved = resolve_header(df.columns, aliases)
+    df.columns = [resolved.get(position, name) for position, name in enumerate(df.columns)]
+    df.attrs['skipped_columns'] = skipped_columns
+    return df
+
+
+def _read_schema_columnar(stream, file_format, schema, aliases):
+    """Parquet/Feather: читаются только колонки схемы
+
+    Текстовые колонки приводятся к строкам (числовой артикул 123 -> '123'), строковые
+    количества - к float64; количества с нечисловыми значениями остаются строками,
+    их отметит валидация, как и для Excel
+    """
+    pa = importlib.import_module('pyarrow')
+    pa_compute = importlib.import_module('pyarrow.compute')
+
+    if file_format == 'parquet':
+        reader = importlib.import_module('pyarrow.parquet')
+        names = reader.read_schema(stream).names
+    else:
+        reader = importlib.import_module('pyarrow.feather')
+        names = pa.ipc.open_file(stream).schema.names
+    stream.seek(0)
+
+    resolved = resolve_header(names, aliases)
+    table = reader.read_table(stream, columns=[names[position] for position in resolved])
+
+    arrays = []
+    for column, array in zip(resolved.values(), table.columns):
+        if schema[column][0] not in NUMERIC_KINDS:
+            if not pa.types.is_string(array.type):
+                array = pa_compute.cast(array, pa.string())
+        elif not (pa.types.is_integer(array.type) or pa.types.is_floating(array.type)):
+            try:
+                array = pa_compute.cast(array, pa.float64())
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                pass
+        arrays.append(array)
+
+    df = pa.table(arrays, names=list(resolved.values())).to_pandas()
+    df.attrs['skipped_columns'] = [name for position, name in enumerate(names) if position not in resolved]
+    return df
+
+
+def read_schema_table(stream, file_format, schema, aliases):
+    """Чтение табличного файла по формату; колонки приводятся к названиям схемы
+
+    Колонки вне схемы не читаются (их список - в df.attrs['skipped_columns'])
+    """
+    if file_format == 'excel':
+        return _read_schema_excel(stream, aliases)
+    if file_format == 'csv':
+        return read_schema_csv(stream, schema, aliases)
+    return _read_schema_columnar(stream, file_format, schema, aliases)
+
+
+def load_stock_file(uploaded_file, report=None):
+    """Загрузка файла остатков (Excel, CSV, Parquet, Feather) с улучшенной обработкой ошибок
+
+    Формат определяется по содержимому файла; CSV, Parquet и Feather читаются колоночными
+    парсерами pyarrow. Нарушения данных добавляются в report (ValidationReport), если он передан
+    """
+    if report is None:
+        report = ValidationReport()
+
+    # Проверка наличия файла
+    if uploaded_file is None:
+        notify('error', "❌ Файл не загружен")
+        return None
+
+    try:
+        # Чтение файла: только колонки схемы, названия приведены к схеме
+        file_format = detect_file_format(uploaded_file)
+        format_label = FILE_FORMAT_LABELS[file_format]
+        try:
+            df = read_schema_table(uploaded_file, file_format, STOCK_COLUMNS, STOCK_HEADER_ALIASES)
+        except ValueError as e:
+            notify('error', f"❌ Ошибка формата файла. Поддерживаются .xlsx, .xls, .csv, .parquet и .feather: {str(e)}")
+            return None
+        except Exception as e:
+            notify('error', f"❌ Не удалось прочитать файл остатков ({format_label}): {str(e)}")
+            return None
+
+        # Проверка на пустой файл (файл без колонок схемы отметит проверка обязательных колонок)
+        if len(df.columns) and len(df) == 0:
+            notify('error', f"❌ Файл остатков ({format_label}) не содержит данных")
+            return None
+
+        # Вывод информации о найденных колонках для отладки
+        notify('info', f"📋 Найденные колонки: {', '.join(map(str, df.columns))}")
+
+        skipped_columns = df.attrs.get('skipped_columns')
+        if skipped_columns:
+            notify('info', f"ℹ️ Колонки вне схемы остатков не загружаются: {', '.join(map(str, skipped_columns))}")
+
+        # Проверка обязательных колонок
+        required_cols = ['Article', 'Store_ID', 'Describe', 'Current_Stock']
+        missing_cols = [col for col in required_cols if col not in df.columns]
+
+        if missing_cols:
+            report.add_missing_columns("Остатки", missing_cols, len(df))
+            notify('error', f"❌ Отсутствуют обязательные колонки: {', '.join(missing_cols)}")
+            notify('info', "💡 Убедитесь, что файл содержит колонки: Art, Magazin, Describe, к-во")
+            return None
+
+        # Очистка и валидация данных: все правила за один проход по каждой колонке
+        issues_before = len(report)
+        try:
+            # Пустые артикулы и магазины удаляются одним отбором строк
+            drop_mask = validate_columns(df, STOCK_COLUMNS, "Остатки", report, drop_empty_keys=True)
+            if drop_mask.any():
+                df = df[~drop_mask]
+        except Exception as e:
+            notify('error', f"❌ Ошибка при очистке данных: {str(e)}")
+            return None
+
+        report.notify(report.issues[issues_before:])
+
+        # Финальная проверка
+        if df.empty:
+            notify('error', "❌ После очистки данных не осталось валидных строк")
+            return None
+
+        notify('success', f"✅ Загружено {len(df)} строк из файла остатков ({format_label})")
+        return df
+
+    except Exception as e:
+        notify('error', f"❌ Непредвиденная ошибка при загрузке остатков: {str(e)}")
+        return None
+
+
+# Разреженная матрица: строка с Store_ID = '*' - значения артикула по умолчанию для всех магазинов
+# сети, строки магазинов - переопределения (пустые ячейки наследуются от строки '*')
+MATRIX_DEFAULT_STORE = '*'
+
+
+def blank_cells(values):
+    """Маска пустых ячеек колонки: NaN и пустые строки (наследуются от строки '*')"""
+    blank = values.isna().to_numpy()
+    if pd.api.types.is_string_dtype(values) or values.dtype == object:
+        blank = blank | (values.astype(str).str.strip() == '').to_numpy()
+    return blank
+
+
+def inherit_article_defaults(df):
+    """Пустые ячейки строк магазинов заполняются значениями строки артикула '*'
+
+    Выполняется до очистки колонок: иначе пустые зоны переопределения стали бы нулями.
+    Строки '*' остаются в матрице (развертываются по магазинам при расчете, см. expand_matrix)
+    """
+    store_ids = df['Store_ID'].astype(str).str.strip()
+    default_mask = (store_ids == MATRIX_DEFAULT_STORE).to_numpy()
+
+    if not default_mask.any():
+        return df
+
+    # Строка по умолчанию для артикула (при повторах - последняя) и строки магазинов этого артикула
+    articles = df['Article'].astype(str).str.strip()
+    default_rows = np.flatnonzero(default_mask)
+    default_articles = articles.iloc[default_rows]
+    last = ~default_articles.duplicated(keep='last').to_numpy()
+    default_rows = default_rows[last]
+
+    override_rows = np.flatnonzero(~default_mask)
+    matched = pd.Index(default_articles.to_numpy()[last]).get_indexer(articles.iloc[override_rows])
+    targets = override_rows[matched >= 0]
+    sources = default_rows[matched[matched >= 0]]
+
+    if len(targets) == 0:
+        return df
+
+    for column in df.columns:
+        if column in KEY_COLUMNS:
+            continue
+
+        blank = blank_cells(df[column].iloc[targets])
+        if blank.any():
+            values = df[column].copy()
+            values.iloc[targets[blank]] = values.iloc[sources[blank]].to_numpy()
+            df[column] = values
+
+    return df
+
+
+def validate_matrix(df, copy=True, report=None):
+    """Валидация торговой матрицы с улучшенной проверкой данных
+
+    В режиме конвейера (copy=False) колонки очищаются на месте, без копии всей матрицы.
+    Нарушения данных добавляются в report (ValidationReport), если он передан
+    """
+    if report is None:
+        report = ValidationReport()
+
+    # Создаем копию для безопасной обработки (в режиме конвейера - без копии)
+    if copy:
+        df = df.copy()
+
+    required_cols = ['Article', 'Describe', 'Store_ID', 'Red_Zone', 'Yellow_Zone', 'Green_Zone']
+    missing_cols = [col for col in required_cols if col not in df.columns]
+
+    if missing_cols:
+        report.add_missing_columns("Матрица", missing_cols, len(df))
+        notify('error', f"❌ В торговой матрице отсутствуют колонки: {', '.join(missing_cols)}")
+        notify('info', f"💡 Доступные колонки: {', '.join(df.columns.tolist())}")
+        return None
+
+    # Разреженная матрица: переопределения магазинов наследуют пустые значения строки '*'
+    df = inherit_article_defaults(df)
+
+    # Все правила за один проход по каждой колонке: ключи, зоны, цена, расход, кратность
+    issues_before = len(report)
+    validate_columns(df, MATRIX_COLUMNS, "Матрица", report)
+
+    # Проверка на нулевые буферы (все три зоны равны 0)
+    zero_buffers = (
+        (df['Red_Zone'].to_numpy() == 0) & (df['Yellow_Zone'].to_numpy() == 0) & (df['Green_Zone'].to_numpy() == 0)
+    )
+    report.add("Матрица", 'zero_buffer', 'Red_Zone+Yellow_Zone+Green_Zone', zero_buffers)
+
+    report.notify(report.issues[issues_before:])
+
+    notify('success', f"✅ Торговая матрица валидирована: {len(df)} строк")
+    return df
+
+
+# ========================
+# DDMRP ЛОГИКА
+# ========================
+
+def expand_matrix(matrix_df, stores):
+    """Развертывание разреженной матрицы: строки артикула '*' -> строка на каждый магазин сети
+
+    Сеть - магазины остатков (stores) и магазины строк-переопределений. Пара (артикул, магазин)
+    со строкой-переопределением берется из нее, остальные пары - из строки '*'. Развертка -
+    одна выборка строк по позициям (артикул × магазин без переопределенных пар); индекс строки -
+    номер исходной строки файла (для отчета валидации). Плотная матрица возвращается как есть.
+    """
+    default_mask = (matrix_df['Store_ID'] == MATRIX_DEFAULT_STORE).to_numpy()
+
+    if not default_mask.any():
+        return matrix_df
+
+    defaults = matrix_df[default_mask]
+    defaults = defaults[~defaults['Article'].duplicated(keep='last').to_numpy()]
+    overrides = matrix_df[~default_mask]
+
+    network = pd.Index(pd.unique(pd.concat([overrides['Store_ID'], pd.Series(stores)], ignore_index=True)))
+    network = network.sort_values()
+    n_stores = len(network)
+
+    # Пары (артикул '*', магазин), закрытые строкой-переопределением, не развертываются
+    default_positions = pd.Index(defaults['Article']).get_indexer(overrides['Article'])
+    store_positions = network.get_indexer(overrides['Store_ID'])
+    covered = default_positions >= 0
+
+    keep = np.ones(len(defaults) * n_stores, dtype=bool)
+    keep[default_positions[covered].astype(np.int64) * n_stores + store_positions[covered]] = False
+    pairs = np.flatnonzero(keep)
+
+    expanded = defaults.iloc[pairs // n_stores]
+    expanded = expanded.assign(Store_ID=network[pairs % n_stores].to_numpy())
+
+    notify('info', f"🧩 Разреженная матрица: {len(defaults)} артикулов по умолчанию × {n_stores} магазинов, "
+                   f"{len(overrides)} переопределений -> {len(expanded) + len(overrides)} позиций")
+    return pd.concat([expanded, overrides])
+
+
+def buffer_status_codes(position, red_max, yellow_max, top_of_green):
+    """Коды статуса буфера (позиции BUFFER_STATUSES) по позиции запаса и границам зон
+
+    Для магазина позиция - текущий остаток, для РЦ - чистый поток (см. rollup_to_dc)
+    """
+    return np.select(
+        [top_of_green == 0, position <= red_max, position <= yellow_max, position <= top_of_green],
+        [4, 0, 1, 2],
+        default=3
+    )
+
+
+def calculate_ddmrp_status(matrix_df, stock_df, duplicate_policy=None, report=None):
+    """
+    Расчет статуса буферов DDMRP для каждого товара в каждом магазине с улучшенной обработкой ошибок
+
+    Колонки, уже очищенные в validate_matrix / load_stock_file, повторно не преобразуются.
+    Границы зон (Red_Zone_Max и др.) не хранятся - см. zone_boundaries()
+    Повторяющиеся ключи схлопываются до объединения: результат - одна строка на ключ матрицы
+    (остатки - по duplicate_policy, по умолчанию STOCK_DUPLICATE_POLICY)
+    """
+    try:
+        # Проверка входных данных
+        if matrix_df is None or matrix_df.empty:
+            notify('error', "❌ Матрица пуста")
+            return None
+
+        if stock_df is None or stock_df.empty:
+            notify('error', "❌ Данные остатков пусты")
+            return None
+
+        # Подготовка данных для объединения
+        stock_cols = ['Article', 'Store_ID', 'Current_Stock']
+        if 'Model' in stock_df.columns:
+            stock_cols.append('Model')
+
+        # Разреженная матрица развертывается только здесь: в реестре хранится компактная форма
+        matrix_df = expand_matrix(matrix_df, stock_df['Store_ID'].unique())
+
+        # Дубликаты ключей размножили бы строки матрицы при объединении
+        matrix_df = consolidate_duplicates(matrix_df, "Матрица", report)
+        stock_df = consolidate_duplicates(
+            stock_df[stock_cols], "Остатки", report,
+            policy=duplicate_policy or STOCK_DUPLICATE_POLICY,
+            sum_columns=['Current_Stock']
+        )
+
+        # Объединяем матрицу и остатки
+        merged = matrix_df.merge(
+            stock_df,
+            on=['Article', 'Store_ID'],
+            how='left'
+        )
+
+        # Проверка результата объединения
+        if merged.empty:
+            notify('error', "❌ После объединения данных не осталось строк. Проверьте соответствие артикулов и магазинов")
+            return None
+
+        # Набор хранится упорядоченным по (магазин, артикул): строки магазина - непрерывный
+        # диапазон (StoreIndex), а отчет по заказам получает порядок (приоритет, магазин, артикул)
+        # устойчивым разбиением по приоритету. Ключи после консолидации уникальны, сортируются
+        # целые коды строк (factorize), а не сами строки
+        store_codes, _ = pd.factorize(merged['Store_ID'], sort=True)
+        article_codes, _ = pd.factorize(merged['Article'], sort=True)
+        merged = merged.take(np.lexsort((article_codes, store_codes))).reset_index(drop=True)
+
+        # Заполняем отсутствующие остатки нулями
+        merged['Current_Stock'] = ensure_quantity(merged['Current_Stock'])
+
+        # Убедимся, что зоны числовые и неотрицательные (пропускается для валидированной матрицы)
+        for col in ['Red_Zone', 'Yellow_Zone', 'Green_Zone']:
+            merged[col] = ensure_quantity(merged[col])
+
+        # Промежуточные значения считаем в float64, чтобы не переполнить компактные типы
+        stock = merged['Current_Stock'].to_numpy(dtype=np.float64)
+        red_max = merged['Red_Zone'].to_numpy(dtype=np.float64)
+        yellow_max = red_max + merged['Yellow_Zone'].to_numpy(dtype=np.float64)
+        top_of_green = yellow_max + merged['Green_Zone'].to_numpy(dtype=np.float64)
+
+        # Расчет стоимости остатков (Retail_Price * Current_Stock)
+        if 'Retail_Price' in merged.columns:
+            if not is_clean_quantity(merged['Retail_Price']):
+                merged['Retail_Price'] = pd.to_numeric(merged['Retail_Price'], errors='coerce').fillna(0).clip(lower=0)
+            merged['Stock_Value'] = merged['Retail_Price'].to_numpy(dtype=np.float64) * stock
+        else:
+            merged['Stock_Value'] = 0
+
+        # Расчет Top of Green (максимальный уровень запаса)
+        # Формула: Top_of_Green = Red_Zone + Yellow_Zone + Green_Zone
+        merged['Top_of_Green'] = downcast_quantity(top_of_green)
+
+        # Определение статуса буфера (N/A - нет данных о буфере)
+        status_codes = buffer_status_codes(stock, red_max, yellow_max, top_of_green)
+        merged['Buffer_Status'] = pd.Categorical.from_codes(status_codes, categories=BUFFER_STATUSES)
+
+        # Расчет процента заполнения буфера (защита от деления на ноль)
+        # Формула: Buffer_Fill_Percent = (Current_Stock / Top_of_Green) * 100
+        with np.errstate(divide='ignore', invalid='ignore'):
+            merged['Buffer_Fill_Percent'] = np.where(
+                top_of_green > 0,
+                np.round(stock / top_of_green * 100, 1),
+                0
+            )
+
+        # Глубина проникновения в буфер - ранжирование срочности внутри RED и YELLOW
+        # 0% - верх желтой зоны, 100% - верх красной зоны, 200% - нулевой остаток
+        with np.errstate(divide='ignore', invalid='ignore'):
+            penetration = np.select(
+                [(status_codes == 0) & (red_max > 0), status_codes == 0, status_codes == 1],
+                [100 + (red_max - stock) / red_max * 100, 200, (yellow_max - stock) / (yellow_max - red_max) * 100],
+                default=0
+            )
+        merged['Buffer_Penetration'] = np.round(penetration, 1)
+
+        # Расчет количества для заказа
+        # Формула: Order_Qty = Top_of_Green - Current_Stock (только для RED и YELLOW)
+        needs_order = status_codes <= 1
+        merged['Order_Qty'] = downcast_quantity(
+            np.where(needs_order, np.maximum(0, np.round(top_of_green - stock, 0)), 0)
+        )
+
+        # Приоритет заказа (RED = 1, YELLOW = 2, GREEN = 3, EXCESS = 4, N/A = 5)
+        merged['Priority'] = (status_codes + 1).astype(np.int8)
+
+        # Расчет дней до исчерпания запаса (если есть Avg_Daily_Usage)
+        if 'Avg_Daily_Usage' in merged.columns:
+            merged['Avg_Daily_Usage'] = ensure_quantity(merged['Avg_Daily_Usage'])
+            usage = merged['Avg_Daily_Usage'].to_numpy(dtype=np.float64)
+
+            # Защита от деления на ноль
+            with np.errstate(divide='ignore', invalid='ignore'):
+                merged['Days_Until_Stockout'] = np.where(
+                    usage > 0,
+                    np.round(stock / usage, 1),
+                    np.inf
+                )
+        else:
+            merged['Days_Until_Stockout'] = np.nan
+
+        # Финальная валидация
+        if merged.empty:
+            notify('error', "❌ После расчетов не осталось данных")
+            return None
+
+        notify('success', f"✅ Рассчитано {len(merged)} позиций")
+        return merged
+
+    except Exception as e:
+        notify('error', f"❌ Ошибка при расчете DDMRP: {str(e)}")
+        return None
+
+
+def run_ddmrp_pipeline(matrix_df, stock_df, report=None):
+    """Сквозной расчет: валидация матрицы, расчет буферов и отчет по заказам
+
+    Матрица валидируется на месте (без промежуточной копии), поэтому передавать
+    нужно свежезагруженный DataFrame. Возвращает (matrix_df, ddmrp_df, orders_df) или None
+    """
+    matrix_df = validate_matrix(matrix_df, copy=False, report=report)
+
+    if matrix_df is None:
+        return None
+
+    ddmrp_df = calculate_ddmrp_status(matrix_df, stock_df, report=report)
+
+    if ddmrp_df is None:
+        return None
+
+    orders_df = generate_order_report(ddmrp_df)
+
+    return matrix_df, ddmrp_df, orders_df
+
+
+# Колонки отчета по заказам (порядок строк: приоритет, магазин, артикул)
+ORDER_REPORT_COLUMNS = [
+    'Store_ID', 'Article', 'Describe', 'Brand', 'Model',
+    'Current_Stock', 'Stock_Value', 'Top_of_Green', 'Order_Qty',
+    'Buffer_Status', 'Buffer_Penetration', 'Priority', 'Days_Until_Stockout'
+]
+
+# Число строк в подборках самых срочных заказов
+URGENT_TOP_N = 20
+
+
+def generate_order_report(ddmrp_df):
+    """Генерация отчета по заказам: строки по приоритету, магазину и артикулу
+
+    Набор уже упорядочен по (магазин, артикул) (calculate_ddmrp_status), а приоритетов всего
+    несколько: порядок отчета - устойчивое разбиение строк по приоритету за один проход на
+    приоритет, без сортировки строк. Самые срочные строки выбираются частичным отбором
+    (top_urgent_orders, top_urgent_by_store).
+    """
+    # Проверяем наличие колонок
+    available_columns = [col for col in ORDER_REPORT_COLUMNS if col in ddmrp_df.columns]
+
+    # Только товары, требующие заказа
+    needs_order = ddmrp_df['Order_Qty'].to_numpy() > 0
+
+    if not needs_order.any():
+        return pd.DataFrame()
+
+    # Позиции строк каждого приоритета (по возрастанию); копируются лишь колонки отчета
+    priority = ddmrp_df['Priority'].to_numpy()
+    levels = np.flatnonzero(np.bincount(priority[needs_order].astype(np.intp)))
+    positions = np.concatenate([np.flatnonzero(needs_order & (priority == level)) for level in levels])
+
+    return ddmrp_df.iloc[positions][available_columns].reset_index(drop=True)
+
+
+def top_k_positions(values, k):
+    """Позиции k наибольших значений по убыванию (равные - в порядке строк)
+
+    Частичный отбор argpartition за линейное время: сортируются только k отобранных
+    значений, а не весь массив.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    k = min(max(int(k), 0), len(values))
+
+    if k < len(values):
+        selected = np.argpartition(values, len(values) - k)[len(values) - k:]
+    else:
+        selected = np.arange(len(values))
+
+    return selected[np.lexsort((selected, -values[selected]))]
+
+
+def top_urgent_orders(orders_df, k=URGENT_TOP_N):
+    """k самых срочных строк заказа по глубине проникновения в буфер (по всей выборке)"""
+    if orders_df.empty or 'Buffer_Penetration' not in orders_df.columns:
+        return orders_df
+
+    return orders_df.iloc[top_k_positions(orders_df['Buffer_Penetration'].to_numpy(dtype=np.float64), k)]
+
+
+def top_urgent_by_store(ddmrp_df, store_index, k=URGENT_TOP_N, stores=None):
+    """k самых срочных строк заказа в каждом магазине
+
+    Отбор идет по диапазонам строк магазинов из StoreIndex (без сортировки набора), результат -
+    строки в формате отчета по заказам, сгруппированные по магазину.
+    """
+    penetration = ddmrp_df['Buffer_Penetration'].to_numpy(dtype=np.float64)
+    needs_order = ddmrp_df['Order_Qty'].to_numpy() > 0
+
+    positions = [np.array([], dtype=np.int64)]
+    for store in (store_index.stores if stores is None else stores):
+        start, stop = store_index.ranges.get(str(store), (0, 0))
+        rows = start + np.flatnonzero(needs_order[start:stop])
+        positions.append(rows[top_k_positions(penetration[rows], k)])
+
+    available_columns = [col for col in ORDER_REPORT_COLUMNS if col in ddmrp_df.columns]
+    return ddmrp_df.iloc[np.concatenate(positions)][available_columns].reset_index(drop=True)
+
+
+# ========================
+# СРАВНЕНИЕ С ПРЕДЫДУЩИМ РАСЧЕТОМ
+# ========================
+
+# Каталог данных: снимки расчетов сохраняются между перезапусками (пусто - только в памяти процесса)
+DATA_DIR = os.environ.get('DDMRP_DATA_DIR', '')
+RUN_HISTORY_KEEP = 5
+
+# Снимок расчета - только то, что нужно для сравнения запусков
+RUN_SNAPSHOT_COLUMNS = ['Article', 'Store_ID', 'Buffer_Status', 'Order_Qty']
+
+# Позиция появилась / исчезла между расчетами (метки в матрице переходов)
+RUN_NEW_LABEL = 'NEW'
+RUN_REMOVED_LABEL = 'REMOVED'
+
+# Изменения строк заказа
+ORDER_CHANGES = ['NEW', 'CHANGED', 'CANCELLED']
+
+
+def run_source_key(matrix_url, stock_source):
+    """Источник расчета: URL матрицы и источник остатков (имя загруженного файла или каталог)
+
+    Расчет сравнивается только с прошлыми расчетами того же источника: загрузка другого
+    пользователя или другой сети не становится «предыдущим расчетом»
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(f"{(matrix_url or '').strip()}\n{stock_source or ''}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def run_snapshot(ddmrp_df):
+    """Снимок расчета для сравнения со следующим запуском"""
+    return ddmrp_df[[column for column in RUN_SNAPSHOT_COLUMNS if column in ddmrp_df.columns]]
+
+
+class RunHistory:
+    """Снимки последних расчетов (ключ, статус, заказ) по источникам данных (run_source_key)
+
+    С каталогом данных снимки пишутся в Parquet (runs/<источник>/<версия>.parquet, атомарной
+    заменой файла) и переживают перезапуск приложения, без каталога - хранятся в памяти процесса.
+    """
+
+    def __init__(self, directory=None, keep=RUN_HISTORY_KEEP):
+        self.directory = os.path.join(directory, 'runs') if directory else None
+        self.keep = keep
+        self._snapshots = {}  # источник -> OrderedDict(версия -> снимок)
+        self._lock = threading.Lock()
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def _source_dir(self, source):
+        return os.path.join(self.directory, source)
+
+    def save(self, source, version, snapshot):
+        with self._lock:
+            if self.directory is None:
+                snapshots = self._snapshots.setdefault(source, OrderedDict())
+                snapshots.pop(version, None)
+                snapshots[version] = snapshot
+                while len(snapshots) > self.keep:
+                    snapshots.popitem(last=False)
+                return
+
+            directory = self._source_dir(source)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{version}.parquet")
+            snapshot.to_parquet(path + '.tmp', index=False)
+            os.replace(path + '.tmp', path)
+
+            for _, saved_path in self._saved_runs(source)[self.keep:]:
+                os.remove(saved_path)
+
+    def _saved_runs(self, source):
+        """Сохраненные снимки источника: (версия, путь) от новых к старым"""
+        runs = []
+        try:
+            with os.scandir(self._source_dir(source)) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.endswith('.parquet'):
+                        runs.append((entry.stat().st_mtime, entry.name[:-len('.parquet')], entry.path))
+        except FileNotFoundError:
+            return []
+        return [(version, path) for _, version, path in sorted(runs, reverse=True)]
+
+    def previous(self, source, version):
+        """Последний расчет источника, отличный от version: (версия, снимок) или (None, None)"""
+        with self._lock:
+            if self.directory is None:
+                snapshots = self._snapshots.get(source, {})
+                for saved_version in reversed(snapshots):
+                    if saved_version != version:
+                        return saved_version, snapshots[saved_version]
+                return None, None
+
+            for saved_version, path in self._saved_runs(source):
+                if saved_version != version:
+                    return saved_version, pd.read_parquet(path)
+            return None, None
+
+
+@st.cache_resource
+def get_run_history():
+    """История расчетов процесса (каталог - DDMRP_DATA_DIR)"""
+    return RunHistory(DATA_DIR or None)
+
+
+def _status_codes(series, missing_code):
+    """Коды статусов (порядок BUFFER_STATUSES); отсутствующая позиция - missing_code"""
+    codes = pd.Categorical(series, categories=BUFFER_STATUSES).codes.astype(np.int8)
+    codes[codes < 0] = missing_code
+    return codes
+
+
+def diff_runs(previous, current):
+    """Сравнение двух снимков по ключу (Article, Store_ID)
+
+    Возвращает (матрица переходов статусов, изменения заказов). Матрица - число позиций
+    по паре (статус в прошлом расчете, статус сейчас), включая появившиеся (NEW) и исчезнувшие
+    (REMOVED) позиции. Изменения заказов - только новые, измененные и отмененные строки.
+    """
+    merged = previous.merge(current, on=KEY_COLUMNS, how='outer', suffixes=('_Previous', ''), sort=False)
+
+    n_labels = len(BUFFER_STATUSES) + 1
+    previous_codes = _status_codes(merged['Buffer_Status_Previous'], len(BUFFER_STATUSES))
+    current_codes = _status_codes(merged['Buffer_Status'], len(BUFFER_STATUSES))
+
+    # Переходы - одна гистограмма по паре кодов вместо группировки строк
+    counts = np.bincount(previous_codes.astype(np.int64) * n_labels + current_codes, minlength=n_labels ** 2)
+    transitions = pd.DataFrame(
+        counts.reshape(n_labels, n_labels),
+        index=pd.Index(BUFFER_STATUSES + [RUN_NEW_LABEL], name='Previous_Status'),
+        columns=pd.Index(BUFFER_STATUSES + [RUN_REMOVED_LABEL], name='Buffer_Status')
+    )
+
+    previous_qty = merged['Order_Qty_Previous'].to_numpy(dtype=np.float64, na_value=0)
+    current_qty = merged['Order_Qty'].to_numpy(dtype=np.float64, na_value=0)
+
+    change = np.select(
+        [(previous_qty == 0) & (current_qty > 0),
+         (previous_qty > 0) & (current_qty == 0),
+         (previous_qty > 0) & (current_qty > 0) & (previous_qty != current_qty)],
+        [0, 2, 1],
+        default=-1
+    )
+    changed_rows = np.flatnonzero(change >= 0)
+
+    # Выборка строк без перевода строковых колонок в numpy (сохраняются str и категории)
+    delta = merged.iloc[changed_rows][['Store_ID', 'Article', 'Buffer_Status_Previous', 'Buffer_Status']]
+    delta = delta.rename(columns={'Buffer_Status_Previous': 'Previous_Status'})
+    delta.insert(2, 'Change', pd.Categorical.from_codes(change[changed_rows], categories=ORDER_CHANGES))
+    delta.insert(3, 'Previous_Order_Qty', downcast_quantity(previous_qty[changed_rows]))
+    delta.insert(4, 'Order_Qty', downcast_quantity(current_qty[changed_rows]))
+    delta.insert(5, 'Delta_Qty', downcast_quantity(current_qty[changed_rows] - previous_qty[changed_rows]))
+    delta = delta.sort_values(['Change', 'Store_ID', 'Article'], ignore_index=True)
+
+    return transitions, delta
+
+
+def compare_with_previous_run(history, source, version, ddmrp_df):
+    """Изменения относительно последнего расчета источника: (версия, переходы, изменения заказов)
+
+    Для первого расчета источника версия - None, таблицы пустые
+    """
+    previous_version, previous = history.previous(source, version)
+
+    if previous is None:
+        return None, pd.DataFrame(), pd.DataFrame()
+
+    transitions, delta = diff_runs(previous, run_snapshot(ddmrp_df))
+    return previous_version, transitions, delta
+
+
+# Статусы внутри буфера от худшего к лучшему; EXCESS - выше буфера, а не «лучше GREEN»
+BUFFER_ZONE_STATUSES = ['RED', 'YELLOW', 'GREEN']
+
+
+def status_downgrades(transitions):
+    """Число позиций, перешедших в статус ближе к RED (GREEN -> YELLOW, YELLOW -> RED, EXCESS -> RED)
+
+    Переход EXCESS -> GREEN - возврат к целевой зоне, а не ухудшение; переходы в избыток
+    считает status_excess_moves. N/A не участвует в сравнении
+    """
+    zones = transitions.loc[BUFFER_ZONE_STATUSES, BUFFER_ZONE_STATUSES].to_numpy()
+    from_excess = transitions.loc['EXCESS', ['RED', 'YELLOW']].to_numpy()
+    return int(np.tril(zones, k=-1).sum() + from_excess.sum())
+
+
+def status_excess_moves(transitions):
+    """Число позиций, перешедших из буфера (RED, YELLOW, GREEN) в избыток (EXCESS)"""
+    return int(transitions.loc[BUFFER_ZONE_STATUSES, 'EXCESS'].sum())
+
+
+# ========================
+# СВЕРКА МАТРИЦЫ И ОСТАТКОВ
+# ========================
+
+# Расхождения ключей: остаток без строки матрицы / позиция матрицы без строки остатков
+RECONCILIATION_ISSUES = ['NOT_IN_MATRIX', 'NO_STOCK']
+
+# Таблица прямой адресации ключей - пока она не больше стольких элементов на строку обеих таблиц
+RECONCILIATION_TABLE_FACTOR = 8
+
+RECONCILIATION_COLUMNS = ['Issue', 'Store_ID', 'Article', 'Describe', 'Brand', 'Current_Stock', 'Stock_Value', 'Order_Qty']
+
+
+def joint_key_codes(left, right):
+    """Целочисленный ключ (Article, Store_ID) двух таблиц в общем пространстве кодов
+
+    Каждая колонка ключа кодируется хешированием (pd.factorize) отдельно в каждой таблице,
+    затем уникальные значения правой таблицы сопоставляются с левыми (новые получают следующие
+    коды). Строки сравниваются только на уникальных значениях. Возвращает (ключи left,
+    ключи right, размер пространства ключей)
+    """
+    left_keys = np.zeros(len(left), dtype=np.int64)
+    right_keys = np.zeros(len(right), dtype=np.int64)
+    space = 1
+
+    for column in KEY_COLUMNS:
+        left_codes, left_uniques = pd.factorize(left[column])
+        right_codes, right_uniques = pd.factorize(right[column])
+
+        mapping = pd.Index(left_uniques).get_indexer(right_uniques)
+        unseen = mapping < 0
+        mapping[unseen] = len(left_uniques) + np.arange(unseen.sum())
+        n_values = len(left_uniques) + int(unseen.sum())
+
+        left_keys = left_keys * n_values + left_codes
+        right_keys = right_keys * n_values + mapping[right_codes]
+        space *= n_values
+
+    return left_keys, right_keys, space
+
+
+def anti_join_mask(keys, other_keys, space):
+    """Маска строк keys, ключа которых нет в other_keys
+
+    Небольшое пространство ключей - таблица прямой адресации (одна запись и одна выборка
+    по массиву), иначе - хеш-таблица ключей other_keys (Index.isin)
+    """
+    if space <= RECONCILIATION_TABLE_FACTOR * (len(keys) + len(other_keys)):
+        present = np.zeros(space, dtype=bool)
+        present[other_keys] = True
+        return ~present[keys]
+
+    return ~pd.Index(keys).isin(other_keys)
+
+
+def reconcile_keys(ddmrp_df, stock_df):
+    """Сверка ключей расчета и остатков: анти-соединения в обе стороны
+
+    Объединение в calculate_ddmrp_status (left по матрице) молча отбрасывает остатки без строки
+    матрицы и считает отсутствующий остаток нулем. Здесь ключи обеих таблиц кодируются
+    в общее целочисленное пространство (joint_key_codes) и сравниваются без второго объединения.
+    NOT_IN_MATRIX - остатки вне матрицы (бренд и цена - по строкам артикула в других магазинах),
+    NO_STOCK - позиции матрицы без остатков (заказ по ним рассчитан от нулевого остатка).
+    """
+    ddmrp_keys, stock_keys, space = joint_key_codes(ddmrp_df, stock_df)
+
+    not_in_matrix = np.flatnonzero(anti_join_mask(stock_keys, ddmrp_keys, space))
+    no_stock = np.flatnonzero(anti_join_mask(ddmrp_keys, stock_keys, space))
+
+    # Остатки вне матрицы: описание - из файла остатков, бренд и цена - из матрицы по артикулу
+    unlisted = stock_df.iloc[not_in_matrix]
+    unlisted_articles = unlisted['Article'].to_numpy()
+    known = ddmrp_df[ddmrp_df['Article'].isin(unlisted_articles)].drop_duplicates('Article')
+    positions = pd.Index(known['Article']).get_indexer(unlisted_articles)
+
+    found = positions >= 0
+
+    def article_values(column, default):
+        values = np.full(len(unlisted), default, dtype=object)
+        if column in known.columns:
+            values[found] = known[column].to_numpy(dtype=object)[positions[found]]
+        return values
+
+    unlisted_stock = unlisted['Current_Stock'].to_numpy(dtype=np.float64)
+    price = pd.to_numeric(article_values('Retail_Price', 0), errors='coerce')
+
+    describe = article_values('Describe', '')
+    if 'Describe' in unlisted.columns:
+        describe = np.where(unlisted['Describe'].notna(), unlisted['Describe'].to_numpy(dtype=object), describe)
+
+    unlisted_df = pd.DataFrame({
+        'Store_ID': unlisted['Store_ID'].to_numpy(),
+        'Article': unlisted_articles,
+        'Describe': describe,
+        'Brand': article_values('Brand', ''),
+        'Current_Stock': unlisted_stock,
+        'Stock_Value': np.nan_to_num(price * unlisted_stock),
+        'Order_Qty': 0
+    })
+
+    # Позиции матрицы без остатков: остаток 0, заказ - до Top of Green
+    missing = ddmrp_df.iloc[no_stock]
+    missing_df = pd.DataFrame({
+        'Store_ID': missing['Store_ID'].to_numpy(),
+        'Article': missing['Article'].to_numpy(),
+        'Describe': missing['Describe'].to_numpy(dtype=object),
+        'Brand': missing['Brand'].to_numpy(dtype=object) if 'Brand' in missing.columns else '',
+        'Current_Stock': 0.0,
+        'Stock_Value': 0.0,
+        'Order_Qty': missing['Order_Qty'].to_numpy(dtype=np.float64)
+    })
+
+    issues = np.repeat([0, 1], [len(unlisted_df), len(missing_df)]).astype(np.int8)
+    reconciliation_df = pd.concat([unlisted_df, missing_df], ignore_index=True)
+    reconciliation_df.insert(0, 'Issue', pd.Categorical.from_codes(issues, categories=RECONCILIATION_ISSUES))
+    reconciliation_df['Brand'] = reconciliation_df['Brand'].fillna('').astype(str)
+    reconciliation_df['Describe'] = reconciliation_df['Describe'].fillna('').astype(str)
+    for column in ['Current_Stock', 'Order_Qty']:
+        reconciliation_df[column] = downcast_quantity(reconciliation_df[column].to_numpy())
+
+    return reconciliation_df.sort_values(['Issue', 'Store_ID', 'Article'], ignore_index=True)[RECONCILIATION_COLUMNS]
+
+
+def reconciliation_summary(reconciliation_df, by):
+    """Сводка сверки по магазинам или брендам (by): число расхождений каждого вида,
+    остатки и их стоимость вне матрицы, заказы по позициям без остатков"""
+    not_in_matrix = (reconciliation_df['Issue'] == 'NOT_IN_MATRIX').to_numpy()
+
+    summary = reconciliation_df.assign(
+        Not_In_Matrix=not_in_matrix.astype(np.int64),
+        No_Stock=(~not_in_matrix).astype(np.int64)
+    ).groupby(by, observed=True)[['Not_In_Matrix', 'Current_Stock', 'Stock_Value', 'No_Stock', 'Order_Qty']].sum()
+
+    summary = summary.rename(columns={
+        'Current_Stock': 'Unlisted_Stock',
+        'Stock_Value': 'Unlisted_Value',
+        'Order_Qty': 'No_Stock_Order_Qty'
+    })
+    summary['Issues'] = summary['Not_In_Matrix'] + summary['No_Stock']
+    return summary.sort_values(['Issues', 'Unlisted_Value'], ascending=False).reset_index()
+
+
+def notify_reconciliation(reconciliation_df):
+    """Предупреждение о расхождениях ключей (подробности - вкладка "Сверка")"""
+    counts = reconciliation_df['Issue'].value_counts()
+
+    if counts.get('NOT_IN_MATRIX', 0):
+        unlisted = reconciliation_df[reconciliation_df['Issue'] == 'NOT_IN_MATRIX']
+        notify('warning', f"⚠️ Остатки вне матрицы (в расчет не вошли): {counts['NOT_IN_MATRIX']:,} поз., "
+                          f"{unlisted['Current_Stock'].sum():,.0f} шт")
+    if counts.get('NO_STOCK', 0):
+        notify('warning', f"⚠️ Позиции матрицы без остатков: {counts['NO_STOCK']:,} - остаток принят равным 0")
+
+
+# ========================
+# ДНЕВНЫЕ АГРЕГАТЫ (ТРЕНДЫ)
+# ========================
+
+# Сколько дней хранятся дневные агрегаты
+ROLLUP_KEEP_DAYS = int(os.environ.get('DDMRP_ROLLUP_DAYS', '400'))
+
+# Разрезы и показатели агрегата: одна строка на магазин × статус × ABC × сегмент
+ROLLUP_DIMENSIONS = ['Store_ID', 'Buffer_Status', 'ABC_Class', 'Segment']
+ROLLUP_MEASURES = ['Positions', 'Current_Stock', 'Stock_Value', 'Order_Qty']
+
+# Показатели тренда: число RED-позиций, стоимость остатков, объем заказов
+TREND_MEASURES = ['Red_Positions', 'Positions', 'Stock_Value', 'Order_Qty']
+
+
+def daily_rollup(ddmrp_df, day):
+    """Агрегат расчета за день: число позиций, остатки, стоимость и заказы по ROLLUP_DIMENSIONS
+
+    Группы - целочисленный ключ из кодов разрезов (np.ravel_multi_index), суммы - np.bincount.
+    Отсутствующий разрез (нет ABC_Class или Segment в матрице) и пустые значения - ''.
+    """
+    codes, labels = [], []
+    for column in ROLLUP_DIMENSIONS:
+        if column in ddmrp_df.columns:
+            column_codes, uniques = pd.factorize(ddmrp_df[column], use_na_sentinel=False)
+        else:
+            column_codes, uniques = np.zeros(len(ddmrp_df), dtype=np.intp), pd.Index([''])
+        codes.append(column_codes)
+        labels.append(np.asarray(uniques, dtype=object))
+
+    shape = [max(len(uniques), 1) for uniques in labels]
+    keys, inverse = np.unique(np.ravel_multi_index(codes, shape), return_inverse=True)
+    n_groups = len(keys)
+
+    def group_sum(column):
+        return np.bincount(inverse, weights=ddmrp_df[column].to_numpy(dtype=np.float64), minlength=n_groups)
+
+    rollup = {'Date': pd.Timestamp(day)}
+    for column, uniques, group_codes in zip(ROLLUP_DIMENSIONS, labels, np.unravel_index(keys, shape)):
+        rollup[column] = pd.Series(uniques[group_codes], dtype=object).fillna('').astype(str)
+    rollup['Positions'] = np.bincount(inverse, minlength=n_groups)
+    rollup['Current_Stock'] = downcast_quantity(group_sum('Current_Stock'))
+    rollup['Stock_Value'] = group_sum('Stock_Value')
+    rollup['Order_Qty'] = downcast_quantity(group_sum('Order_Qty'))
+
+    rollup = pd.DataFrame(rollup)
+    rollup['Buffer_Status'] = pd.Categorical(rollup['Buffer_Status'], categories=BUFFER_STATUSES)
+    return rollup
+
+
+class DailyRollups:
+    """Дневные агрегаты расчетов по источникам данных (run_source_key): один агрегат на день
+    и источник (последний расчет дня заменяет прежний)
+
+    Агрегат сохраняет каждый расчет - ручной и по расписанию, в том числе повторный запуск
+    с уже рассчитанными данными. Ряды источников не смешиваются: загрузка другой сети или
+    тестового файла не попадает в тренды основной сети.
+
+    С каталогом данных агрегаты пишутся в Parquet (rollups/<источник>/<день>.parquet, атомарной
+    заменой) и переживают перезапуск; прочитанные файлы кэшируются в памяти и перечитываются,
+    только если файл изменился. Без каталога агрегаты хранятся в памяти процесса.
+    """
+
+    def __init__(self, directory=None, keep_days=ROLLUP_KEEP_DAYS):
+        self.directory = os.path.join(directory, 'rollups') if directory else None
+        self.keep_days = keep_days
+        self._days = {}  # источник -> {день -> (mtime файла или None, агрегат)}
+        self._saved_at = {}  # источник -> время последнего сохранения (без каталога)
+        self._lock = threading.Lock()
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, source, day):
+        return os.path.join(self.directory, source, f"{day.isoformat()}.parquet")
+
+    def save(self, source, day, rollup):
+        with self._lock:
+            days = self._days.setdefault(source, {})
+            mtime = None
+            if self.directory:
+                path = self._path(source, day)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                rollup.to_parquet(path + '.tmp', index=False)
+                os.replace(path + '.tmp', path)
+                mtime = os.stat(path).st_mtime
+
+            days[day] = (mtime, rollup)
+            self._saved_at[source] = time.time()
+
+            cutoff = day - timedelta(days=self.keep_days)
+            for saved_day in [saved_day for saved_day in days if saved_day < cutoff]:
+                del days[saved_day]
+            if self.directory:
+                for saved_day, path, _ in self._saved_days(source):
+                    if saved_day < cutoff:
+                        os.remove(path)
+
+    def _saved_days(self, source):
+        """Файлы агрегатов источника: (день, путь, mtime)"""
+        days = []
+        try:
+            with os.scandir(os.path.join(self.directory, source)) as entries:
+                for entry in entries:
+                    if not (entry.is_file() and entry.name.endswith('.parquet')):
+                        continue
+                    try:
+                        day = datetime.strptime(entry.name[:-len('.parquet')], '%Y-%m-%d').date()
+                    except ValueError:
+                        continue
+                    days.append((day, entry.path, entry.stat().st_mtime))
+        except FileNotFoundError:
+            return []
+        return days
+
+    def latest_source(self):
+        """Источник с самым свежим агрегатом (для сессии, не знающей источник своих данных)"""
+        with self._lock:
+            if not self.directory:
+                return max(self._saved_at, key=self._saved_at.get, default=None)
+
+            latest, latest_mtime = None, None
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if not entry.is_dir():
+                        continue
+                    mtimes = [mtime for _, _, mtime in self._saved_days(entry.name)]
+                    if mtimes and (latest_mtime is None or max(mtimes) > latest_mtime):
+                        latest, latest_mtime = entry.name, max(mtimes)
+            return latest
+
+    def load(self, source, days=None):
+        """Агрегаты источника за последние days дней (None - все) одним DataFrame, по возрастанию даты"""
+        with self._lock:
+            cached = self._days.setdefault(source, {})
+            if self.directory:
+                # Агрегаты, записанные другим процессом с тем же каталогом, подхватываются по mtime
+                for day, path, mtime in self._saved_days(source):
+                    if day not in cached or cached[day][0] != mtime:
+                        cached[day] = (mtime, pd.read_parquet(path))
+
+            selected = sorted(cached)
+            if days is not None and selected:
+                cutoff = selected[-1] - timedelta(days=days - 1)
+                selected = [day for day in selected if day >= cutoff]
+
+            if not selected:
+                return pd.DataFrame(columns=['Date'] + ROLLUP_DIMENSIONS + ROLLUP_MEASURES)
+            return pd.concat([cached[day][1] for day in selected], ignore_index=True)
+
+
+@st.cache_resource
+def get_daily_rollups():
+    """Дневные агрегаты процесса (каталог - DDMRP_DATA_DIR)"""
+    return DailyRollups(DATA_DIR or None)
+
+
+def save_daily_rollup(source, ddmrp_df):
+    """Дневной агрегат расчета источника source за сегодня"""
+    today = datetime.now().date()
+    get_daily_rollups().save(source, today, daily_rollup(ddmrp_df, today))
+
+
+def rollup_trend(rollups, dimension=None, freq='D'):
+    """Ряды тренда из дневных агрегатов: показатели TREND_MEASURES по дате и разрезу
+
+    dimension - колонка разреза (Store_ID, Segment, ABC_Class) или None - вся сеть.
+    freq='W' - среднее дневных значений за неделю (показатели - уровни на дату расчета)
+    """
+    keys = ['Date'] + ([dimension] if dimension else [])
+    red = (rollups['Buffer_Status'] == 'RED').to_numpy()
+    frame = rollups[keys + ['Positions', 'Stock_Value', 'Order_Qty']].assign(
+        Red_Positions=np.where(red, rollups['Positions'].to_numpy(), 0)
+    )
+
+    trend = frame.groupby(keys, sort=True)[TREND_MEASURES].sum()
+    if freq == 'W':
+        trend = trend.reset_index()
+        trend['Date'] = trend['Date'].dt.to_period('W').dt.start_time
+        trend = trend.groupby(keys, sort=True)[TREND_MEASURES].mean()
+
+    return trend.reset_index()
+
+
+# ========================
+# SQL-ДВИЖОК (ДАННЫЕ БОЛЬШЕ ПАМЯТИ)
+# ========================
+
+# Движок: sqlite (встроен в Python) или duckdb (если установлен); пусто - расчет в pandas
+SQL_BACKEND = os.environ.get('DDMRP_SQL_BACKEND', '').lower()
+SQL_ENGINES = ['sqlite', 'duckdb']
+
+# Каталог файлов БД и временных файлов сортировок (по умолчанию - системный временный каталог)
+SQL_DATA_DIR = os.environ.get('DDMRP_SQL_DIR', '')
+
+# Память движка под кэш страниц (сортировки берут сопоставимый объем): все, что больше, уходит на диск
+SQL_MEMORY_MB = int(os.environ.get('DDMRP_SQL_MEMORY_MB', '64'))
+
+# Строк в одной пачке вставки
+SQL_BATCH_ROWS = 50_000
+
+# Различия диалектов: тип позиции строки, бесконечность, нужны ли явные индексы
+SQL_DIALECTS = {
+    'sqlite': {'seq_type': 'INTEGER PRIMARY KEY', 'infinity': '9e999', 'indexes': True},
+    'duckdb': {'seq_type': 'BIGINT', 'infinity': "CAST('Infinity' AS DOUBLE)", 'indexes': False}
+}
+
+
+def sql_round(value, digits):
+    """Округление как np.round: x * 10^digits до ближайшего четного, затем деление
+
+    Встроенный ROUND в SQL округляет половины от нуля - для совпадения с pandas используется эта функция
+    """
+    if value is None or not math.isfinite(value):
+        return value
+    scale = 10.0 ** digits
+    return round(value * scale) / scale
+
+
+def sql_name(column):
+    return '"' + str(column).replace('"', '""') + '"'
+
+
+class SqlDataset:
+    """Набор данных во встроенной аналитической БД на диске
+
+    Матрица и остатки загружаются порциями, объединение, зоны, заказы и агрегаты по магазинам
+    выполняются SQL-запросами (сортировки и промежуточные таблицы уходят на диск).
+    В pandas материализуется только запрошенная страница строк. Формулы повторяют
+    calculate_ddmrp_status и generate_order_report, включая округление np.round.
+    """
+
+    def __init__(self, engine=None, directory=None):
+        self.engine = engine or SQL_BACKEND or 'sqlite'
+        if self.engine not in SQL_ENGINES:
+            raise ValueError(f"Неизвестный SQL-движок: {self.engine}")
+
+        self.dialect = SQL_DIALECTS[self.engine]
+        self.directory = tempfile.mkdtemp(prefix='ddmrp-sql-', dir=directory or SQL_DATA_DIR or None)
+        self.path = os.path.join(self.directory, 'ddmrp.db')
+        self.columns = {}
+        self.rows = {}
+        self.created_at = datetime.now()
+        self._store_metrics = None
+        self._summary = None
+        self.validation_df = None
+        self._lock = threading.Lock()
+        self._connection = self._connect()
+
+    def _connect(self):
+        if self.engine == 'duckdb':
+            duckdb = importlib.import_module('duckdb')
+            connection = duckdb.connect(self.path)
+            connection.execute(f"SET memory_limit = '{SQL_MEMORY_MB}MB'")
+            connection.execute(f"SET temp_directory = '{self.directory}'")
+            connection.create_function(
+                'np_round', sql_round, [duckdb.typing.DOUBLE, duckdb.typing.INTEGER], duckdb.typing.DOUBLE
+            )
+            return connection
+
+        # Соединение используется потоками сессий и фоновых заданий - доступ под блокировкой
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        connection.execute(f"PRAGMA cache_size = -{SQL_MEMORY_MB * 1024}")
+        connection.execute("PRAGMA temp_store = FILE")
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.create_function('np_round', 2, sql_round, deterministic=True)
+        return connection
+
+    def close(self):
+        """Закрытие соединения и удаление файлов БД"""
+        with self._lock:
+            self._connection.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def execute(self, sql, params=()):
+        with self._lock:
+            return self._connection.execute(sql, params).fetchall()
+
+    def query(self, sql, params=()):
+        """Результат запроса в виде DataFrame (для небольших результатов: страницы, агрегаты)"""
+        with self._lock:
+            cursor = self._connection.execute(sql, params)
+            columns = [description[0] for description in cursor.description]
+            rows = cursor.fetchall()
+        return pd.DataFrame.from_records(rows, columns=columns)
+
+    # --- Загрузка ---
+
+    def _create_table(self, table, frame, schema):
+        columns = []
+        for column in frame.columns:
+            # Числовые колонки схемы - числа, колонки вне схемы - по типу порции
+            kind = schema[column][0] if column in schema else None
+            numeric = kind in NUMERIC_KINDS or (kind is None and pd.api.types.is_numeric_dtype(frame[column]))
+            columns.append(f"{sql_name(column)} {'DOUBLE' if numeric else 'TEXT'}")
+
+        self.execute(f"CREATE TABLE {table} (seq {self.dialect['seq_type']}, {', '.join(columns)})")
+        self.columns[table] = list(frame.columns)
+        self.rows[table] = 0
+
+    def insert(self, table, frame, positions, schema):
+        """Вставка порции строк; positions - номера строк в исходном файле (seq)"""
+        if table not in self.columns:
+            self._create_table(table, frame, schema)
+
+        frame = frame.reindex(columns=self.columns[table])
+
+        for start in range(0, len(frame), SQL_BATCH_ROWS):
+            batch = frame.iloc[start:start + SQL_BATCH_ROWS]
+            seq = positions[start:start + SQL_BATCH_ROWS]
+
+            with self._lock:
+                if self.engine == 'duckdb':
+                    self._connection.register('ddmrp_batch', batch.assign(seq=seq)[['seq'] + self.columns[table]])
+                    self._connection.execute(f"INSERT INTO {table} SELECT * FROM ddmrp_batch")
+                    self._connection.unregister('ddmrp_batch')
+                else:
+                    values = [
+                        batch[column].astype(object).where(batch[column].notna(), None).tolist()
+                        for column in batch.columns
+                    ]
+                    placeholders = ', '.join('?' * (len(values) + 1))
+                    # Пачка - одна транзакция (в режиме autocommit каждая строка фиксировалась бы отдельно)
+                    self._connection.execute("BEGIN")
+                    self._connection.executemany(
+                        f"INSERT INTO {table} VALUES ({placeholders})", zip(np.asarray(seq).tolist(), *values)
+                    )
+                    self._connection.execute("COMMIT")
+
+        self.rows[table] += len(frame)
+
+    def matrix_loader(self, report):
+        """Функция для порций CSV матрицы: валидация порции и вставка; False - загрузка прервана
+
+        Разреженная матрица: строки '*' уходят в таблицу matrix_defaults и развертываются по
+        магазинам сети при расчете (_expand_defaults). Пустые ячейки строк магазинов заполняются
+        из строк '*', прочитанных раньше (в памяти - одна строка на артикул), а их положение
+        сохраняется в таблице matrix_blanks: строка '*', пришедшая позже (или повторная), заполняет
+        их при расчете - значения те же, что у inherit_article_defaults для всей матрицы.
+        """
+        state = {'offset': 0, 'failed': False, 'defaults': None}
+
+        def inherit(chunk):
+            """Наследование от прочитанных строк '*': (порция, маски пустых ячеек строк магазинов)"""
+            store_ids = chunk['Store_ID'].astype(str).str.strip()
+            articles = chunk['Article'].astype(str).str.strip()
+            default_mask = (store_ids == MATRIX_DEFAULT_STORE).to_numpy()
+
+            blanks = pd.DataFrame(
+                {column: blank_cells(chunk[column]) for column in chunk.columns if column not in KEY_COLUMNS},
+                index=chunk.index
+            )
+            blanks = blanks[~default_mask & blanks.any(axis=1).to_numpy()]
+
+            # Строки '*' прошлых порций - перед порцией, наследование - как для всей матрицы
+            defaults = state['defaults']
+            prefix = None
+            if defaults is not None:
+                prefix = defaults[defaults.index.isin(articles[blanks.index])].reset_index(drop=True)
+
+            if default_mask.any():
+                new_defaults = chunk[default_mask].set_axis(articles[default_mask].to_numpy())
+                defaults = new_defaults if defaults is None else pd.concat([defaults, new_defaults])
+                state['defaults'] = defaults[~defaults.index.duplicated(keep='last')]
+
+            if prefix is None or prefix.empty:
+                return chunk, blanks
+
+            combined = inherit_article_defaults(pd.concat([prefix, chunk], ignore_index=True))
+            return combined.iloc[len(prefix):].reset_index(drop=True), blanks
+
+        def load(chunk):
+            if state['failed']:
+                return False
+
+            offset = state['offset']
+            state['offset'] += len(chunk)
+            positions = np.arange(offset, offset + len(chunk))
+
+            chunk = normalize_matrix_columns(chunk).reset_index(drop=True)
+            blanks = None
+            if 'Article' in chunk.columns and 'Store_ID' in chunk.columns:
+                chunk, blanks = inherit(chunk)
+
+            # Порция проверяется теми же правилами; сообщения - одним отчетом после загрузки
+            chunk_report = ValidationReport()
+            with capture_messages([]):
+                chunk = validate_matrix(chunk, copy=False, report=chunk_report)
+            report.merge(chunk_report, offset)
+
+            if chunk is None:
+                state['failed'] = True
+                return False
+
+            default_mask = (chunk['Store_ID'] == MATRIX_DEFAULT_STORE).to_numpy()
+            self.insert('matrix', chunk[~default_mask], positions[~default_mask], MATRIX_COLUMNS)
+            if default_mask.any():
+                self.insert('matrix_defaults', chunk[default_mask], positions[default_mask], MATRIX_COLUMNS)
+            if blanks is not None and not blanks.empty:
+                self.insert('matrix_blanks', blanks.astype(np.int8), positions[blanks.index], {})
+            return True
+
+        return load
+
+    def load_stock(self, stock_df):
+        """Остатки после load_stock_file: seq - исходные номера строк файла"""
+        stock_cols = ['Article', 'Store_ID', 'Current_Stock']
+        if 'Model' in stock_df.columns:
+            stock_cols.append('Model')
+
+        self.insert('stock', stock_df[stock_cols], stock_df.index.to_numpy(), STOCK_COLUMNS)
+
+    # --- Расчет ---
+
+    def _expand_defaults(self):
+        """Развертывание строк '*' по магазинам сети в таблицу matrix (как expand_matrix)
+
+        Сеть - магазины остатков и строк-переопределений; пары с переопределением не развертываются.
+        seq развернутых строк отрицательные: в магазине они идут раньше переопределений, в порядке
+        строк '*' - как в наборе pandas. Повторная строка '*' артикула заменяет прежнюю, в том числе
+        в пустых ячейках строк магазинов (matrix_blanks), прочитанных до нее
+        """
+        if not self.rows.get('matrix_defaults'):
+            if 'matrix_blanks' in self.columns:
+                self.execute("DROP TABLE matrix_blanks")
+            return
+
+        if self.dialect['indexes']:
+            self.execute("CREATE INDEX matrix_key ON matrix (Article, Store_ID)")
+
+        last_defaults = "SELECT * FROM matrix_defaults WHERE seq IN (SELECT MAX(seq) FROM matrix_defaults GROUP BY Article)"
+        if 'matrix_blanks' in self.columns:
+            inherited = [sql_name(column) for column in self.columns['matrix_blanks']]
+            self.execute(f"""
+                UPDATE matrix SET {', '.join(f"{column} = CASE WHEN b.{column} = 1 THEN d.{column} ELSE matrix.{column} END" for column in inherited)}
+                FROM matrix_blanks b, ({last_defaults}) d
+                WHERE b.seq = matrix.seq AND d.Article = matrix.Article
+            """)
+            self.execute("DROP TABLE matrix_blanks")
+
+        defaults = f"SELECT d.*, ROW_NUMBER() OVER (ORDER BY d.seq) - 1 AS _rank FROM ({last_defaults}) d"
+        network = (
+            "SELECT Store_ID, ROW_NUMBER() OVER (ORDER BY Store_ID) - 1 AS _rank "
+            "FROM (SELECT Store_ID FROM matrix UNION SELECT Store_ID FROM stock) stores"
+        )
+        n_defaults = self.execute("SELECT COUNT(DISTINCT Article) FROM matrix_defaults")[0][0]
+        n_stores = self.execute(f"SELECT COUNT(*) FROM ({network}) n")[0][0]
+        overrides = self.rows['matrix']
+
+        columns = self.columns['matrix']
+        select = ', '.join('n.Store_ID' if column == 'Store_ID' else f"d.{sql_name(column)}" for column in columns)
+        self.execute(f"""
+            INSERT INTO matrix (seq, {', '.join(sql_name(column) for column in columns)})
+            SELECT d._rank * {n_stores} + n._rank - {n_defaults * n_stores}, {select}
+            FROM ({defaults}) d CROSS JOIN ({network}) n
+            WHERE NOT EXISTS (SELECT 1 FROM matrix m WHERE m.Article = d.Article AND m.Store_ID = n.Store_ID)
+        """)
+        self.rows['matrix'] = self.execute("SELECT COUNT(*) FROM matrix")[0][0]
+        self.execute("DROP TABLE matrix_defaults")
+
+        notify('info', f"🧩 Разреженная матрица: {n_defaults} артикулов по умолчанию × {n_stores} магазинов, "
+                       f"{overrides} переопределений -> {self.rows['matrix']} позиций")
+
+    def _consolidate(self, table, source, report, policy, action=None):
+        """Одна строка на ключ (Article, Store_ID): таблица {table}_kept с seq оставленных строк"""
+        keep = 'MAX' if policy == 'latest' else 'MIN'
+        self.execute(
+            f"CREATE TABLE {table}_kept AS SELECT {keep}(seq) AS seq"
+            + (", SUM(Current_Stock) AS Stock_Total" if table == 'stock' else "")
+            + f" FROM {table} GROUP BY Article, Store_ID"
+        )
+        if self.dialect['indexes']:
+            self.execute(f"CREATE UNIQUE INDEX {table}_kept_seq ON {table}_kept (seq)")
+
+        kept = self.execute(f"SELECT COUNT(*) FROM {table}_kept")[0][0]
+        collapsed = self.rows[table] - kept
+        if collapsed:
+            sample = self.execute(
+                f"SELECT seq FROM {table} WHERE seq NOT IN (SELECT seq FROM {table}_kept) ORDER BY seq LIMIT ?",
+                (VALIDATION_SAMPLE_ROWS,)
+            )
+            issue = report.add_rows(source, 'duplicate_key', '+'.join(KEY_COLUMNS), collapsed,
+                                    [row[0] for row in sample], action=action)
+            report.notify([issue])
+
+    def compute(self, duplicate_policy=None, report=None):
+        """Объединение, зоны, статусы и заказы в SQL; результат - таблицы ddmrp и orders"""
+        if report is None:
+            report = ValidationReport()
+
+        policy = duplicate_policy or STOCK_DUPLICATE_POLICY
+        if policy not in DUPLICATE_POLICIES:
+            raise ValueError(f"Неизвестная политика дубликатов: {policy}")
+
+        if not self.rows.get('matrix') and not self.rows.get('matrix_defaults'):
+            notify('error', "❌ Матрица пуста")
+            return False
+
+        if not self.rows.get('stock'):
+            notify('error', "❌ Данные остатков пусты")
+            return False
+
+        # Разреженная матрица: строки '*' -> строки магазинов сети
+        self._expand_defaults()
+
+        # Дубликаты ключей: матрица - последняя строка, остатки - по политике (как consolidate_duplicates)
+        self._consolidate('matrix', "Матрица", report, 'latest')
+        self._consolidate(
+            'stock', "Остатки", report, policy,
+            action="остатки суммированы в первую строку ключа" if policy == 'sum' else None
+        )
+
+        matrix_columns = self.columns['matrix']
+        stock_extra = [column for column in self.columns['stock'] if column not in KEY_COLUMNS + ['Current_Stock']]
+
+        # Совпадающие неключевые колонки получают суффиксы, как в DataFrame.merge
+        sources = [('m', column, column + '_x' if column in stock_extra else column) for column in matrix_columns]
+        sources.append(('s', 'Current_Stock', 'Current_Stock'))
+        sources += [('s', column, column + '_y' if column in matrix_columns else column) for column in stock_extra]
+
+        output = [name for _, _, name in sources]
+        select = [
+            f"{alias}.{sql_name(column)} AS {sql_name(name)}" if column != 'Current_Stock'
+            else "COALESCE(s.Current_Stock, 0) AS Current_Stock"
+            for alias, column, name in sources
+        ]
+
+        stock_value = "CAST(Retail_Price AS DOUBLE) * _stock" if 'Retail_Price' in matrix_columns else "0"
+        days = (
+            f"CASE WHEN Avg_Daily_Usage > 0 THEN np_round(_stock / Avg_Daily_Usage, 1) "
+            f"ELSE {self.dialect['infinity']} END"
+            if 'Avg_Daily_Usage' in matrix_columns else "NULL"
+        )
+        stock_total = "k.Stock_Total" if policy == 'sum' else "st.Current_Stock"
+
+        self.execute(f"""
+            CREATE TABLE ddmrp AS
+            SELECT
+                ROW_NUMBER() OVER (ORDER BY Store_ID, Article) - 1 AS pos,
+                {', '.join(sql_name(name) for name in output)},
+                {stock_value} AS Stock_Value,
+                _top AS Top_of_Green,
+                CASE _code WHEN 0 THEN 'RED' WHEN 1 THEN 'YELLOW' WHEN 2 THEN 'GREEN'
+                           WHEN 3 THEN 'EXCESS' ELSE 'N/A' END AS Buffer_Status,
+                CASE WHEN _top > 0 THEN np_round(_stock / _top * 100, 1) ELSE 0.0 END AS Buffer_Fill_Percent,
+                CASE WHEN _code = 0 AND _red > 0 THEN np_round(100 + (_red - _stock) / _red * 100, 1)
+                     WHEN _code = 0 THEN 200.0
+                     WHEN _code = 1 THEN np_round((_yellow - _stock) / (_yellow - _red) * 100, 1)
+                     ELSE 0.0 END AS Buffer_Penetration,
+                CASE WHEN _code <= 1 AND np_round(_top - _stock, 0) > 0 THEN np_round(_top - _stock, 0)
+                     ELSE 0 END AS Order_Qty,
+                _code + 1 AS Priority,
+                {days} AS Days_Until_Stockout
+            FROM (
+                SELECT *,
+                    CASE WHEN _top = 0 THEN 4 WHEN _stock <= _red THEN 0 WHEN _stock <= _yellow THEN 1
+                         WHEN _stock <= _top THEN 2 ELSE 3 END AS _code
+                FROM (
+                    SELECT *,
+                        CAST(Current_Stock AS DOUBLE) AS _stock,
+                        CAST(Red_Zone AS DOUBLE) AS _red,
+                        CAST(Red_Zone AS DOUBLE) + Yellow_Zone AS _yellow,
+                        CAST(Red_Zone AS DOUBLE) + Yellow_Zone + Green_Zone AS _top
+                    FROM (
+                        SELECT m.seq AS _seq, {', '.join(select)}
+                        FROM matrix m
+                        JOIN matrix_kept mk ON mk.seq = m.seq
+                        LEFT JOIN (
+                            SELECT st.Article, st.Store_ID, {stock_total} AS Current_Stock
+                                {''.join(f', st.{sql_name(column)}' for column in stock_extra)}
+                            FROM stock st JOIN stock_kept k ON k.seq = st.seq
+                        ) s ON s.Article = m.Article AND s.Store_ID = m.Store_ID
+                    ) merged
+                ) zones
+            ) coded
+        """)
+
+        # Отчет по заказам: строки с Order_Qty > 0 в порядке приоритета (как generate_order_report)
+        self.columns['ddmrp'] = output + [
+            'Stock_Value', 'Top_of_Green', 'Buffer_Status', 'Buffer_Fill_Percent', 'Buffer_Penetration',
+            'Order_Qty', 'Priority', 'Days_Until_Stockout'
+        ]
+        self.columns['orders'] = [column for column in ORDER_REPORT_COLUMNS if column in self.columns['ddmrp']]
+
+        self.execute(f"""
+            CREATE TABLE orders AS
+            SELECT ROW_NUMBER() OVER (ORDER BY Priority, pos) - 1 AS pos,
+                   {', '.join(sql_name(column) for column in self.columns['orders'])}
+            FROM ddmrp WHERE Order_Qty > 0
+        """)
+
+        for table in ('matrix_kept', 'stock_kept', 'matrix', 'stock'):
+            self.execute(f"DROP TABLE {table}")
+
+        if self.dialect['indexes']:
+            for table in ('ddmrp', 'orders'):
+                self.execute(f"CREATE UNIQUE INDEX {table}_pos ON {table} (pos)")
+                self.execute(f"CREATE INDEX {table}_store ON {table} (Store_ID, pos)")
+                self.execute(f"CREATE INDEX {table}_status ON {table} (Buffer_Status, pos)")
+
+        self.rows['ddmrp'] = self.execute("SELECT COUNT(*) FROM ddmrp")[0][0]
+        self.rows['orders'] = self.execute("SELECT COUNT(*) FROM orders")[0][0]
+
+        notify('success', f"✅ Рассчитано {self.rows['ddmrp']} позиций")
+        return True
+
+    # --- Чтение ---
+
+    @staticmethod
+    def _where(criteria):
+        clauses, params = [], []
+        for column, values in (criteria or {}).items():
+            if values:
+                clauses.append(f"{sql_name(column)} IN ({', '.join('?' * len(values))})")
+                params.extend(str(value) for value in values)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def count(self, table, criteria=None):
+        where, params = self._where(criteria)
+        if not where:
+            return self.rows[table]
+        return self.execute(f"SELECT COUNT(*) FROM {table}{where}", params)[0][0]
+
+    def page(self, table, criteria=None, offset=0, limit=100):
+        """Страница строк в порядке набора pandas (позиция pos); типы - как в расчете pandas"""
+        where, params = self._where(criteria)
+        if where:
+            sql = f"SELECT * FROM {table}{where} ORDER BY pos LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        else:
+            # Без фильтров страница - диапазон позиций (поиск по индексу, без пропуска строк)
+            sql = f"SELECT * FROM {table} WHERE pos >= ? AND pos < ? ORDER BY pos"
+            params = [offset, offset + limit]
+
+        frame = self.query(sql, params)
+        if frame.empty:
+            frame = pd.DataFrame(columns=['pos'] + self.columns[table])
+
+        frame = frame.set_index('pos')
+        frame.index.name = None
+
+        for column in frame.columns:
+            if column == 'Buffer_Status':
+                frame[column] = pd.Categorical(frame[column], categories=BUFFER_STATUSES)
+            elif column in QUANTITY_COLUMNS or column == 'Priority':
+                frame[column] = downcast_quantity(frame[column].to_numpy(dtype=np.float64))
+
+        return frame
+
+    def values(self, table, column):
+        """Отсортированные значения колонки (варианты фильтра)"""
+        return [row[0] for row in self.execute(
+            f"SELECT DISTINCT {sql_name(column)} FROM {table} ORDER BY 1"
+        ) if row[0] is not None]
+
+    def summary(self):
+        """Ключевые метрики набора: счетчики статусов, сумма к заказу, стоимость остатков"""
+        if self._summary is None:
+            counts = dict(self.execute("SELECT Buffer_Status, COUNT(*) FROM ddmrp GROUP BY Buffer_Status"))
+            order_qty, stock_value = self.execute(
+                "SELECT COALESCE(SUM(Order_Qty), 0), COALESCE(SUM(Stock_Value), 0) FROM ddmrp"
+            )[0]
+            self._summary = {'status_counts': counts, 'order_qty': order_qty, 'stock_value': stock_value}
+        return self._summary
+
+    def store_metrics(self):
+        """Метрики магазинов (колонки и значения как у StoreIndex.metrics), вычисляются один раз
+
+        Счетчики и целые суммы - группировкой в SQL. Дробная Stock_Value суммируется так же,
+        как в StoreIndex (np.add.reduceat по строкам магазина): сумма с плавающей точкой зависит
+        от порядка сложения, а строки читаются потоком - в памяти только один магазин.
+        """
+        if self._store_metrics is not None:
+            return self._store_metrics
+
+        metrics = self.query("""
+            SELECT Store_ID,
+                   COUNT(*) AS SKU,
+                   SUM(CASE WHEN Buffer_Status = 'RED' THEN 1 ELSE 0 END) AS RED,
+                   SUM(CASE WHEN Buffer_Status = 'YELLOW' THEN 1 ELSE 0 END) AS YELLOW,
+                   CAST(SUM(Order_Qty) AS DOUBLE) AS Order_Qty
+            FROM ddmrp GROUP BY Store_ID ORDER BY Store_ID
+        """).set_index('Store_ID')
+
+        stock_value = {}
+        with self._lock:
+            cursor = self._connection.execute("SELECT Store_ID, Stock_Value FROM ddmrp ORDER BY pos")
+            store, values = None, []
+            for batch in iter(partial(cursor.fetchmany, SQL_BATCH_ROWS), []):
+                for row_store, value in batch:
+                    if row_store != store:
+                        if store is not None:
+                            stock_value[store] = np.add.reduceat(np.asarray(values, dtype=np.float64), [0])[0]
+                        store, values = row_store, []
+                    values.append(value)
+            if store is not None:
+                stock_value[store] = np.add.reduceat(np.asarray(values, dtype=np.float64), [0])[0]
+
+        metrics['Stock_Value'] = metrics.index.map(stock_value).astype(np.float64)
+        self._store_metrics = metrics
+        return metrics
+
+    @property
+    def nbytes(self):
+        """Объем БД на диске"""
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+
+
+def run_sql_pipeline(matrix_chunks, stock_df, report=None, duplicate_policy=None, engine=None):
+    """Сквозной расчет в SQL-движке: порции матрицы и остатки -> SqlDataset (или None)"""
+    if report is None:
+        report = ValidationReport()
+
+    dataset = SqlDataset(engine)
+    try:
+        load = dataset.matrix_loader(report)
+        for chunk in matrix_chunks:
+            if not load(chunk):
+                break
+
+        report.notify()
+        if report.has_errors:
+            dataset.close()
+            return None
+
+        dataset.load_stock(stock_df)
+        if not dataset.compute(duplicate_policy, report):
+            dataset.close()
+            return None
+
+        return dataset
+    except Exception:
+        dataset.close()
+        raise
+
+
+# ========================
+# РАСПРЕДЕЛЕНИЕ ОСТАТКА РЦ
+# ========================
+
+# Маппинг колонок файла остатков распределительного центра
+DC_STOCK_COLUMN_MAPPING = {
+    'Art': 'Article',
+    'art': 'Article',
+    'article': 'Article',
+    'Артикул': 'Article',
+    'артикул': 'Article',
+    'DC_Stock': 'DC_Stock',
+    'dc_stock': 'DC_Stock',
+    'DC_Qty': 'DC_Stock',
+    'Остаток РЦ': 'DC_Stock',
+    'остаток рц': 'DC_Stock',
+    'к-во': 'DC_Stock',
+    'Количество': 'DC_Stock',
+    'количество': 'DC_Stock',
+    'Qty': 'DC_Stock',
+    'qty': 'DC_Stock',
+    'Stock': 'DC_Stock'
+}
+
+def load_dc_stock_file(uploaded_file):
+    """Загрузка остатков распределительного центра (Article, DC_Stock) из Excel или CSV"""
+    if uploaded_file is None:
+        return None
+
+    try:
+        name = getattr(uploaded_file, 'name', '') or ''
+        if name.lower().endswith('.csv'):
+            df = pd.read_csv(uploaded_file)
+        else:
+            df = pd.read_excel(uploaded_file)
+    except Exception as e:
+        notify('error', f"❌ Не удалось прочитать файл остатков РЦ: {str(e)}")
+        return None
+
+    df.columns = df.columns.astype(str).str.strip()
+    df = df.rename(columns=DC_STOCK_COLUMN_MAPPING)
+
+    missing_cols = [col for col in ['Article', 'DC_Stock'] if col not in df.columns]
+    if missing_cols:
+        notify('error', f"❌ В файле остатков РЦ отсутствуют колонки: {', '.join(missing_cols)}")
+        return None
+
+    df = df[['Article', 'DC_Stock']]
+    df['Article'] = df['Article'].astype(str).str.strip()
+    df['DC_Stock'], invalid_count, negative_count = clean_quantity(df['DC_Stock'])
+
+    if invalid_count or negative_count:
+        notify('warning', f"⚠️ Остатки РЦ: {invalid_count} невалидных и {negative_count} отрицательных значений заменены на 0")
+
+    # Несколько строк одного артикула (разные ячейки склада) суммируются
+    df = df[df['Article'] != ''].groupby('Article', sort=False, as_index=False)['DC_Stock'].sum()
+    return df
+
+
+def allocate_dc_stock(ddmrp_df, dc_stock_df):
+    """Распределение ограниченного остатка РЦ по заказам магазинов
+
+    Внутри артикула заказы обслуживаются по проникновению в буфер: RED раньше YELLOW,
+    внутри статуса - с наименьшим заполнением буфера. Заказ округляется вверх до кратности
+    (Pack_Size) и не меньше минимальной партии (MOQ); частичная отгрузка округляется вниз до
+    кратности и отменяется, если меньше MOQ. Расчет векторный: сортировка ключей и групповые
+    накопленные суммы по артикулу, без цикла по магазинам.
+
+    Возвращает (отчет по строкам заказа, сводка по артикулам)
+    """
+    orders = ddmrp_df[ddmrp_df['Order_Qty'] > 0]
+    if orders.empty:
+        return pd.DataFrame(), pd.DataFrame()
+
+    # Порядок обслуживания: артикул, приоритет, заполнение буфера, магазин (сортировка целых кодов)
+    article_codes, articles = pd.factorize(orders['Article'], sort=True)
+    store_codes, _ = pd.factorize(orders['Store_ID'], sort=True)
+    order = np.lexsort((
+        store_codes,
+        orders['Buffer_Fill_Percent'].to_numpy(dtype=np.float64),
+        orders['Priority'].to_numpy(dtype=np.int64),
+        article_codes
+    ))
+    orders = orders.iloc[order]
+    article_codes = article_codes[order]
+
+    # После сортировки строки артикула идут подряд: групповые суммы через общий cumsum
+    group_starts = np.flatnonzero(np.diff(article_codes, prepend=-1))
+    group_sizes = np.diff(np.append(group_starts, len(article_codes)))
+
+    def group_cumsum(values):
+        total = np.cumsum(values)
+        return total - np.repeat(total[group_starts] - values[group_starts], group_sizes)
+
+    order_qty = orders['Order_Qty'].to_numpy(dtype=np.float64)
+
+    if 'Pack_Size' in orders.columns:
+        pack = orders['Pack_Size'].to_numpy(dtype=np.float64)
+        pack = np.where(pack > 0, pack, 1.0)
+    else:
+        pack = np.ones(len(orders))
+
+    moq = orders['MOQ'].to_numpy(dtype=np.float64) if 'MOQ' in orders.columns else np.zeros(len(orders))
+    moq = np.ceil(moq / pack) * pack
+
+    # Потребность: вверх до кратности, не меньше MOQ
+    requested = np.maximum(np.ceil(order_qty / pack) * pack, moq)
+
+    # Доступный остаток РЦ по артикулу (артикулы без остатка на РЦ - 0)
+    available_by_article = (
+        dc_stock_df.set_index('Article')['DC_Stock']
+        .reindex(articles)
+        .fillna(0)
+        .to_numpy(dtype=np.float64)
+    )
+    leftover = available_by_article.copy()
+
+    allocated = np.zeros(len(orders))
+    pending = requested > 0
+
+    # Проходы до исчерпания очереди: на каждом проходе строка либо получает отгрузку, либо
+    # (первая заблокированная в артикуле) выходит из очереди - число проходов не больше числа строк
+    while pending.any():
+        # Накопленная потребность ожидающих строк внутри артикула до текущей строки
+        pending_request = np.where(pending, requested, 0.0)
+        cumulative = group_cumsum(pending_request)
+        remaining = leftover[article_codes] - (cumulative - pending_request)
+
+        # Полная отгрузка, если хватает; иначе остаток, округленный вниз до кратности
+        grant = np.where(remaining >= pending_request, pending_request,
+                         np.floor(np.maximum(remaining, 0) / pack) * pack)
+        grant = np.where(pending, grant, 0.0)
+
+        # Частичная отгрузка меньше MOQ отменяется
+        grant[pending & (grant < moq)] = 0.0
+
+        # Строка, на которой закончился остаток, выходит из очереди (даже без отгрузки),
+        # чтобы на следующем проходе остаток достался следующим по приоритету
+        blocked = pending & (remaining < pending_request)
+        first_blocked = blocked & (group_cumsum(blocked.astype(np.int64)) == 1)
+
+        if not grant.any() and not first_blocked.any():
+            break
+
+        allocated += grant
+        leftover -= np.bincount(article_codes, weights=grant, minlength=len(articles))
+        pending &= ~((grant > 0) | first_blocked)
+
+    report_columns = [col for col in [
+        'Store_ID', 'Article', 'Describe', 'Brand', 'Buffer_Status', 'Priority',
+        'Buffer_Fill_Percent', 'Current_Stock', 'Top_of_Green', 'Order_Qty', 'Pack_Size', 'MOQ'
+    ] if col in orders.columns]
+
+    report = orders[report_columns].reset_index(drop=True)
+    report['Requested_Qty'] = downcast_quantity(requested)
+    report['Allocated_Qty'] = downcast_quantity(allocated)
+    report['Shortage_Qty'] = downcast_quantity(np.maximum(requested - allocated, 0))
+    report['DC_Available'] = downcast_quantity(available_by_article[article_codes])
+
+    requested_by_article = np.bincount(article_codes, weights=requested, minlength=len(articles))
+    allocated_by_article = np.bincount(article_codes, weights=allocated, minlength=len(articles))
+
+    summary = pd.DataFrame({
+        'Article': articles,
+        'DC_Available': available_by_article,
+        'Requested_Qty': requested_by_article,
+        'Allocated_Qty': allocated_by_article,
+        'DC_Leftover': leftover,
+        'Fill_Rate_Percent': np.round(
+            np.divide(allocated_by_article, requested_by_article,
+                      out=np.zeros(len(articles)), where=requested_by_article > 0) * 100, 1
+        )
+    })
+
+    return report, summary
+
+
+# ========================
+# ИЕРАРХИЯ МАГАЗИН → РЦ
+# ========================
+
+# Иерархия: магазин -> распределительный центр, который его снабжает
+DC_HIERARCHY_COLUMNS = {
+    'Store_ID': ('key', ['Magazin', 'Магазин', 'Store']),
+    'DC_ID': ('key', ['DC', 'РЦ', 'Склад'])
+}
+
+# Буферы РЦ: зоны по паре (РЦ, артикул) и собственный остаток РЦ
+DC_BUFFER_COLUMNS = {
+    'DC_ID': ('key', ['DC', 'РЦ', 'Склад']),
+    'Article': ('key', ['Art', 'Артикул']),
+    'Red_Zone': ('quantity', ['RedZone']),
+    'Yellow_Zone': ('quantity', ['YellowZone']),
+    'Green_Zone': ('quantity', ['GreenZone']),
+    'DC_Stock': ('quantity', ['DC_Qty', 'Остаток РЦ', 'Stock', 'Qty'])
+}
+
+
+def load_schema_file(uploaded_file, columns, required, source, keys):
+    """Загрузка вспомогательного файла (Excel, CSV, Parquet, Feather) по схеме колонок
+
+    Строки с пустыми ключами удаляются, повторы ключей заменяются последней строкой;
+    нарушения выводятся через notify. Возвращает DataFrame или None
+    """
+    if uploaded_file is None:
+        return None
+
+    try:
+        file_format = detect_file_format(uploaded_file)
+        df = read_schema_table(uploaded_file, file_format, columns, schema_header_aliases(columns))
+    except Exception as e:
+        notify('error', f"❌ Не удалось прочитать файл ({source}): {str(e)}")
+        return None
+
+    missing_cols = [col for col in required if col not in df.columns]
+    if missing_cols:
+        notify('error', f"❌ В файле ({source}) отсутствуют колонки: {', '.join(missing_cols)}")
+        return None
+
+    report = ValidationReport()
+    drop_mask = validate_columns(df, columns, source, report, drop_empty_keys=True)
+    if drop_mask.any():
+        df = df[~drop_mask]
+
+    duplicated = df.duplicated(keys, keep='last').to_numpy()
+    report.add(source, 'duplicate_key', '+'.join(keys), duplicated)
+    report.notify()
+
+    return df[~duplicated].reset_index(drop=True)
+
+
+def load_dc_hierarchy_file(uploaded_file):
+    """Иерархия магазин -> РЦ (Store_ID, DC_ID)"""
+    return load_schema_file(
+        uploaded_file, DC_HIERARCHY_COLUMNS,
+        ['Store_ID', 'DC_ID'], "Иерархия РЦ", ['Store_ID']
+    )
+
+
+def load_dc_buffers_file(uploaded_file):
+    """Буферы РЦ (DC_ID, Article, зоны, DC_Stock); отсутствующие зоны и остаток - 0"""
+    df = load_schema_file(
+        uploaded_file, DC_BUFFER_COLUMNS,
+        ['DC_ID', 'Article'], "Буферы РЦ", ['DC_ID', 'Article']
+    )
+    if df is None:
+        return None
+
+    for column in ['Red_Zone', 'Yellow_Zone', 'Green_Zone', 'DC_Stock']:
+        if column not in df.columns:
+            df[column] = np.zeros(len(df), dtype=np.int8)
+
+    return df
+
+
+def rollup_to_dc(ddmrp_df, hierarchy_df, dc_buffers_df=None):
+    """Свертка заказов магазинов в потребность РЦ и заказы РЦ по его собственным буферам
+
+    Строки магазинов группируются по (DC_ID, Article): ключ - целое число dc_code * n_articles +
+    article_code, группы - np.unique, суммы - np.bincount, без группировки по строкам.
+    Заказы магазинов - спрос на РЦ: чистый поток РЦ = DC_Stock - сумма Order_Qty магазинов.
+    Статус РЦ определяется по чистому потоку и зонам РЦ, как для магазина по остатку;
+    для RED и YELLOW заказ РЦ = Top_of_Green - чистый поток. Пары без буфера РЦ - статус N/A,
+    без заказа. Магазины вне иерархии в свертку не входят.
+    """
+    if dc_buffers_df is None:
+        dc_buffers_df = pd.DataFrame(columns=list(DC_BUFFER_COLUMNS))
+
+    # Коды РЦ и артикулов - общие для строк магазинов и буферов РЦ
+    dc_codes, dcs = pd.factorize(
+        pd.concat([hierarchy_df['DC_ID'], dc_buffers_df['DC_ID']], ignore_index=True), sort=True
+    )
+    article_codes, articles = pd.factorize(
+        pd.concat([ddmrp_df['Article'], dc_buffers_df['Article']], ignore_index=True), sort=True
+    )
+    n_articles = max(len(articles), 1)
+    buffer_dc = dc_codes[len(hierarchy_df):]
+    buffer_article = article_codes[len(ddmrp_df):]
+    article_codes = article_codes[:len(ddmrp_df)]
+
+    # РЦ каждой строки магазина через код магазина (-1 - магазин вне иерархии)
+    store_codes, stores = pd.factorize(ddmrp_df['Store_ID'])
+    hierarchy_position = pd.Index(hierarchy_df['Store_ID']).get_indexer(stores)
+    store_dc = np.where(hierarchy_position >= 0, dc_codes[:len(hierarchy_df)][hierarchy_position], -1)
+
+    unmapped_stores = int((store_dc < 0).sum())
+    if unmapped_stores:
+        notify('warning', f"⚠️ Магазинов вне иерархии РЦ: {unmapped_stores} (не входят в потребность РЦ)")
+
+    row_dc = store_dc[store_codes]
+    rows = np.flatnonzero(row_dc >= 0)
+
+    store_keys = row_dc[rows].astype(np.int64) * n_articles + article_codes[rows]
+    buffer_keys = buffer_dc.astype(np.int64) * n_articles + buffer_article
+    keys, inverse = np.unique(np.concatenate([store_keys, buffer_keys]), return_inverse=True)
+    store_group = inverse[:len(store_keys)]
+    buffer_group = inverse[len(store_keys):]
+    n_groups = len(keys)
+
+    def group_sum(column):
+        values = ddmrp_df[column].to_numpy(dtype=np.float64)[rows]
+        return np.bincount(store_group, weights=values, minlength=n_groups)
+
+    def buffer_values(column):
+        values = np.zeros(n_groups)
+        values[buffer_group] = dc_buffers_df[column].to_numpy(dtype=np.float64)
+        return values
+
+    # Описание - из первой строки магазина группы
+    describe = np.full(n_groups, '', dtype=object)
+    if 'Describe' in ddmrp_df.columns:
+        groups, first = np.unique(store_group, return_index=True)
+        describe[groups] = ddmrp_df['Describe'].iloc[rows[first]].to_numpy(dtype=object)
+
+    red_stores = (ddmrp_df['Buffer_Status'].cat.codes.to_numpy() == BUFFER_STATUSES.index('RED'))[rows]
+    store_orders = group_sum('Order_Qty')
+    dc_stock = buffer_values('DC_Stock')
+
+    red_max = buffer_values('Red_Zone')
+    yellow_max = red_max + buffer_values('Yellow_Zone')
+    top_of_green = yellow_max + buffer_values('Green_Zone')
+
+    net_flow = dc_stock - store_orders
+    status_codes = buffer_status_codes(net_flow, red_max, yellow_max, top_of_green)
+    dc_orders = np.where(status_codes <= 1, np.maximum(0, np.round(top_of_green - net_flow, 0)), 0)
+
+    return pd.DataFrame({
+        'DC_ID': dcs[keys // n_articles],
+        'Article': articles[keys % n_articles],
+        'Describe': describe,
+        'Stores': np.bincount(store_group, minlength=n_groups),
+        'Red_Stores': np.bincount(store_group, weights=red_stores, minlength=n_groups).astype(np.int64),
+        'Store_Stock': downcast_quantity(group_sum('Current_Stock')),
+        'Store_Order_Qty': downcast_quantity(store_orders),
+        'Stock_Value': group_sum('Stock_Value'),
+        'DC_Stock': downcast_quantity(dc_stock),
+        'Net_Flow': downcast_quantity(net_flow),
+        'Top_of_Green': downcast_quantity(top_of_green),
+        'Buffer_Status': pd.Categorical.from_codes(status_codes, categories=BUFFER_STATUSES),
+        'DC_Order_Qty': downcast_quantity(dc_orders)
+    })
+
+
+# ========================
+# СИМУЛЯЦИЯ РИСКА ДЕФИЦИТА
+# ========================
+
+# Бюджет памяти на одну порцию симуляции (SKU × сценарии × дни)
+SIMULATION_CHUNK_BYTES = 128 * 1024 ** 2
+
+
+def _simulate_chunk(stock, usage, order_qty, horizon_days, n_scenarios, lead_time_days, demand_cv, seed_seq):
+    """Симуляция порции SKU: сравнения (SKU, сценарии, дни) без циклов по SKU
+
+    Внутри порции используются общие стандартизованные траектории спроса (метод общих
+    случайных чисел): спрос SKU = Avg_Daily_Usage × траектория со средним 1. Распределение
+    по каждому SKU при этом точное, а генерация случайных чисел не зависит от числа SKU.
+    """
+    rng = np.random.default_rng(seed_seq)
+
+    # Дневной спрос ~ Gamma(k, θ) со средним 1 и коэффициентом вариации demand_cv
+    if demand_cv > 0:
+        shape = 1.0 / demand_cv ** 2
+        daily = rng.standard_gamma(shape, size=(n_scenarios, horizon_days)) / shape
+    else:
+        daily = np.ones((n_scenarios, horizon_days))
+
+    cumulative = np.cumsum(daily, axis=1).astype(np.float32)[None, :, :]
+
+    # Дефицит в день d: накопленный спрос больше остатка (в днях среднего расхода)
+    cover = (stock / usage).astype(np.float32)[:, None, None]
+    days_without = np.count_nonzero(cumulative > cover, axis=2)
+
+    # С заказом: поступление Order_Qty начиная с дня lead_time_days
+    arrival = (np.arange(horizon_days) >= lead_time_days).astype(np.float64)
+    cover_with = ((stock[:, None] + order_qty[:, None] * arrival[None, :]) / usage[:, None]).astype(np.float32)
+    days_with = np.count_nonzero(cumulative > cover_with[:, None, :], axis=2)
+
+    return (
+        (days_without > 0).mean(axis=1),
+        days_without.mean(axis=1),
+        (days_with > 0).mean(axis=1),
+        days_with.mean(axis=1)
+    )
+
+
+def simulate_stockout_risk(ddmrp_df, horizon_days=14, n_scenarios=200, lead_time_days=3,
+                           demand_cv=0.5, seed=None, max_workers=None):
+    """Монте-Карло прогноз дефицита по каждой паре (Article, Store_ID) на горизонте horizon_days
+
+    Дневной спрос моделируется гамма-распределением со средним Avg_Daily_Usage и
+    коэффициентом вариации demand_cv. Остаток проецируется без заказа и с заказом Order_Qty,
+    поступающим через lead_time_days. Расчет векторный по SKU × сценарии × дни и разбит
+    на порции по SIMULATION_CHUNK_BYTES, порции считаются параллельно. Результат - вероятность
+    дефицита (%) и ожидаемое число дней дефицита без заказа и с заказом.
+    """
+    result = ddmrp_df[['Article', 'Store_ID']].reset_index(drop=True)
+    n_items = len(result)
+
+    usage = ddmrp_df['Avg_Daily_Usage'].to_numpy(dtype=np.float64)
+    stock = ddmrp_df['Current_Stock'].to_numpy(dtype=np.float64)
+    order_qty = ddmrp_df['Order_Qty'].to_numpy(dtype=np.float64)
+
+    columns = {
+        'Stockout_Prob': np.zeros(n_items),
+        'Expected_Days_Short': np.zeros(n_items),
+        'Stockout_Prob_With_Order': np.zeros(n_items),
+        'Expected_Days_Short_With_Order': np.zeros(n_items)
+    }
+
+    # SKU без расхода дефицита не имеют - симулируются только SKU с расходом
+    active = np.flatnonzero(usage > 0)
+    chunk_items = max(1, SIMULATION_CHUNK_BYTES // (n_scenarios * horizon_days * 2))
+    chunks = [active[start:start + chunk_items] for start in range(0, len(active), chunk_items)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+
+    def run(chunk, seed_seq):
+        return chunk, _simulate_chunk(
+            stock[chunk], usage[chunk], order_qty[chunk],
+            horizon_days, n_scenarios, lead_time_days, demand_cv, seed_seq
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers or min(4, os.cpu_count() or 1)) as executor:
+        for chunk, values in executor.map(run, chunks, seeds):
+            for name, value in zip(columns, values):
+                columns[name][chunk] = value
+
+    for name, value in columns.items():
+        result[name] = value.astype(np.float32)
+
+    result['Stockout_Prob'] = (result['Stockout_Prob'] * 100).round(1)
+    result['Stockout_Prob_With_Order'] = (result['Stockout_Prob_With_Order'] * 100).round(1)
+    return result
+
+
+# ========================
+# ИНДЕКС ПО МАГАЗИНАМ
+# ========================
+
+class StoreIndex:
+    """Индекс магазин -> диапазон строк для набора данных, отсортированного по Store_ID
+
+    Срез магазина - непрерывный диапазон строк (iloc без копирования и без полного сканирования),
+    метрики магазинов рассчитываются один раз при загрузке.
+    """
+
+    def __init__(self, ddmrp_df):
+        store_values = ddmrp_df['Store_ID'].to_numpy(dtype=object)
+
+        if len(store_values) == 0:
+            starts = np.array([], dtype=np.int64)
+        else:
+            # Границы групп в отсортированной колонке
+            starts = np.concatenate(([0], np.flatnonzero(store_values[1:] != store_values[:-1]) + 1))
+
+        stops = np.append(starts[1:], len(store_values))
+
+        self.stores = [str(store) for store in store_values[starts]]
+        self.ranges = {store: (int(start), int(stop)) for store, start, stop in zip(self.stores, starts, stops)}
+        self.metrics = self._store_metrics(ddmrp_df, starts, stops)
+
+    def _store_metrics(self, ddmrp_df, starts, stops):
+        """Метрики всех магазинов за один проход групповыми суммами по диапазонам"""
+        if len(starts) == 0:
+            return pd.DataFrame(columns=['SKU', 'RED', 'YELLOW', 'Order_Qty', 'Stock_Value'])
+
+        status = ddmrp_df['Buffer_Status'].to_numpy(dtype=object)
+
+        def range_sums(values):
+            return np.add.reduceat(np.asarray(values, dtype=np.float64), starts)
+
+        if 'Stock_Value' in ddmrp_df.columns:
+            stock_value = range_sums(ddmrp_df['Stock_Value'].to_numpy(dtype=np.float64))
+        else:
+            stock_value = np.zeros(len(starts))
+
+        return pd.DataFrame({
+            'SKU': stops - starts,
+            'RED': range_sums(status == 'RED').astype(np.int64),
+            'YELLOW': range_sums(status == 'YELLOW').astype(np.int64),
+            'Order_Qty': range_sums(ddmrp_df['Order_Qty'].to_numpy(dtype=np.float64)),
+            'Stock_Value': stock_value
+        }, index=pd.Index(self.stores, name='Store_ID'))
+
+    def slice(self, ddmrp_df, store):
+        """Строки магазина - непрерывный срез без сканирования набора"""
+        start, stop = self.ranges.get(str(store), (0, 0))
+        return ddmrp_df.iloc[start:stop]
+
+    def store_metrics(self, store):
+        return self.metrics.loc[str(store)]
+
+    @property
+    def nbytes(self):
+        return int(self.metrics.memory_usage(index=True, deep=True).sum()) + 100 * len(self.ranges)
+
+
+# ========================
+# ИНДЕКС ФИЛЬТРОВ
+# ========================
+
+# Колонки мультивыбора, для которых строятся битовые карты
+FILTER_COLUMNS = ['Store_ID', 'Buffer_Status', 'ABC_Class', 'Segment', 'Brand']
+
+# До этого числа значений хранится упакованная битовая карта на значение, выше - списки позиций
+BITMAP_MAX_CARDINALITY = 64
+FILTER_CACHE_SIZE = 32
+EMPTY_FILTER_VALUE = '(не указано)'
+
+
+class FilterIndex:
+    """Битовые карты (или сжатые списки позиций) по значениям колонок фильтров
+
+    Любая комбинация фильтров вычисляется побитовыми OR/AND над упакованными картами,
+    без сравнения строк по всему набору. Результаты запросов кэшируются.
+    """
+
+    def __init__(self, df, columns=FILTER_COLUMNS):
+        self.size = len(df)
+        self._values = {}
+        self._bitmaps = {}
+        self._positions = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        for column in columns:
+            if column in df.columns:
+                self._index_column(column, df[column])
+
+    def _index_column(self, column, series):
+        if series.hasnans:
+            series = series.astype(object).where(series.notna(), EMPTY_FILTER_VALUE)
+
+        codes, uniques = pd.factorize(series, sort=False)
+        labels = [str(value) for value in uniques]
+        self._values[column] = sorted(labels)
+
+        if len(labels) <= BITMAP_MAX_CARDINALITY:
+            self._bitmaps[column] = {
+                label: np.packbits(codes == code) for code, label in enumerate(labels)
+            }
+        else:
+            # Позиции сгруппированы по значению одной стабильной сортировкой кодов
+            order = np.argsort(codes, kind='stable').astype(np.int32)
+            bounds = np.cumsum(np.bincount(codes, minlength=len(labels)))[:-1]
+            self._positions[column] = dict(zip(labels, np.split(order, bounds)))
+
+    def values(self, column):
+        """Отсортированные значения колонки (варианты для мультивыбора)"""
+        return self._values.get(column, [])
+
+    def select(self, criteria):
+        """Позиции строк, удовлетворяющих {колонка: выбранные значения}; None - подходят все строки"""
+        key = tuple(sorted(
+            (column, frozenset(str(value) for value in selected))
+            for column, selected in criteria.items()
+            if column in self._values
+        ))
+
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        result = None
+        for column, selected in key:
+            # Выбраны все значения - колонка не ограничивает выборку
+            if selected.issuperset(self._values[column]):
+                continue
+
+            bitmap = self._column_bitmap(column, selected)
+            result = bitmap if result is None else np.bitwise_and(result, bitmap, out=result)
+
+        positions = None
+        if result is not None:
+            positions = np.flatnonzero(np.unpackbits(result, count=self.size))
+
+        with self._lock:
+            self._cache[key] = positions
+            if len(self._cache) > FILTER_CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+        return positions
+
+    def filter(self, df, criteria):
+        """Строки df по фильтрам (df должен быть тем набором, по которому построен индекс)"""
+        positions = self.select(criteria)
+        return df if positions is None else df.take(positions)
+
+    def _column_bitmap(self, column, selected):
+        """Новая упакованная карта строк, где значение колонки входит в selected"""
+        if column in self._bitmaps:
+            bitmaps = [self._bitmaps[column][value] for value in selected if value in self._bitmaps[column]]
+            if not bitmaps:
+                return np.zeros((self.size + 7) // 8, dtype=np.uint8)
+            return np.bitwise_or.reduce(bitmaps) if len(bitmaps) > 1 else bitmaps[0].copy()
+
+        mask = np.zeros(self.size, dtype=bool)
+        for value in selected:
+            positions = self._positions[column].get(value)
+            if positions is not None:
+                mask[positions] = True
+        return np.packbits(mask)
+
+    @property
+    def nbytes(self):
+        total = sum(bitmap.nbytes for bitmaps in self._bitmaps.values() for bitmap in bitmaps.values())
+        total += sum(positions.nbytes for groups in self._positions.values() for positions in groups.values())
+        return total
+
+
+# ========================
+# ВИЗУАЛИЗАЦИЯ
+# ========================
+
+def create_buffer_status_chart(ddmrp_df):
+    """График распределения статусов буферов"""
+    status_counts = ddmrp_df['Buffer_Status'].value_counts()
+    status_counts = status_counts[status_counts > 0]
+    
+    colors = {
+        'RED': '#FF4444',
+        'YELLOW': '#FFD700',
+        'GREEN': '#44FF44',
+        'EXCESS': '#4444FF'
+    }
+    
+    fig = px.pie(
+        values=status_counts.values,
+        names=status_counts.index,
+        title='Распределение статусов буферов',
+        color=status_counts.index,
+        color_discrete_map=colors
+    )
+    
+    return fig
+
+
+def create_store_summary_chart(ddmrp_df):
+    """График сводки по магазинам"""
+    store_summary = ddmrp_df.groupby(['Store_ID', 'Buffer_Status'], observed=True).size().reset_index(name='Count')
+    
+    fig = px.bar(
+        store_summary,
+        x='Store_ID',
+        y='Count',
+        color='Buffer_Status',
+        title='Статусы буферов по магазинам',
+        color_discrete_map={
+            'RED': '#FF4444',
+            'YELLOW': '#FFD700',
+            'GREEN': '#44FF44',
+            'EXCESS': '#4444FF'
+        },
+        barmode='stack'
+    )
+    
+    fig.update_layout(xaxis_title='Магазин', yaxis_title='Количество товаров')
+    
+    return fig
+
+
+def create_top_orders_chart(orders_df, top_n=20):
+    """График топ товаров для заказа"""
+    if orders_df.empty:
+        return None
+    
+    top_orders = orders_df.nlargest(top_n, 'Order_Qty')
+    
+    fig = px.bar(
+        top_orders,
+        x='Order_Qty',
+        y='Describe',
+        color='Buffer_Status',
+        title=f'Топ-{top_n} товаров для заказа',
+        orientation='h',
+        color_discrete_map={
+            'RED': '#FF4444',
+            'YELLOW': '#FFD700'
+        }
+    )
+    
+    fig.update_layout(yaxis={'categoryorder': 'total ascending'})
+    
+    return fig
+
+
+# ========================
+# ЭКСПОРТ ДАННЫХ
+# ========================
+
+def excel_bytes(df):
+    """Содержимое Excel файла для таблицы"""
+    output = BytesIO()
+    with STAGE_DURATION.time(stage='export'), pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Data')
+    
+    return output.getvalue()
+
+
+def create_excel_download(df, filename):
+    """Создание ссылки для скачивания Excel"""
+    if df is None or df.empty:
+        return ""
+    
+    excel_data = excel_bytes(df)
+    b64 = base64.b64encode(excel_data).decode()
+    href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="{filename}">📥 Скачать {filename}</a>'
+    return href
+
+
+def render_excel_download(df, filename, key):
+    """Кнопка скачивания Excel: файл формируется только по нажатию, а не при каждом прогоне"""
+    if df is None or df.empty:
+        return
+    
+    st.download_button(
+        f"📥 Скачать {filename}",
+        data=partial(excel_bytes, df),
+        file_name=filename,
+        mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        on_click='ignore',
+        key=key
+    )
+
+
+# ========================
+# ОБЩИЙ РЕЕСТР НАБОРОВ ДАННЫХ
+# ========================
+
+def update_content_digest(digest, frame):
+    """Добавление содержимого таблицы (колонки и хэши строк) в хэш версии
+
+    Хэши строк не зависят от деления таблицы на порции: матрицу, прочитанную порциями
+    (SQL-движок), можно хэшировать по мере загрузки
+    """
+    digest.update('|'.join(map(str, frame.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+
+
+def dataset_version(matrix_df, stock_df):
+    """Версия набора данных - хэш содержимого исходной матрицы и остатков"""
+    digest = hashlib.blake2b(digest_size=12)
+
+    for frame in (matrix_df, stock_df):
+        update_content_digest(digest, frame)
+
+    return digest.hexdigest()
+
+
+# Владельцы ссылок, не являющиеся сессиями браузера (планировщик и т.п.), не очищаются
+SYSTEM_HOLDER_PREFIX = 'system:'
+
+# Ссылка, взятая при публикации для владельца задания, до его acquire (pending:<владелец>)
+PENDING_HOLDER_PREFIX = 'pending:'
+
+
+def build_dataset_frames(matrix_df, stock_df, ddmrp_df, orders_df, validation_report=None, run_diff=None,
+                         reconciliation_df=None):
+    """Состав публикуемой версии: исходные и рассчитанные данные, индексы, отчет валидации,
+    изменения относительно предыдущего расчета (run_diff - результат compare_with_previous_run)
+    и сверка ключей матрицы и остатков (reconcile_keys)"""
+    if validation_report is None:
+        validation_report = ValidationReport()
+    if run_diff is None:
+        run_diff = (None, pd.DataFrame(), pd.DataFrame())
+    if reconciliation_df is None:
+        reconciliation_df = pd.DataFrame(columns=RECONCILIATION_COLUMNS)
+
+    previous_version, transitions_df, order_delta_df = run_diff
+
+    return {
+        'ddmrp_df': ddmrp_df,
+        'orders_df': orders_df,
+        'matrix_df': matrix_df,
+        'stock_df': stock_df,
+        'store_index': StoreIndex(ddmrp_df),
+        'ddmrp_filter': FilterIndex(ddmrp_df),
+        'orders_filter': FilterIndex(orders_df),
+        'validation_df': validation_report.to_frame(),
+        'previous_version': previous_version,
+        'transitions_df': transitions_df,
+        'order_delta_df': order_delta_df,
+        'reconciliation_df': reconciliation_df
+    }
+
+
+class DatasetEntry:
+    """Опубликованная версия набора данных (только для чтения)"""
+
+    def __init__(self, version, frames):
+        self.version = version
+        self.frames = frames
+        self.nbytes = dataset_memory_bytes(*frames.values())
+        self.created_at = datetime.now()
+        self.sessions = set()
+
+    def __getitem__(self, name):
+        return self.frames[name]
+
+    @property
+    def refcount(self):
+        return len(self.sessions)
+
+
+class DatasetRegistry:
+    """Общий для всех сессий реестр наборов данных с подсчетом ссылок
+
+    Каждая сессия хранит в session_state только версию данных и состояние фильтров,
+    сами DataFrame существуют в процессе в единственном экземпляре. Версия, на которую
+    не ссылается ни одна сессия, удаляется (кроме последней опубликованной).
+    Версия, рассчитанная заданием, удерживается для владельцев задания (holders) с момента
+    публикации: до перезапуска страницы владельца ее не вытеснит следующая публикация.
+    Ссылка снимается, когда владелец привязывается к версии (acquire) или закрывает сессию.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._session_versions = {}
+        self._latest_version = None
+
+    def publish(self, version, frames, holders=()):
+        """Публикация версии; если такая версия уже есть - возвращается существующая"""
+        with self._lock:
+            entry = self._entries.get(version)
+            if entry is None:
+                entry = DatasetEntry(version, frames)
+                self._entries[version] = entry
+            self._latest_version = version
+            self._hold(version, holders)
+            self._evict_unused()
+            return entry
+
+    def hold(self, version, holders):
+        """Ссылки владельцев задания на уже опубликованную версию (или None, если ее нет)"""
+        with self._lock:
+            entry = self._entries.get(version)
+            if entry is not None:
+                self._hold(version, holders)
+                self._evict_unused()
+            return entry
+
+    def get(self, version):
+        with self._lock:
+            return self._entries.get(version)
+
+    def latest(self):
+        with self._lock:
+            return self._entries.get(self._latest_version)
+
+    def acquire(self, version, session_id):
+        """Привязка сессии к версии (предыдущая версия сессии освобождается)"""
+        with self._lock:
+            entry = self._entries.get(version)
+            if entry is None:
+                return None
+
+            previous = self._session_versions.get(session_id)
+            if previous != version:
+                self._detach(session_id)
+                self._session_versions[session_id] = version
+                entry.sessions.add(session_id)
+
+            # Сессия получила результат задания - ссылка, взятая при публикации, больше не нужна
+            self._detach(PENDING_HOLDER_PREFIX + session_id)
+            self._evict_unused()
+
+            return entry
+
+    def release(self, session_id):
+        with self._lock:
+            self._detach(session_id)
+            self._detach(PENDING_HOLDER_PREFIX + session_id)
+            self._evict_unused()
+
+    def prune_sessions(self, is_active):
+        """Освобождение ссылок закрытых сессий; is_active(session_id) -> bool"""
+        with self._lock:
+            for holder in list(self._session_versions):
+                session_id = holder.removeprefix(PENDING_HOLDER_PREFIX)
+                if not session_id.startswith(SYSTEM_HOLDER_PREFIX) and not is_active(session_id):
+                    self._detach(holder)
+            self._evict_unused()
+
+    def stats(self):
+        """Учет памяти: версии, число сессий и объем данных"""
+        with self._lock:
+            return {
+                'versions': len(self._entries),
+                'sessions': sum(1 for holder in self._session_versions
+                                if not holder.startswith((SYSTEM_HOLDER_PREFIX, PENDING_HOLDER_PREFIX))),
+                'total_bytes': sum(entry.nbytes for entry in self._entries.values()),
+                'entries': [
+                    {'version': entry.version, 'sessions': entry.refcount,
+                     'bytes': entry.nbytes, 'created_at': entry.created_at}
+                    for entry in self._entries.values()
+                ]
+            }
+
+    def _hold(self, version, holders):
+        entry = self._entries[version]
+        for owner in holders:
+            holder = PENDING_HOLDER_PREFIX + owner
+            self._detach(holder)
+            self._session_versions[holder] = version
+            entry.sessions.add(holder)
+
+    def _detach(self, session_id):
+        version = self._session_versions.pop(session_id, None)
+        entry = self._entries.get(version)
+        if entry is not None:
+            entry.sessions.discard(session_id)
+
+    def _evict_unused(self):
+        for version in [v for v, entry in self._entries.items() if entry.refcount == 0]:
+            if version != self._latest_version:
+                del self._entries[version]
+
+
+@st.cache_resource
+def get_dataset_registry():
+    """Единый реестр наборов данных процесса"""
+    return DatasetRegistry()
+
+
+# Показатели реестра снимаются в момент запроса метрик
+METRICS.gauge(
+    'ddmrp_dataset_memory_bytes', "Объем опубликованных наборов данных в памяти",
+    lambda: get_dataset_registry().stats()['total_bytes']
+)
+METRICS.gauge(
+    'ddmrp_dataset_versions', "Число версий данных в реестре",
+    lambda: get_dataset_registry().stats()['versions']
+)
+METRICS.gauge(
+    'ddmrp_active_sessions', "Сессии браузера, открывшие набор данных",
+    lambda: get_dataset_registry().stats()['sessions']
+)
+
+
+# Каталог общих наборов для нескольких серверных процессов на одной машине:
+# /dev/shm/... - общая память (tmpfs), иначе - локальный диск; пусто - наборы не разделяются
+SHARED_DATASET_DIR = os.environ.get('DDMRP_SHARED_DIR', '')
+SHARED_DATASET_KEEP = 3
+
+# Разделяемые таблицы версии (индексы и фильтры строятся каждым процессом по ним). Исходные
+# matrix_df и stock_df не разделяются: вкладки их не читают, подключенная версия их не содержит
+SHARED_FRAMES = ['ddmrp_df', 'orders_df', 'reconciliation_df', 'validation_df', 'transitions_df', 'order_delta_df']
+
+# Прочие поля версии (предыдущий расчет для вкладки "Изменения")
+SHARED_META = 'meta.json'
+
+# Указатель на текущую версию (заменяется атомарно)
+SHARED_POINTER = 'CURRENT'
+
+
+class SharedDatasetStore:
+    """Рассчитанные наборы в файлах Arrow IPC, общие для серверных процессов
+
+    Публикация: таблицы версии пишутся во временный каталог, который атомарно переименовывается
+    в <версия>/, затем атомарно (os.replace) заменяется указатель CURRENT - читатель видит либо
+    прежнюю, либо новую версию целиком. Подключение: файлы отображаются в память (pa.memory_map),
+    таблицы читаются без копирования и разбора; числовые колонки DataFrame и строковые колонки
+    (pd.ArrowDtype) ссылаются на отображенные страницы, общие для всех процессов через page cache
+    (или tmpfs).
+    Удаление старой версии безопасно для процессов, которые ее еще читают: отображение остается
+    действительным до закрытия.
+    """
+
+    def __init__(self, directory, keep=SHARED_DATASET_KEEP):
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, version, name=None):
+        path = os.path.join(self.directory, version)
+        return os.path.join(path, f"{name}.arrow") if name else path
+
+    def current(self):
+        """Текущая опубликованная версия (или None)"""
+        try:
+            with open(os.path.join(self.directory, SHARED_POINTER), encoding='utf-8') as pointer:
+                return pointer.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def publish(self, version, frames):
+        pa = importlib.import_module('pyarrow')
+
+        if not self._complete(version):
+            # Версия без части таблиц (опубликована прежней сборкой) публикуется заново
+            shutil.rmtree(self._path(version), ignore_errors=True)
+            temp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=self.directory)
+            for name in SHARED_FRAMES:
+                # RangeIndex хранится метаданными, именованный индекс (переходы статусов) - колонкой
+                table = pa.Table.from_pandas(frames[name], preserve_index=None)
+                with pa.OSFile(os.path.join(temp_dir, f"{name}.arrow"), 'wb') as sink:
+                    with pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+            with open(os.path.join(temp_dir, SHARED_META), 'w', encoding='utf-8') as meta:
+                json.dump({'previous_version': frames['previous_version']}, meta)
+            try:
+                os.rename(temp_dir, self._path(version))
+            except OSError:
+                # Ту же версию одновременно опубликовал другой процесс
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+        temp_pointer = os.path.join(self.directory, f".{SHARED_POINTER}.{uuid.uuid4().hex}")
+        with open(temp_pointer, 'w', encoding='utf-8') as pointer:
+            pointer.write(version)
+        os.replace(temp_pointer, os.path.join(self.directory, SHARED_POINTER))
+
+        self._prune(version)
+
+    def _complete(self, version):
+        names = [f"{name}.arrow" for name in SHARED_FRAMES] + [SHARED_META]
+        return all(os.path.isfile(os.path.join(self._path(version), name)) for name in names)
+
+    def published_at(self, version):
+        """Время публикации версии"""
+        return datetime.fromtimestamp(os.stat(self._path(version)).st_mtime)
+
+    def attach(self, version):
+        """Таблицы версии из отображенных в память файлов: {имя: DataFrame} и поля SHARED_META или None
+
+        Строки остаются в буферах Arrow (pd.ArrowDtype): без types_mapper pandas копирует их
+        в собственные массивы каждого процесса
+        """
+        pa = importlib.import_module('pyarrow')
+
+        def string_dtype(arrow_type):
+            if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+                return pd.ArrowDtype(arrow_type)
+            return None
+
+        frames = {}
+        try:
+            for name in SHARED_FRAMES:
+                table = pa.ipc.open_file(pa.memory_map(self._path(version, name))).read_all()
+                frames[name] = table.to_pandas(split_blocks=True, types_mapper=string_dtype)
+            with open(os.path.join(self._path(version), SHARED_META), encoding='utf-8') as meta:
+                frames.update(json.load(meta))
+        except FileNotFoundError:
+            return None
+        return frames
+
+    def _prune(self, current_version):
+        """Удаление версий сверх keep (от старых к новым), кроме текущей"""
+        versions = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_dir() and not entry.name.startswith('.') and entry.name != current_version:
+                    versions.append((entry.stat().st_mtime, entry.path))
+
+        for _, path in sorted(versions, reverse=True)[self.keep - 1:]:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+@st.cache_resource
+def get_shared_datasets():
+    """Общие наборы процессов (DDMRP_SHARED_DIR); None - не настроены или нет pyarrow"""
+    if not SHARED_DATASET_DIR:
+        return None
+
+    try:
+        importlib.import_module('pyarrow')
+    except ImportError:
+        return None
+
+    return SharedDatasetStore(SHARED_DATASET_DIR)
+
+
+def attach_shared_dataset(registry, shared, version=None, holders=()):
+    """Версия из общих наборов в реестре процесса (без расчета); version=None - текущая
+    holders - владельцы задания, для которых версия удерживается до их acquire (см. DatasetRegistry)
+
+    Возвращает DatasetEntry или None, если версии нет ни в реестре, ни в общих наборах
+    """
+    if shared is None:
+        return None
+
+    version = version or shared.current()
+    if version is None:
+        return None
+
+    entry = registry.hold(version, holders)
+    if entry is not None:
+        return entry
+
+    frames = shared.attach(version)
+    if frames is None:
+        return None
+
+    CACHE_REQUESTS.inc(cache='shared_dataset', result='hit')
+    entry = registry.publish(version, dict(build_dataset_frames(
+        pd.DataFrame(), pd.DataFrame(), frames['ddmrp_df'], frames['orders_df'],
+        run_diff=(frames['previous_version'], frames['transitions_df'], frames['order_delta_df']),
+        reconciliation_df=frames['reconciliation_df']
+    ), validation_df=frames['validation_df']), holders)
+    entry.created_at = shared.published_at(version)
+    return entry
+
+
+def current_session_id():
+    """Идентификатор текущей сессии Streamlit"""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else 'local'
+
+
+def prune_closed_sessions(registry):
+    """Освобождение данных сессий, закрытых в браузере"""
+    if not st.runtime.exists():
+        return
+
+    runtime = st.runtime.get_instance()
+    registry.prune_sessions(runtime.is_active_session)
+
+
+# ========================
+# ФОНОВЫЕ ЗАДАНИЯ
+# ========================
+
+# Этапы конвейера и их доля в общем прогрессе
+PIPELINE_STAGES = [
+    ('download', '⏳ Загрузка торговой матрицы', 0.35),
+    ('stock', '📂 Чтение файла остатков', 0.25),
+    ('validate', '🔍 Валидация матрицы', 0.10),
+    ('compute', '🔄 Расчет буферов DDMRP', 0.20),
+    ('reconcile', '🧾 Сверка матрицы и остатков', 0.05),
+    ('publish', '💾 Публикация результатов', 0.05)
+]
+
+JOB_RETENTION_SECONDS = 3600
+
+# Предельное время загрузки матрицы в фоновом задании (сек)
+DOWNLOAD_DEADLINE_SECONDS = 300
+
+
+class PipelineCancelled(Exception):
+    """Задание отменено пользователем"""
+
+
+class PipelineJob:
+    """Фоновое задание расчета: этап, прогресс, сообщения, результат"""
+
+    def __init__(self, job_id, key):
+        self.id = job_id
+        self.key = key
+        self.status = 'queued'  # queued / running / done / failed / cancelled
+        self.stage = None
+        self.stage_label = '⏳ В очереди'
+        self.progress = 0.0
+        self.messages = []
+        self.version = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.bytes_received = 0
+        self.preview = None
+        self.done_event = threading.Event()
+        self.stage_started = None
+        self.owners = set()
+        self.source = None  # источник данных расчета (run_source_key)
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed', 'cancelled')
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def wait(self, timeout=None):
+        """Ожидание завершения задания; True - если задание завершилось"""
+        return self.done_event.wait(timeout)
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise PipelineCancelled()
+
+    def start_stage(self, stage):
+        """Переход к этапу stage с обновлением прогресса"""
+        self.check_cancelled()
+        self.finish_stage()
+        self.stage_started = time.perf_counter()
+
+        completed = 0.0
+        for name, label, weight in PIPELINE_STAGES:
+            if name == stage:
+                self.stage = name
+                self.stage_label = label
+                break
+            completed += weight
+
+        self.progress = completed
+
+    def finish_stage(self):
+        """Учет длительности текущего этапа в метриках"""
+        if self.stage_started is not None:
+            STAGE_DURATION.observe(time.perf_counter() - self.stage_started, stage=self.stage)
+            self.stage_started = None
+
+    def report_download(self, bytes_received, total_bytes=None):
+        """Прогресс загрузки матрицы: полученные байты (и доля, если известен размер)"""
+        self.bytes_received = bytes_received
+        self.stage_label = f"⏳ Загрузка торговой матрицы: {bytes_received / 1024 ** 2:,.1f} МБ"
+
+        if total_bytes:
+            self.progress = PIPELINE_STAGES[0][2] * min(1.0, bytes_received / total_bytes)
+
+    def report_rows(self, chunk):
+        """Первые разобранные строки матрицы - для предпросмотра до окончания загрузки"""
+        if self.preview is None:
+            self.preview = chunk.head(20)
+
+
+class PipelineWorker:
+    """Пул фоновых потоков для тяжелых расчетов с дедупликацией одинаковых запросов"""
+
+    def __init__(self, max_workers=2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ddmrp-job')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._active_by_key = {}
+
+    def submit(self, key, func, *args, owner=None):
+        """Постановка задания в очередь; func(job, *args) возвращает версию данных
+
+        Если задание с тем же ключом уже выполняется, возвращается оно (owner добавляется
+        к его владельцам - для них результат удерживается в реестре до получения)
+        """
+        with self._lock:
+            self._prune_finished()
+
+            active = self._active_by_key.get(key)
+            if active is not None and not active.finished:
+                if owner is not None:
+                    active.owners.add(owner)
+                return active
+
+            job = PipelineJob(uuid.uuid4().hex, key)
+            if owner is not None:
+                job.owners.add(owner)
+            self._jobs[job.id] = job
+            self._active_by_key[key] = job
+
+        self._executor.submit(self._run, job, func, args)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, func, args):
+        job.status = 'running'
+        try:
+            with capture_messages(job.messages):
+                job.version = func(job, *args)
+            job.status = 'done' if job.version is not None else 'failed'
+            job.progress = 1.0
+        except PipelineCancelled:
+            job.status = 'cancelled'
+        except Exception as e:
+            job.error = str(e)
+            job.messages.append(('error', f"❌ Ошибка фонового расчета: {str(e)}"))
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            job.finish_stage()
+            PIPELINE_RUNS.inc(status=job.status)
+            PIPELINE_DURATION.observe(job.finished_at - job.created_at, status=job.status)
+            with self._lock:
+                if self._active_by_key.get(job.key) is job:
+                    del self._active_by_key[job.key]
+            job.done_event.set()
+
+    def _prune_finished(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and now - job.finished_at > JOB_RETENTION_SECONDS:
+                del self._jobs[job_id]
+
+
+@st.cache_resource
+def get_pipeline_worker():
+    """Единый пул фоновых заданий процесса"""
+    return PipelineWorker()
+
+
+def pipeline_job_key(sheet_url, stock_bytes):
+    """Ключ дедупликации: одинаковые URL и файл остатков дают одно задание"""
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(sheet_url.strip().encode('utf-8'))
+    digest.update(hashlib.blake2b(stock_bytes, digest_size=16).digest())
+    return digest.hexdigest()
+
+
+def run_pipeline_job(job, registry, sheet_url, stock_bytes, stock_source=None):
+    """Полный конвейер в фоновом потоке: загрузка, чтение, валидация, расчет, публикация
+
+    stock_source - имя файла остатков или каталог автообновления (источник для сравнения запусков)
+    """
+    job.start_stage('download')
+    matrix_df = download_google_sheet_streaming(
+        sheet_url,
+        cancel_event=job.cancel_event,
+        deadline=time.monotonic() + DOWNLOAD_DEADLINE_SECONDS,
+        on_progress=job.report_download,
+        on_rows=job.report_rows
+    )
+    if matrix_df is None:
+        job.check_cancelled()
+        return None
+
+    job.start_stage('stock')
+    report = ValidationReport()
+    stock_df = load_stock_file(BytesIO(stock_bytes), report=report)
+    if stock_df is None:
+        return None
+
+    # Источник данных: сравнение с прошлым расчетом и дневные агрегаты ведутся по нему
+    source = run_source_key(sheet_url, stock_source)
+    job.source = source
+
+    # Одинаковые исходные данные, уже рассчитанные другой сессией, не пересчитываются
+    # (дневной агрегат источника все равно сохраняется - день попадает в тренды)
+    version = dataset_version(matrix_df, stock_df)
+    entry = registry.hold(version, set(job.owners))
+    if entry is not None:
+        CACHE_REQUESTS.inc(cache='dataset', result='hit')
+        save_daily_rollup(source, entry['ddmrp_df'])
+        notify('info', "♻️ Эти данные уже рассчитаны другой сессией - используется общая копия")
+        return version
+
+    # ... или другим серверным процессом: общий набор подключается без расчета
+    shared = get_shared_datasets()
+    entry = attach_shared_dataset(registry, shared, version, set(job.owners))
+    if entry is not None:
+        save_daily_rollup(source, entry['ddmrp_df'])
+        notify('info', "♻️ Эти данные уже рассчитаны другим процессом сервера - подключена общая копия")
+        return version
+    CACHE_REQUESTS.inc(cache='dataset', result='miss')
+
+    job.start_stage('validate')
+    matrix_df = validate_matrix(matrix_df, copy=False, report=report)
+    if matrix_df is None:
+        return None
+
+    job.start_stage('compute')
+    ddmrp_df = calculate_ddmrp_status(matrix_df, stock_df, report=report)
+    if ddmrp_df is None:
+        return None
+
+    orders_df = generate_order_report(ddmrp_df)
+
+    # Остатки вне матрицы и позиции матрицы без остатков (объединение их не показывает)
+    job.start_stage('reconcile')
+    reconciliation_df = reconcile_keys(ddmrp_df, stock_df)
+    notify_reconciliation(reconciliation_df)
+
+    # Изменения относительно предыдущего расчета (статусы и строки заказа)
+    run_history = get_run_history()
+    run_diff = compare_with_previous_run(run_history, source, version, ddmrp_df)
+
+    # Публикация в общий реестр (одна копия на процесс)
+    job.start_stage('publish')
+    entry = registry.publish(
+        version, build_dataset_frames(matrix_df, stock_df, ddmrp_df, orders_df, report, run_diff, reconciliation_df),
+        set(job.owners)
+    )
+    run_history.save(source, version, run_snapshot(ddmrp_df))
+
+    # Публикация для других серверных процессов (Arrow IPC, атомарная смена версии)
+    if shared is not None:
+        try:
+            shared.publish(version, entry.frames)
+        except OSError as e:
+            notify('warning', f"⚠️ Не удалось опубликовать набор для других процессов: {str(e)}")
+
+    # Дневной агрегат для вкладки трендов (последний расчет дня заменяет прежний)
+    save_daily_rollup(source, ddmrp_df)
+
+    for source, frame in (('matrix', matrix_df), ('stock', stock_df), ('ddmrp', ddmrp_df), ('orders', orders_df)):
+        ROWS_PROCESSED.inc(len(frame), source=source)
+
+    notify('info', f"💾 Объем данных в памяти: {entry.nbytes / 1024 ** 2:,.1f} МБ")
+    notify('success', "✅ Расчеты выполнены успешно!")
+    return version
+
+
+# Сколько наборов SQL-движка хранится одновременно (файлы вытесненных удаляются)
+SQL_DATASET_VERSIONS = 2
+
+
+class SqlDatasetStore:
+    """Наборы SQL-движка процесса по версиям; вытесненные наборы закрываются"""
+
+    def __init__(self, max_versions=SQL_DATASET_VERSIONS):
+        self.max_versions = max_versions
+        self._datasets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def publish(self, version, dataset):
+        with self._lock:
+            self._datasets[version] = dataset
+            self._datasets.move_to_end(version)
+            evicted = []
+            while len(self._datasets) > self.max_versions:
+                evicted.append(self._datasets.popitem(last=False)[1])
+
+        for old in evicted:
+            old.close()
+
+    def get(self, version):
+        with self._lock:
+            return self._datasets.get(version)
+
+
+@st.cache_resource
+def get_sql_datasets():
+    """Единое хранилище наборов SQL-движка процесса"""
+    return SqlDatasetStore()
+
+
+def run_sql_pipeline_job(job, datasets, sheet_url, stock_bytes):
+    """Конвейер на SQL-движке: порции матрицы уходят в БД по мере загрузки, не накапливаясь в памяти
+
+    Версия - хэш содержимого матрицы (по порциям, до их очистки) и остатков, как dataset_version:
+    измененная таблица с тем же URL рассчитывается заново, а одинаковые данные - нет
+    """
+    report = ValidationReport()
+    dataset = SqlDataset()
+    load = dataset.matrix_loader(report)
+    digest = hashlib.blake2b(digest_size=12)
+    published = False
+
+    def on_rows(chunk):
+        job.report_rows(chunk)
+        update_content_digest(digest, chunk)
+        return load(chunk)
+
+    try:
+        job.start_stage('download')
+        header = download_google_sheet_streaming(
+            sheet_url,
+            cancel_event=job.cancel_event,
+            deadline=time.monotonic() + DOWNLOAD_DEADLINE_SECONDS,
+            on_progress=job.report_download,
+            on_rows=on_rows,
+            collect=False
+        )
+        if header is None:
+            job.check_cancelled()
+            return None
+
+        report.notify()
+        if report.has_errors:
+            return None
+
+        job.start_stage('stock')
+        stock_df = load_stock_file(BytesIO(stock_bytes), report=report)
+        if stock_df is None:
+            return None
+
+        # Одинаковые исходные данные, уже рассчитанные другой сессией, не пересчитываются
+        update_content_digest(digest, stock_df)
+        version = 'sql-' + digest.hexdigest()
+        if datasets.get(version) is not None:
+            CACHE_REQUESTS.inc(cache='dataset', result='hit')
+            notify('info', "♻️ Эти данные уже рассчитаны другой сессией - используется общая копия")
+            return version
+        CACHE_REQUESTS.inc(cache='dataset', result='miss')
+
+        dataset.load_stock(stock_df)
+        del stock_df
+
+        job.start_stage('compute')
+        if not dataset.compute(report=report):
+            return None
+
+        # Агрегаты считаются один раз при публикации, интерфейс читает готовые значения
+        job.start_stage('publish')
+        dataset.summary()
+        dataset.store_metrics()
+        dataset.validation_df = report.to_frame()
+        datasets.publish(version, dataset)
+        published = True
+
+        for source, table in (('matrix', 'matrix'), ('stock', 'stock'), ('ddmrp', 'ddmrp'), ('orders', 'orders')):
+            ROWS_PROCESSED.inc(dataset.rows.get(table, 0), source=source)
+
+        notify('info', f"🗄️ База данных на диске ({dataset.engine}): {dataset.nbytes / 1024 ** 2:,.1f} МБ")
+        notify('success', "✅ Расчеты выполнены успешно!")
+        return version
+
+    finally:
+        if not published:
+            dataset.close()
+
+
+@st.fragment(run_every=1)
+def render_pipeline_job():
+    """Прогресс фонового задания; по завершении результат передается в сессию"""
+    job_id = st.session_state.get('pipeline_job_id')
+    job = get_pipeline_worker().get(job_id) if job_id else None
+
+    if job is None:
+        st.session_state.pop('pipeline_job_id', None)
+        return
+
+    if not job.finished:
+        st.progress(job.progress, text=job.stage_label)
+        if st.button("⏹️ Отменить расчет", key='cancel_pipeline_job'):
+            job.cancel()
+
+        if job.preview is not None and job.stage == 'download':
+            st.caption("Первые строки торговой матрицы (загрузка продолжается):")
+            st.dataframe(job.preview, width='stretch', hide_index=True)
+        return
+
+    # Передача результата в сессию и полный перезапуск страницы
+    st.session_state.pop('pipeline_job_id')
+    st.session_state['pipeline_messages'] = list(job.messages)
+
+    if job.status == 'cancelled':
+        st.session_state['pipeline_messages'].append(('warning', "⚠️ Расчет отменен"))
+    elif job.status == 'done':
+        st.session_state['dataset_version'] = job.version
+        st.session_state['run_source'] = job.source
+
+    st.rerun(scope='app')
+
+
+# ========================
+# АВТООБНОВЛЕНИЕ ДАННЫХ
+# ========================
+
+# Настройки планировщика (переменные окружения)
+AUTO_REFRESH_MATRIX_URL = os.environ.get('DDMRP_MATRIX_URL', '')
+AUTO_REFRESH_STOCK_DIR = os.environ.get('DDMRP_STOCK_DIR', '')
+AUTO_REFRESH_MINUTES = float(os.environ.get('DDMRP_REFRESH_MINUTES', '15'))
+
+# Период проверки каталога остатков и "успокоения" файла после записи (сек)
+STOCK_DIR_POLL_SECONDS = 10
+STOCK_FILE_SETTLE_SECONDS = 5
+STOCK_FILE_EXTENSIONS = ('.xlsx', '.xls', '.csv', '.parquet', '.feather')
+
+
+def newest_stock_file(stock_dir):
+    """Самый свежий полностью записанный файл остатков в каталоге (или None)"""
+    candidates = []
+    now = time.time()
+
+    try:
+        with os.scandir(stock_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or entry.name.startswith(('.', '~$')):
+                    continue
+                if not entry.name.lower().endswith(STOCK_FILE_EXTENSIONS):
+                    continue
+
+                stat = entry.stat()
+                if now - stat.st_mtime >= STOCK_FILE_SETTLE_SECONDS:
+                    candidates.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return None
+
+    if not candidates:
+        return None
+
+    mtime, size, path = max(candidates)
+    return path, mtime, size
+
+
+class AutoRefreshScheduler:
+    """Фоновый опрос торговой матрицы и каталога остатков с заблаговременным расчетом
+
+    Матрица опрашивается раз в refresh_minutes, каталог остатков - каждые STOCK_DIR_POLL_SECONDS.
+    Расчет выполняется через общий пул заданий; если содержимое не изменилось, версия данных
+    остается прежней и повторный расчет не выполняется. Файл остатков, расчет по которому
+    не удался, повторно берется только при следующем опросе матрицы (а не каждые 10 сек).
+    """
+
+    HOLDER_ID = SYSTEM_HOLDER_PREFIX + 'auto-refresh'
+
+    def __init__(self, registry, worker, matrix_url, stock_dir, refresh_minutes=AUTO_REFRESH_MINUTES):
+        self.registry = registry
+        self.worker = worker
+        self.matrix_url = matrix_url
+        self.stock_dir = stock_dir
+        self.refresh_seconds = max(60.0, refresh_minutes * 60)
+
+        self.version = None
+        self.last_refresh = None
+        self.last_check = None
+        self.last_messages = []
+        self.stock_file = None
+
+        self._stock_signature = None
+        self._failed_signature = None
+        self._next_matrix_poll = 0.0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='ddmrp-auto-refresh', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run_forever(self):
+        """Цикл опроса в текущем потоке (отдельный процесс автообновления)"""
+        self._loop()
+
+    def _loop(self):
+        logged = []
+        while not self._stop_event.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                self.last_messages = [('error', f"❌ Ошибка автообновления: {str(e)}")]
+
+            # В журнал - только новые предупреждения и ошибки (страницу могут не открывать)
+            problems = [(level, message) for level, message in self.last_messages if level in ('error', 'warning')]
+            if problems != logged:
+                for level, message in problems:
+                    LOGGER.log(logging.ERROR if level == 'error' else logging.WARNING, message)
+                logged = problems
+
+            self._stop_event.wait(STOCK_DIR_POLL_SECONDS)
+
+    def check(self):
+        """Один цикл опроса: запуск расчета, если появился новый файл остатков или пора опросить матрицу"""
+        self.last_check = datetime.now()
+
+        newest = newest_stock_file(self.stock_dir)
+        if newest is None:
+            self.last_messages = [('warning', f"⚠️ В каталоге {self.stock_dir} нет файлов остатков")]
+            return False
+
+        stock_changed = newest not in (self._stock_signature, self._failed_signature)
+        if not stock_changed and time.monotonic() < self._next_matrix_poll:
+            return False
+
+        path = newest[0]
+        with open(path, 'rb') as stock_file:
+            stock_bytes = stock_file.read()
+
+        job = self.worker.submit(
+            pipeline_job_key(self.matrix_url, stock_bytes),
+            run_pipeline_job,
+            self.registry,
+            self.matrix_url,
+            stock_bytes,
+            self.stock_dir,
+            owner=self.HOLDER_ID
+        )
+
+        # Ожидание с возможностью остановки планировщика
+        while not job.wait(1.0):
+            if self._stop_event.is_set():
+                job.cancel()
+                return False
+
+        self._next_matrix_poll = time.monotonic() + self.refresh_seconds
+
+        if job.status != 'done':
+            # Тот же файл - снова только по расписанию матрицы: без повторной загрузки каждые 10 сек
+            self._failed_signature = newest
+            self.last_messages = list(job.messages)
+            return False
+
+        self._failed_signature = None
+        self.last_messages = []
+
+        self._stock_signature = newest
+        self.stock_file = os.path.basename(path)
+
+        # Планировщик удерживает ссылку на свою версию, чтобы она не была вытеснена
+        self.registry.acquire(job.version, self.HOLDER_ID)
+        self.version = job.version
+        self.last_refresh = datetime.now()
+        return True
+
+
+@st.cache_resource
+def get_auto_refresh_scheduler():
+    """Планировщик автообновления (запускается, если заданы DDMRP_MATRIX_URL и DDMRP_STOCK_DIR)"""
+    if not AUTO_REFRESH_MATRIX_URL or not AUTO_REFRESH_STOCK_DIR:
+        return None
+
+    return AutoRefreshScheduler(
+        get_dataset_registry(),
+        get_pipeline_worker(),
+        AUTO_REFRESH_MATRIX_URL,
+        AUTO_REFRESH_STOCK_DIR
+    ).start()
+
+
+def run_auto_refresh_service():
+    """Автообновление отдельным процессом: python app.py --auto-refresh
+
+    Внутри Streamlit планировщик стартует при первом открытии страницы; отдельный процесс
+    считает по расписанию без единой сессии. Результат публикуется в общие наборы
+    (DDMRP_SHARED_DIR) - процессы Streamlit подключают текущую версию без расчета.
+    Возвращает код завершения процесса
+    """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    if not AUTO_REFRESH_MATRIX_URL or not AUTO_REFRESH_STOCK_DIR:
+        LOGGER.error("Для автообновления задайте DDMRP_MATRIX_URL и DDMRP_STOCK_DIR")
+        return 2
+
+    if get_shared_datasets() is None:
+        LOGGER.error("Отдельному процессу автообновления нужен DDMRP_SHARED_DIR (и pyarrow): "
+                     "иначе результат не увидит ни один процесс Streamlit")
+        return 2
+
+    scheduler = AutoRefreshScheduler(
+        DatasetRegistry(),
+        PipelineWorker(max_workers=1),
+        AUTO_REFRESH_MATRIX_URL,
+        AUTO_REFRESH_STOCK_DIR
+    )
+    LOGGER.info("Автообновление: матрица раз в %.0f мин, остатки из %s",
+                scheduler.refresh_seconds / 60, AUTO_REFRESH_STOCK_DIR)
+
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        scheduler.stop()
+    return 0
+
+
+# ========================
+# HTTP API
+# ========================
+
+# Адрес локального API (сервис не запускается, если порт не задан)
+API_HOST = os.environ.get('DDMRP_API_HOST', '127.0.0.1')
+API_PORT = os.environ.get('DDMRP_API_PORT', '')
+
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 5000
+
+# Кэш готовых ответов: предел числа записей и суммарного объема тел
+API_CACHE_ENTRIES = 256
+API_CACHE_BYTES = 64 * 1024 ** 2
+
+# Для скольких версий хранятся индексы артикулов
+API_ARTICLE_INDEX_VERSIONS = 4
+
+JSON_MIME = 'application/json; charset=utf-8'
+ARROW_MIME = 'application/vnd.apache.arrow.stream'
+
+
+class ApiError(Exception):
+    """Ошибка запроса к API: HTTP-статус и сообщение для клиента"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class ArticleIndex:
+    """Индекс артикул -> позиции строк (бинарный поиск по отсортированным артикулам)
+
+    Позиции внутри артикула возрастают, поэтому ограничение магазином - еще один
+    бинарный поиск по диапазону строк магазина из StoreIndex.
+    """
+
+    def __init__(self, df):
+        series = df['Article']
+        if series.hasnans:
+            series = series.astype(object).where(series.notna(), '')
+
+        codes, uniques = pd.factorize(series.astype(str), sort=True)
+        self.articles = np.asarray(uniques, dtype=object)
+        self.order = np.argsort(codes, kind='stable').astype(np.int32)
+        self.bounds = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(uniques)))))
+
+    def positions(self, article, row_range=None):
+        i = int(np.searchsorted(self.articles, article))
+        if i >= len(self.articles) or self.articles[i] != article:
+            return self.order[:0]
+
+        positions = self.order[self.bounds[i]:self.bounds[i + 1]]
+        if row_range is not None:
+            start, stop = np.searchsorted(positions, row_range)
+            positions = positions[start:stop]
+        return positions
+
+
+def arrow_ipc_bytes(df):
+    """DataFrame -> поток Arrow IPC (pyarrow загружается при первом запросе в Arrow)"""
+    try:
+        pa = importlib.import_module('pyarrow')
+    except ImportError:
+        raise ApiError(406, "Формат Arrow недоступен: не установлен pyarrow")
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def api_int_param(params, name, default):
+    value = params.get(name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise ApiError(400, f"Параметр {name} должен быть целым числом больше 0")
+    return number
+
+
+def api_list_param(params, name):
+    """Значения параметра через запятую (store=6,9)"""
+    return [value.strip() for value in params.get(name, '').split(',') if value.strip()]
+
+
+class DatasetApi:
+    """Обработчик запросов API поверх общего реестра наборов данных
+
+    Ответ (JSON или Arrow IPC) строится по опубликованной версии и кэшируется по ключу
+    (версия, маршрут, параметры, формат). Версия - хэш содержимого, поэтому ответ на ключ
+    не меняется: ETag выводится из ключа, и запрос с If-None-Match получает 304 без
+    обращения к данным.
+    """
+
+    ROUTES = {
+        '/api/version': '_version_route',
+        '/api/stores': '_stores_route',
+        '/api/orders': '_orders_route',
+        '/api/buffers': '_buffers_route',
+        '/api/sku': '_sku_route'
+    }
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._article_indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def handle(self, path, query, accept='', if_none_match=None):
+        """Ответ на GET-запрос: (статус, заголовки, тело)"""
+        try:
+            route = self.ROUTES.get(path.rstrip('/'))
+            if route is None:
+                raise ApiError(404, f"Неизвестный маршрут {path}. Доступны: {', '.join(self.ROUTES)}")
+
+            params = {name: values[-1] for name, values in query.items()}
+            response_format = self._response_format(params.pop('format', None), accept)
+            entry = self._entry(params.pop('version', None))
+
+            key = (entry.version, route, tuple(sorted(params.items())), response_format)
+            etag = '"{}-{}"'.format(
+                entry.version, hashlib.blake2b(repr(key).encode('utf-8'), digest_size=8).hexdigest()
+            )
+            headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'X-Dataset-Version': entry.version}
+
+            if if_none_match is not None and (if_none_match.strip() == '*' or etag in if_none_match):
+                CACHE_REQUESTS.inc(cache='api_response', result='hit')
+                return 304, headers, b''
+
+            with self._lock:
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+
+            CACHE_REQUESTS.inc(cache='api_response', result='miss' if cached is None else 'hit')
+            if cached is None:
+                frame, meta = getattr(self, route)(entry, params)
+                cached = self._render(frame, dict(version=entry.version, **meta), response_format)
+                self._remember(key, cached)
+
+            content_type, body, extra_headers = cached
+            headers.update(extra_headers)
+            headers['Content-Type'] = content_type
+            return 200, headers, body
+
+        except ApiError as e:
+            return e.status, {'Content-Type': JSON_MIME}, self._error_body(e.message)
+        except Exception as e:
+            return 500, {'Content-Type': JSON_MIME}, self._error_body(f"Ошибка обработки запроса: {str(e)}")
+
+    @staticmethod
+    def _error_body(message):
+        return json.dumps({'error': message}, ensure_ascii=False).encode('utf-8')
+
+    @staticmethod
+    def _response_format(requested, accept):
+        """Формат ответа: параметр format, иначе заголовок Accept (по умолчанию JSON)"""
+        if requested is None:
+            return 'arrow' if ARROW_MIME in (accept or '') else 'json'
+        if requested not in ('json', 'arrow'):
+            raise ApiError(400, "Параметр format: json или arrow")
+        return requested
+
+    def _entry(self, version):
+        entry = self.registry.latest() if version is None else self.registry.get(version)
+        if entry is None:
+            if version is None:
+                raise ApiError(503, "Данные еще не рассчитаны")
+            raise ApiError(404, f"Версия {version} не найдена (вытеснена из реестра)")
+        return entry
+
+    def _render(self, frame, meta, response_format):
+        """Тело ответа; для Arrow метаданные страницы передаются заголовками"""
+        extra_headers = {}
+        if 'total' in meta:
+            extra_headers = {
+                'X-Total-Count': str(meta['total']),
+                'X-Page': str(meta['page']),
+                'X-Page-Size': str(meta['page_size'])
+            }
+
+        if response_format == 'arrow':
+            return ARROW_MIME, arrow_ipc_bytes(frame), extra_headers
+
+        # Страница сериализуется векторно (to_json), обертка - готовой строкой без повторного разбора
+        head = json.dumps(meta, ensure_ascii=False)
+        records = frame.to_json(orient='records', force_ascii=False, date_format='iso')
+        body = f'{head[:-1]}, "items": {records}}}'.encode('utf-8')
+        return JSON_MIME, body, extra_headers
+
+    def _remember(self, key, response):
+        size = len(response[1])
+        if size > API_CACHE_BYTES:
+            return
+
+        with self._lock:
+            if key in self._cache:
+                return
+            self._cache[key] = response
+            self._cache_bytes += size
+            while len(self._cache) > API_CACHE_ENTRIES or self._cache_bytes > API_CACHE_BYTES:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted[1])
+
+    def _article_index(self, entry):
+        with self._lock:
+            index = self._article_indexes.get(entry.version)
+            if index is not None:
+                self._article_indexes.move_to_end(entry.version)
+                return index
+
+        index = ArticleIndex(entry['ddmrp_df'])
+
+        with self._lock:
+            self._article_indexes[entry.version] = index
+            while len(self._article_indexes) > API_ARTICLE_INDEX_VERSIONS:
+                self._article_indexes.popitem(last=False)
+        return index
+
+    @staticmethod
+    def _page(df, params, positions=None):
+        """Страница строк df (или строк по позициям) и метаданные пагинации"""
+        page = api_int_param(params, 'page', 1)
+        page_size = min(api_int_param(params, 'page_size', API_PAGE_SIZE), API_MAX_PAGE_SIZE)
+
+        total = len(df) if positions is None else len(positions)
+        start = (page - 1) * page_size
+
+        if positions is None:
+            rows = df.iloc[start:start + page_size]
+        else:
+            rows = df.take(positions[start:start + page_size])
+
+        meta = {'page': page, 'page_size': page_size, 'total': total, 'pages': -(-total // page_size)}
+        return rows, meta
+
+    @staticmethod
+    def _filter_positions(entry, filter_name, params):
+        """Позиции по фильтрам store и status через битовый индекс версии"""
+        criteria = {}
+        stores = api_list_param(params, 'store')
+        statuses = [status.upper() for status in api_list_param(params, 'status')]
+        if stores:
+            criteria['Store_ID'] = stores
+        if statuses:
+            criteria['Buffer_Status'] = statuses
+        return entry[filter_name].select(criteria)
+
+    def _version_route(self, entry, params):
+        stats = entry['store_index']
+        frame = pd.DataFrame([{
+            'version': entry.version,
+            'created_at': entry.created_at.isoformat(timespec='seconds'),
+            'positions': len(entry['ddmrp_df']),
+            'orders': len(entry['orders_df']),
+            'stores': len(stats.stores)
+        }])
+        return frame, {}
+
+    def _stores_route(self, entry, params):
+        metrics = entry['store_index'].metrics.reset_index()
+        stores = api_list_param(params, 'store')
+        if stores:
+            metrics = metrics[metrics['Store_ID'].isin(stores)]
+        return self._page(metrics, params)
+
+    def _orders_route(self, entry, params):
+        positions = self._filter_positions(entry, 'orders_filter', params)
+        return self._page(entry['orders_df'], params, positions)
+
+    def _buffers_route(self, entry, params):
+        positions = self._filter_positions(entry, 'ddmrp_filter', params)
+        return self._page(entry['ddmrp_df'], params, positions)
+
+    def _sku_route(self, entry, params):
+        article = params.get('article', '').strip()
+        if not article:
+            raise ApiError(400, "Не указан параметр article")
+
+        row_range = None
+        store = params.get('store', '').strip()
+        if store:
+            row_range = entry['store_index'].ranges.get(store, (0, 0))
+
+        positions = self._article_index(entry).positions(article, row_range)
+        if len(positions) == 0:
+            raise ApiError(404, f"Артикул {article} не найден")
+
+        return self._page(entry['ddmrp_df'], params, positions)
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    """HTTP-обработчик: разбор URL и передача запроса в DatasetApi сервера"""
+
+    # Keep-alive: клиент отправляет серию запросов по одному соединению
+    protocol_version = 'HTTP/1.1'
+    server_version = 'DDMRP-API'
+
+    # Заголовки и тело уходят отдельными записями: без TCP_NODELAY небольшие ответы
+    # ждут отложенного ACK клиента (~40 мс на запрос)
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        status, headers, body = self.server.api.handle(
+            url.path,
+            parse_qs(url.query),
+            self.headers.get('Accept', ''),
+            self.headers.get('If-None-Match')
+        )
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Журнал каждого запроса не выводится в консоль Streamlit
+        pass
+
+
+class ApiServer(ThreadingHTTPServer):
+    """HTTP-сервер API в фоновом потоке процесса Streamlit (общий реестр данных)
+
+    api - обработчик с методом handle(path, query, accept, if_none_match), base_path - корень его маршрутов
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, api, base_path='/api'):
+        super().__init__(address, ApiRequestHandler)
+        self.api = api
+        self.base_path = base_path
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name=f"ddmrp{self.base_path.replace('/', '-')}", daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{self.base_path}"
+
+
+def start_local_server(title, address, api, base_path):
+    """Запуск HTTP-сервиса в фоне; None, если порт занят
+
+    Порт может быть занят другим процессом сервера на той же машине (несколько процессов
+    Streamlit за балансировщиком) - сервис тогда отвечает из того процесса, а страница
+    этого процесса работает без него. Ошибка пишется в журнал процесса
+    """
+    try:
+        return ApiServer(address, api, base_path=base_path).start()
+    except OSError as e:
+        LOGGER.warning("%s не запущен на %s:%s: %s", title, address[0], address[1], e)
+        return None
+
+
+@st.cache_resource
+def get_api_server():
+    """Локальный HTTP API (запускается, если задан DDMRP_API_PORT)"""
+    if not API_PORT:
+        return None
+
+    return start_local_server("HTTP API", (API_HOST, int(API_PORT)), DatasetApi(get_dataset_registry()), '/api')
+
+
+class MetricsApi:
+    """Выдача метрик процесса в текстовом формате Prometheus (GET /metrics)"""
+
+    PATH = '/metrics'
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def handle(self, path, query, accept='', if_none_match=None):
+        if path.rstrip('/') != self.PATH:
+            body = f"Неизвестный маршрут {path}. Доступен: {self.PATH}\n".encode('utf-8')
+            return 404, {'Content-Type': PROMETHEUS_MIME}, body
+
+        return 200, {'Content-Type': PROMETHEUS_MIME, 'Cache-Control': 'no-cache'}, self.metrics.render()
+
+
+@st.cache_resource
+def get_metrics_server():
+    """Эндпоинт метрик Prometheus (запускается, если задан DDMRP_METRICS_PORT)"""
+    if not METRICS_PORT:
+        return None
+
+    return start_local_server(
+        "Эндпоинт метрик", (METRICS_HOST, int(METRICS_PORT)), MetricsApi(get_metrics_registry()), MetricsApi.PATH
+    )
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def cached_dc_allocation(version, dc_bytes, dc_name):
+    """Распределение остатка РЦ для версии данных (кэш по версии и содержимому файла РЦ)"""
+    entry = get_dataset_registry().get(version)
+    dc_file = BytesIO(dc_bytes)
+    dc_file.name = dc_name
+    dc_stock_df = load_dc_stock_file(dc_file)
+
+    if entry is None or dc_stock_df is None:
+        return pd.DataFrame(), pd.DataFrame()
+
+    return allocate_dc_stock(entry['ddmrp_df'], dc_stock_df)
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def cached_dc_rollup(version, hierarchy_bytes, buffers_bytes=None):
+    """Потребность и заказы РЦ для версии данных (кэш по версии и содержимому файлов)"""
+    entry = get_dataset_registry().get(version)
+    hierarchy_df = load_dc_hierarchy_file(BytesIO(hierarchy_bytes))
+    dc_buffers_df = load_dc_buffers_file(BytesIO(buffers_bytes)) if buffers_bytes is not None else None
+
+    if entry is None or hierarchy_df is None:
+        return pd.DataFrame()
+
+    return rollup_to_dc(entry['ddmrp_df'], hierarchy_df, dc_buffers_df)
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def cached_stockout_simulation(version, horizon_days, n_scenarios, lead_time_days, demand_cv):
+    """Симуляция риска дефицита для версии данных (кэш по версии и параметрам)"""
+    entry = get_dataset_registry().get(version)
+
+    if entry is None:
+        return pd.DataFrame()
+
+    # Фиксированное зерно - одинаковые параметры дают одинаковый результат
+    return simulate_stockout_risk(
+        entry['ddmrp_df'], horizon_days, n_scenarios, lead_time_days, demand_cv, seed=0
+    )
+
+
+# ========================
+# TAB 1: ЗАКАЗЫ
+# ========================
+
+@st.fragment
+def render_orders_tab(entry):
+    """Вкладка "Заказы": фильтры, таблица, топ заказов, распределение остатка РЦ и заказы РЦ"""
+    orders_df = entry['orders_df']
+    dc_stock_file = st.session_state.get('dc_stock_file')
+    dc_hierarchy_file = st.session_state.get('dc_hierarchy_file')
+
+    st.subheader("📋 Список товаров для заказа")
+    
+    if not orders_df.empty:
+        # Фильтры (варианты и выборка - из битового индекса заказов)
+        orders_filter = entry['orders_filter']
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            selected_stores = st.multiselect(
+                "Фильтр по магазинам:",
+                options=orders_filter.values('Store_ID'),
+                default=orders_filter.values('Store_ID')
+            )
+        
+        with col2:
+            selected_status = st.multiselect(
+                "Фильтр по статусу:",
+                options=['RED', 'YELLOW'],
+                default=['RED', 'YELLOW']
+            )
+        
+        # Применение фильтров
+        filtered_orders = orders_filter.filter(orders_df, {
+            'Store_ID': selected_stores,
+            'Buffer_Status': selected_status
+        })
+        
+        st.dataframe(
+            filtered_orders,
+            width='stretch',
+            hide_index=True
+        )
+        
+        # Скачивание
+        render_excel_download(filtered_orders, f"orders_{datetime.now().strftime('%Y%m%d')}.xlsx", key='download_orders')
+        
+        # Самые срочные строки - частичный отбор по глубине проникновения в буфер
+        st.markdown("---")
+        st.subheader(f"🚨 Топ-{URGENT_TOP_N} самых срочных заказов")
+        st.caption("Buffer_Penetration: 0% - верх желтой зоны, 100% - верх красной, 200% - нулевой остаток")
+        st.dataframe(top_urgent_orders(filtered_orders), width='stretch', hide_index=True)
+        
+        # График топ заказов
+        st.markdown("---")
+        fig = create_top_orders_chart(filtered_orders)
+        if fig:
+            st.plotly_chart(fig, width='stretch')
+        
+        # Распределение ограниченного остатка РЦ
+        if dc_stock_file is not None:
+            st.markdown("---")
+            st.subheader("🏭 Распределение остатка РЦ")
+            
+            allocation, allocation_summary = cached_dc_allocation(
+                entry.version, dc_stock_file.getvalue(), dc_stock_file.name
+            )
+            
+            if not allocation.empty:
+                short_articles = int((allocation_summary['Fill_Rate_Percent'] < 100).sum())
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("Запрошено (шт)", f"{allocation['Requested_Qty'].sum():,.0f}")
+                with col2:
+                    st.metric("Распределено (шт)", f"{allocation['Allocated_Qty'].sum():,.0f}")
+                with col3:
+                    st.metric("Артикулов с дефицитом", short_articles)
+                
+                st.dataframe(allocation, width='stretch', hide_index=True)
+                render_excel_download(allocation, f"allocated_orders_{datetime.now().strftime('%Y%m%d')}.xlsx", key='download_allocation')
+        
+    else:
+        st.success("🎉 Все товары в норме! Заказов не требуется.")
+    
+    # Потребность РЦ: свертка заказов магазинов по иерархии и заказы РЦ по его буферам
+    if dc_hierarchy_file is not None:
+        st.markdown("---")
+        st.subheader("🏭 Потребность и заказы РЦ")
+        st.caption("Чистый поток РЦ = остаток РЦ - заказы магазинов; заказ РЦ = Top_of_Green - чистый поток (RED/YELLOW)")
+        
+        dc_buffers_file = st.session_state.get('dc_buffers_file')
+        dc_rollup = cached_dc_rollup(
+            entry.version,
+            dc_hierarchy_file.getvalue(),
+            dc_buffers_file.getvalue() if dc_buffers_file is not None else None
+        )
+        
+        if not dc_rollup.empty:
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("РЦ", dc_rollup['DC_ID'].nunique())
+            with col2:
+                st.metric("Заказы магазинов (шт)", f"{dc_rollup['Store_Order_Qty'].sum():,.0f}")
+            with col3:
+                st.metric("Заказы РЦ (шт)", f"{dc_rollup['DC_Order_Qty'].sum():,.0f}")
+            
+            st.dataframe(dc_rollup, width='stretch', hide_index=True)
+            render_excel_download(dc_rollup, f"dc_requirements_{datetime.now().strftime('%Y%m%d')}.xlsx", key='download_dc_rollup')
+
+
+# ========================
+# TAB 2: ВСЕ ТОВАРЫ
+# ========================
+
+@st.fragment
+def render_all_items_tab(entry):
+    """Вкладка "Все товары": фильтры по битовому индексу и поиск"""
+    ddmrp_df = entry['ddmrp_df']
+
+    st.subheader("📊 Полный список товаров и статусы буферов")
+    
+    # Фильтры (варианты и выборка - из битового индекса набора)
+    ddmrp_filter = entry['ddmrp_filter']
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        filter_stores = st.multiselect(
+            "Магазины:",
+            options=ddmrp_filter.values('Store_ID'),
+            default=ddmrp_filter.values('Store_ID'),
+            key='all_stores'
+        )
+    
+    with col2:
+        filter_status = st.multiselect(
+            "Статус буфера:",
+            options=['RED', 'YELLOW', 'GREEN', 'EXCESS'],
+            default=['RED', 'YELLOW', 'GREEN', 'EXCESS'],
+            key='all_status'
+        )
+    
+    with col3:
+        search_article = st.text_input("Поиск по артикулу/описанию:")
+    
+    criteria = {
+        'Store_ID': filter_stores,
+        'Buffer_Status': filter_status
+    }
+    
+    # Дополнительные фильтры по классификаторам товара
+    extra_filters = [
+        (column, label) for column, label in
+        [('ABC_Class', "ABC-класс:"), ('Segment', "Сегмент:"), ('Brand', "Бренд:")]
+        if ddmrp_filter.values(column)
+    ]
+    if extra_filters:
+        with st.expander("🔎 Дополнительные фильтры"):
+            extra_cols = st.columns(len(extra_filters))
+            for extra_col, (column, label) in zip(extra_cols, extra_filters):
+                with extra_col:
+                    criteria[column] = st.multiselect(
+                        label,
+                        options=ddmrp_filter.values(column),
+                        default=ddmrp_filter.values(column),
+                        key=f'all_{column}'
+                    )
+    
+    # Применение фильтров
+    filtered_all = ddmrp_filter.filter(ddmrp_df, criteria)
+    
+    if search_article:
+        filtered_all = filtered_all[
+            filtered_all['Article'].str.contains(search_article, case=False, na=False) |
+            filtered_all['Describe'].str.contains(search_article, case=False, na=False)
+        ]
+    
+    # Границы зон не хранятся в наборе - добавляются только к показываемому срезу
+    filtered_all = with_zone_boundaries(filtered_all)
+    
+    st.dataframe(
+        filtered_all,
+        width='stretch',
+        hide_index=True
+    )
+    
+    render_excel_download(filtered_all, f"all_items_{datetime.now().strftime('%Y%m%d')}.xlsx", key='download_all_items')
+
+
+# ========================
+# TAB 3: ПО МАГАЗИНАМ
+# ========================
+
+@st.fragment
+def render_store_tab(entry):
+    """Вкладка "По магазинам": срез магазина из индекса"""
+    ddmrp_df = entry['ddmrp_df']
+
+    st.subheader("🏪 Анализ по магазинам")
+    
+    # Выбор магазина (список и метрики магазинов рассчитаны при загрузке)
+    store_index = entry['store_index']
+    selected_store = st.selectbox(
+        "Выберите магазин:",
+        options=store_index.stores
+    )
+    
+    store_data = with_zone_boundaries(store_index.slice(ddmrp_df, selected_store))
+    store_metrics = store_index.store_metrics(selected_store)
+    
+    # Метрики магазина
+    col1, col2, col3, col4, col5 = st.columns(5)
+    
+    with col1:
+        st.metric("Всего SKU", int(store_metrics['SKU']))
+    
+    with col2:
+        st.metric("🔴 Критичных", int(store_metrics['RED']))
+    
+    with col3:
+        st.metric("🟡 Требуют заказа", int(store_metrics['YELLOW']))
+    
+    with col4:
+        st.metric("К заказу (шт)", int(store_metrics['Order_Qty']))
+    
+    with col5:
+        st.metric("💰 Остатки (₴)", f"{store_metrics['Stock_Value']:,.0f}")
+    
+    st.markdown("---")
+    
+    # Таблица товаров магазина
+    st.dataframe(
+        store_data,
+        width='stretch',
+        hide_index=True
+    )
+    
+    render_excel_download(store_data, f"store_{selected_store}_{datetime.now().strftime('%Y%m%d')}.xlsx", key='download_store')
+
+    # Самые срочные заказы магазина (отбор внутри диапазона магазина)
+    if store_metrics['Order_Qty'] > 0:
+        st.markdown("---")
+        st.subheader(f"🚨 Самые срочные заказы магазина (топ-{URGENT_TOP_N})")
+        st.dataframe(
+            top_urgent_by_store(ddmrp_df, store_index, stores=[selected_store]),
+            width='stretch',
+            hide_index=True
+        )
+
+
+# ========================
+# TAB 4: АНАЛИТИКА
+# ========================
+
+@st.fragment
+def render_analytics_tab(entry):
+    """Вкладка "Аналитика": графики по набору данных"""
+    ddmrp_df = entry['ddmrp_df']
+
+    st.subheader("📈 Аналитические графики")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        # График распределения статусов
+        fig1 = create_buffer_status_chart(ddmrp_df)
+        st.plotly_chart(fig1, width='stretch')
+    
+    with col2:
+        # График по магазинам
+        fig2 = create_store_summary_chart(ddmrp_df)
+        st.plotly_chart(fig2, width='stretch')
+    
+    # График стоимости остатков по магазинам
+    if 'Stock_Value' in ddmrp_df.columns:
+        st.markdown("---")
+        st.subheader("💰 Стоимость остатков по магазинам")
+        
+        store_value_summary = ddmrp_df.groupby('Store_ID')['Stock_Value'].sum().reset_index()
+        store_value_summary = store_value_summary.sort_values('Stock_Value', ascending=False)
+        
+        fig_value = px.bar(
+            store_value_summary,
+            x='Store_ID',
+            y='Stock_Value',
+            title='Стоимость остатков по магазинам (₴)',
+            labels={'Stock_Value': 'Сумма (₴)', 'Store_ID': 'Магазин'},
+            text='Stock_Value'
+        )
+        
+        fig_value.update_traces(texttemplate='%{text:,.0f}₴', textposition='outside')
+        fig_value.update_layout(xaxis_title='Магазин', yaxis_title='Стоимость остатков (₴)')
+        
+        st.plotly_chart(fig_value, width='stretch')
+        
+        # Таблица с детализацией
+        col1, col2 = st.columns(2)
+        with col1:
+            st.dataframe(
+                store_value_summary.style.format({'Stock_Value': '{:,.0f}₴'}),
+                width='stretch',
+                hide_index=True
+            )
+        
+        with col2:
+            total_value = store_value_summary['Stock_Value'].sum()
+            st.metric("💰 Общая сумма остатков", f"{total_value:,.0f}₴")
+            avg_value = store_value_summary['Stock_Value'].mean()
+            st.metric("📊 Средняя сумма на магазин", f"{avg_value:,.0f}₴")
+    
+    # Дополнительная аналитика
+    if 'ABC_Class' in ddmrp_df.columns:
+        st.markdown("---")
+        st.subheader("ABC-анализ")
+        
+        abc_status = ddmrp_df.groupby(['ABC_Class', 'Buffer_Status'], observed=True).size().reset_index(name='Count')
+        
+        fig3 = px.bar(
+            abc_status,
+            x='ABC_Class',
+            y='Count',
+            color='Buffer_Status',
+            title='Статусы буферов по ABC-классам',
+            color_discrete_map={
+                'RED': '#FF4444',
+                'YELLOW': '#FFD700',
+                'GREEN': '#44FF44',
+                'EXCESS': '#4444FF'
+            },
+            barmode='group'
+        )
+        
+        st.plotly_chart(fig3, width='stretch')
+
+
+# ========================
+# TAB: ТРЕНДЫ
+# ========================
+
+TREND_PERIODS = [30, 90, 180, 365]
+
+# Разрез тренда: подпись -> колонка агрегата (None - вся сеть)
+TREND_BREAKDOWNS = {'Сеть': None, 'Магазин': 'Store_ID', 'Сегмент': 'Segment', 'ABC-класс': 'ABC_Class'}
+
+TREND_CHARTS = {
+    'Red_Positions': "🔴 RED-позиции",
+    'Stock_Value': "💰 Стоимость остатков (₴)",
+    'Order_Qty': "📋 Объем заказов (шт)"
+}
+
+# Сколько рядов разреза показывается по умолчанию (крупнейшие по стоимости остатков)
+TREND_DEFAULT_SERIES = 5
+
+
+@st.fragment
+def trends_source():
+    """Источник рядов трендов: источник расчета сессии, иначе автообновления, иначе самый свежий"""
+    if 'dataset_version' in st.session_state and st.session_state.get('run_source'):
+        return st.session_state['run_source']
+
+    scheduler = get_auto_refresh_scheduler()
+    if scheduler is not None and scheduler.version is not None:
+        return run_source_key(scheduler.matrix_url, scheduler.stock_dir)
+
+    return get_daily_rollups().latest_source()
+
+
+def render_trends_tab(entry):
+    """Вкладка "Тренды": динамика по дневным агрегатам источника данных, без чтения снимков расчетов"""
+    st.subheader("📉 Динамика по дням")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        days = st.selectbox("Период:", options=TREND_PERIODS, index=1, format_func=lambda d: f"{d} дней")
+    with col2:
+        breakdown = st.selectbox("Разрез:", options=list(TREND_BREAKDOWNS))
+    with col3:
+        step = st.radio("Шаг:", options=["День", "Неделя"], horizontal=True)
+
+    source = trends_source()
+    rollups = get_daily_rollups().load(source, days) if source else pd.DataFrame()
+    if rollups.empty:
+        st.info("ℹ️ Дневных агрегатов пока нет - агрегат дня сохраняет каждый расчет")
+        return
+
+    dimension = TREND_BREAKDOWNS[breakdown]
+    if dimension is not None:
+        latest = rollups[rollups['Date'] == rollups['Date'].max()]
+        ranking = latest.groupby(dimension)['Stock_Value'].sum().sort_values(ascending=False)
+        selected = st.multiselect(
+            f"{breakdown}:",
+            options=sorted(rollups[dimension].unique()),
+            default=list(ranking.index[:TREND_DEFAULT_SERIES])
+        )
+        rollups = rollups[rollups[dimension].isin(selected)]
+
+    trend = rollup_trend(rollups, dimension, freq='W' if step == "Неделя" else 'D')
+    st.caption(f"Дней в истории: {rollups['Date'].nunique()}; строк агрегатов: {len(rollups):,}")
+
+    for measure, title in TREND_CHARTS.items():
+        fig = px.line(trend, x='Date', y=measure, color=dimension, title=title, markers=True)
+        fig.update_layout(xaxis_title='Дата', yaxis_title=None)
+        st.plotly_chart(fig, width='stretch')
+
+    render_excel_download(trend, f"trends_{datetime.now().strftime('%Y%m%d')}.xlsx", key='download_trends')
+
+
+# ========================
+# TAB: РИСК ДЕФИЦИТА
+# ========================
+
+@st.fragment
+def render_risk_tab(entry):
+    """Вкладка "Риск дефицита": параметры и результат симуляции"""
+    ddmrp_df = entry['ddmrp_df']
+
+    st.subheader("🎲 Риск дефицита (Монте-Карло)")
+    
+    if 'Avg_Daily_Usage' not in ddmrp_df.columns:
+        st.info("ℹ️ Для симуляции нужна колонка Avg_Daily_Usage в торговой матрице")
+    else:
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            horizon_days = st.number_input("Горизонт (дней)", min_value=1, max_value=90, value=14)
+        with col2:
+            n_scenarios = st.number_input("Сценариев", min_value=10, max_value=2000, value=200, step=10)
+        with col3:
+            lead_time_days = st.number_input("Срок поставки (дней)", min_value=0, max_value=90, value=3)
+        with col4:
+            demand_cv = st.number_input("Вариация спроса (CV)", min_value=0.0, max_value=3.0, value=0.5, step=0.1)
+        
+        if st.button("▶️ Запустить симуляцию"):
+            st.session_state['stockout_simulation'] = (
+                entry.version, int(horizon_days), int(n_scenarios), int(lead_time_days), float(demand_cv)
+            )
+        
+        params = st.session_state.get('stockout_simulation')
+        
+        if params is not None and params[0] == entry.version:
+            with st.spinner("Симуляция сценариев спроса..."):
+                risk_df = cached_stockout_simulation(*params)
+            
+            if not risk_df.empty:
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("Риск > 50% без заказа", int((risk_df['Stockout_Prob'] > 50).sum()))
+                with col2:
+                    st.metric("Риск > 50% с заказом", int((risk_df['Stockout_Prob_With_Order'] > 50).sum()))
+                with col3:
+                    st.metric("Ожидаемо дней дефицита (сумма)", f"{risk_df['Expected_Days_Short'].sum():,.0f}")
+                
+                top_risk = risk_df.sort_values(
+                    ['Stockout_Prob_With_Order', 'Stockout_Prob'], ascending=False
+                ).head(100)
+                st.dataframe(top_risk, width='stretch', hide_index=True)
+                render_excel_download(risk_df, f"stockout_risk_{datetime.now().strftime('%Y%m%d')}.xlsx", key='download_stockout_risk')
+
+
+# ========================
+# TAB 5: ДЕТАЛИ РАСЧЕТА
+# ========================
+
+@st.fragment
+def render_details_tab(entry):
+    """Вкладка "Детали расчета": методология DDMRP и отчет валидации данных"""
+    st.subheader("⚙️ Методология расчета DDMRP")
+    
+    st.markdown("""
+    ### Зоны буфера:
+    
+    - **🔴 Красная зона (Red Zone)**: Критический минимум запаса
+        - Ниже этого уровня - срочный заказ!
+        
+    - **🟡 Желтая зона (Yellow Zone)**: Зона пополнения
+        - Время сделать заказ
+        
+    - **🟢 Зеленая зона (Green Zone)**: Целевой запас
+        - Нормальный уровень запаса
+        
+    - **🔵 Излишек (Excess)**: Запас выше Top of Green
+        - Возможен избыточный запас
+    
+    ### Расчет Top of Green:
+    ```
+    Top of Green = Red Zone + Yellow Zone + Green Zone
+    ```
+    
+    ### Расчет количества для заказа:
+    ```
+    Order Qty = Top of Green - Current Stock
+    ```
+    (только для RED и YELLOW статусов)
+    
+    ### Приоритеты:
+    1. 🔴 RED - Максимальный приоритет
+    2. 🟡 YELLOW - Высокий приоритет
+    3. 🟢 GREEN - Норма (заказ не требуется)
+    4. 🔵 EXCESS - Излишек (заказ не требуется)
+    """)
+    
+    # Пример расчета
+    st.markdown("---")
+    st.subheader("📝 Пример расчета")
+    
+    example_data = {
+        'Параметр': ['Red Zone', 'Yellow Zone', 'Green Zone', 'Top of Green', 'Текущий остаток', 'Статус', 'К заказу'],
+        'Значение': ['10 шт', '20 шт', '30 шт', '60 шт', '15 шт', '🟡 YELLOW', '45 шт (60 - 15)']
+    }
+    
+    st.table(pd.DataFrame(example_data))
+    
+    # Отчет валидации загруженных данных
+    validation_df = entry['validation_df']
+    st.markdown("---")
+    st.subheader("🧪 Отчет валидации данных")
+    
+    if validation_df.empty:
+        st.success("✅ Нарушений в данных не найдено")
+    else:
+        st.caption("Sample_Rows - номера строк в исходном файле (с учетом строки заголовка)")
+        st.dataframe(validation_df, width='stretch', hide_index=True)
+        render_excel_download(validation_df, f"validation_{datetime.now().strftime('%Y%m%d')}.xlsx", key='download_validation')
+
+
+# ========================
+# TAB: ИЗМЕНЕНИЯ
+# ========================
+
+@st.fragment
+def render_changes_tab(entry):
+    """Вкладка "Изменения": переходы статусов и изменения заказов относительно прошлого расчета"""
+    st.subheader("🔁 Изменения относительно предыдущего расчета")
+
+    previous_version = entry['previous_version']
+    if previous_version is None:
+        st.info("ℹ️ Это первый сохраненный расчет - сравнивать пока не с чем")
+        return
+
+    transitions_df = entry['transitions_df']
+    order_delta_df = entry['order_delta_df']
+    st.caption(f"Предыдущий расчет: {previous_version}")
+
+    change_counts = order_delta_df['Change'].value_counts()
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        st.metric("🆕 Новые заказы", int(change_counts.get('NEW', 0)))
+    with col2:
+        st.metric("✏️ Измененные заказы", int(change_counts.get('CHANGED', 0)))
+    with col3:
+        st.metric("❌ Отмененные заказы", int(change_counts.get('CANCELLED', 0)))
+    with col4:
+        st.metric("📉 Ухудшение статуса", status_downgrades(transitions_df))
+    with col5:
+        st.metric("📦 Переход в избыток", status_excess_moves(transitions_df))
+
+    # Матрица переходов: строки - статус в прошлом расчете, колонки - текущий
+    st.markdown("---")
+    st.subheader("🔀 Переходы статусов буфера")
+    st.dataframe(transitions_df, width='stretch')
+
+    st.markdown("---")
+    st.subheader("📝 Изменения заказов")
+
+    if order_delta_df.empty:
+        st.success("✅ Заказы не изменились")
+        return
+
+    selected_changes = st.multiselect(
+        "Тип изменения:",
+        options=ORDER_CHANGES,
+        default=ORDER_CHANGES
+    )
+    filtered_delta = order_delta_df[order_delta_df['Change'].isin(selected_changes)]
+
+    st.dataframe(filtered_delta, width='stretch', hide_index=True)
+    render_excel_download(filtered_delta, f"order_delta_{datetime.now().strftime('%Y%m%d')}.xlsx", key='download_order_delta')
+
+
+# ========================
+# TAB: СВЕРКА
+# ========================
+
+# Разрезы сводки сверки: название -> колонка
+RECONCILIATION_BREAKDOWNS = {"Магазин": 'Store_ID', "Бренд": 'Brand'}
+
+RECONCILIATION_LABELS = {
+    'NOT_IN_MATRIX': "📦 Остаток вне матрицы",
+    'NO_STOCK': "🕳️ Нет остатков"
+}
+
+# Сколько строк сводки показывается на графике
+RECONCILIATION_CHART_ROWS = 20
+
+
+@st.fragment
+def render_reconciliation_tab(entry):
+    """Вкладка "Сверка": остатки вне матрицы и позиции матрицы без остатков"""
+    st.subheader("🧾 Сверка матрицы и остатков")
+
+    reconciliation_df = entry['reconciliation_df']
+    if reconciliation_df.empty:
+        st.success("✅ Все остатки есть в матрице, все позиции матрицы есть в остатках")
+        return
+
+    unlisted = reconciliation_df[reconciliation_df['Issue'] == 'NOT_IN_MATRIX']
+    missing = reconciliation_df[reconciliation_df['Issue'] == 'NO_STOCK']
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("📦 Остатки вне матрицы", f"{len(unlisted):,}")
+    with col2:
+        st.metric("💰 Их стоимость (₴)", f"{unlisted['Stock_Value'].sum():,.0f}")
+    with col3:
+        st.metric("🕳️ Позиции без остатков", f"{len(missing):,}")
+    with col4:
+        st.metric("📋 Заказ по ним (шт)", f"{missing['Order_Qty'].sum():,.0f}")
+
+    st.caption("Остатки вне матрицы не входят в расчет; для позиций без остатков остаток принят равным 0, "
+               "и заказ по ним может быть завышен")
+
+    st.markdown("---")
+    breakdown = st.radio("Разрез:", options=list(RECONCILIATION_BREAKDOWNS), horizontal=True)
+    summary = reconciliation_summary(reconciliation_df, RECONCILIATION_BREAKDOWNS[breakdown])
+
+    chart_data = summary.head(RECONCILIATION_CHART_ROWS).melt(
+        id_vars=RECONCILIATION_BREAKDOWNS[breakdown],
+        value_vars=['Not_In_Matrix', 'No_Stock'],
+        var_name='Issue', value_name='Positions'
+    )
+    fig = px.bar(
+        chart_data, x=RECONCILIATION_BREAKDOWNS[breakdown], y='Positions', color='Issue',
+        title=f"Расхождения: {breakdown.lower()} (топ {RECONCILIATION_CHART_ROWS})"
+    )
+    fig.update_layout(xaxis_title=breakdown, yaxis_title='Позиций', xaxis_type='category')
+    st.plotly_chart(fig, width='stretch')
+
+    st.dataframe(summary, width='stretch', hide_index=True)
+    render_excel_download(
+        summary, f"reconciliation_{RECONCILIATION_BREAKDOWNS[breakdown].lower()}_{datetime.now().strftime('%Y%m%d')}.xlsx",
+        key='download_reconciliation_summary'
+    )
+
+    st.markdown("---")
+    st.subheader("📝 Позиции")
+
+    selected_issues = st.multiselect(
+        "Вид расхождения:",
+        options=RECONCILIATION_ISSUES,
+        default=RECONCILIATION_ISSUES,
+        format_func=RECONCILIATION_LABELS.get
+    )
+    filtered = reconciliation_df[reconciliation_df['Issue'].isin(selected_issues)]
+
+    st.caption(f"Позиций: {len(filtered):,}")
+    st.dataframe(filtered, width='stretch', hide_index=True)
+    render_excel_download(filtered, f"reconciliation_{datetime.now().strftime('%Y%m%d')}.xlsx", key='download_reconciliation')
+
+
+# Вкладки главной страницы: заголовок -> функция отрисовки (фрагмент)
+MAIN_TABS = {
+    "📋 Заказы": render_orders_tab,
+    "📊 Все товары": render_all_items_tab,
+    "🏪 По магазинам": render_store_tab,
+    "📈 Аналитика": render_analytics_tab,
+    "📉 Тренды": render_trends_tab,
+    "🎲 Риск дефицита": render_risk_tab,
+    "🔁 Изменения": render_changes_tab,
+    "🧾 Сверка": render_reconciliation_tab,
+    "⚙️ Детали расчета": render_details_tab
+}
+
+
+# ========================
+# ПРОСМОТР НАБОРА SQL-ДВИЖКА
+# ========================
+
+SQL_PAGE_SIZES = [100, 500, 1000, 5000]
+
+
+def render_sql_metrics(dataset):
+    """Ключевые метрики из агрегатов БД (без загрузки набора в память)"""
+    summary = dataset.summary()
+    status_counts = summary['status_counts']
+
+    col1, col2, col3, col4, col5, col6 = st.columns(6)
+    col1.metric("📦 Всего позиций", dataset.rows['ddmrp'])
+    col2.metric("🔴 Критичных", int(status_counts.get('RED', 0)))
+    col3.metric("🟡 Требуют заказа", int(status_counts.get('YELLOW', 0)))
+    col4.metric("🟢 В норме", int(status_counts.get('GREEN', 0)))
+    col5.metric("📋 К заказу (шт)", f"{summary['order_qty']:,.0f}")
+    col6.metric("💰 Остатки (₴)", f"{summary['stock_value']:,.0f}")
+
+
+@st.fragment
+def render_sql_dataset(dataset):
+    """Постраничный просмотр заказов и буферов: в pandas читается только текущая страница"""
+    st.caption(
+        f"🗄️ Расчет во встроенной БД ({dataset.engine}): {dataset.rows['ddmrp']:,} позиций, "
+        f"{dataset.nbytes / 1024 ** 2:,.1f} МБ на диске"
+    )
+
+    tables = {"📋 Заказы": 'orders', "📊 Все товары": 'ddmrp'}
+    table = tables[st.radio("Таблица:", list(tables), horizontal=True, key='sql_table')]
+
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        filter_stores = st.multiselect(
+            "Магазины (пусто - все):",
+            options=dataset.store_metrics().index.tolist(),
+            key='sql_stores'
+        )
+    with col2:
+        filter_status = st.multiselect(
+            "Статус буфера (пусто - все):",
+            options=BUFFER_STATUSES,
+            key='sql_status'
+        )
+    with col3:
+        page_size = st.selectbox("Строк на странице:", SQL_PAGE_SIZES, key='sql_page_size')
+
+    criteria = {'Store_ID': filter_stores, 'Buffer_Status': filter_status}
+    total = dataset.count(table, criteria)
+    pages = max(1, -(-total // page_size))
+
+    page = st.number_input(f"Страница (из {pages:,}):", min_value=1, max_value=pages, value=1, key='sql_page')
+    page_df = dataset.page(table, criteria, (page - 1) * page_size, page_size)
+
+    st.caption(f"Найдено строк: {total:,}")
+    st.dataframe(page_df, width='stretch', hide_index=True)
+    render_excel_download(page_df, f"{table}_page{page}_{datetime.now().strftime('%Y%m%d')}.xlsx", key='download_sql_page')
+
+    with st.expander("🏪 Сводка по магазинам"):
+        st.dataframe(dataset.store_metrics().reset_index(), width='stretch', hide_index=True)
+
+    if dataset.validation_df is not None and not dataset.validation_df.empty:
+        with st.expander("🧪 Отчет валидации данных"):
+            st.dataframe(dataset.validation_df, width='stretch', hide_index=True)
+
+
+# ========================
+# STREAMLIT ИНТЕРФЕЙС
+# ========================
+
+def main():
+    st.set_page_config(**PAGE_CONFIG)
+
+    # Применение пользовательских стилей
+    apply_custom_styles()
+
+    st.title("📊 DDMRP: Система управления остатками")
+    st.markdown("**Динамическое управление буферами запасов по методологии DDMRP**")
+    st.markdown("---")
+    
+    # ========================
+    # БОКОВАЯ ПАНЕЛЬ
+    # ========================
+    st.sidebar.header("📂 Загрузка данных")
+    
+    # Google Sheets URL
+    google_sheet_url = st.sidebar.text_input(
+        "Google Sheets URL (торговая матрица):",
+        value="",
+        help="Ссылка на Google Sheets с торговой матрицей"
+    )
+    
+    # Загрузка файла остатков
+    uploaded_file = st.sidebar.file_uploader(
+        "Загрузите файл с остатками",
+        type=['xlsx', 'xls', 'csv', 'parquet', 'feather'],
+        help="Файл с фактическими остатками по магазинам"
+    )
+    
+    # Остатки распределительного центра для распределения дефицита
+    st.sidebar.file_uploader(
+        "Остатки РЦ (необязательно)",
+        type=['xlsx', 'xls', 'csv'],
+        help="Файл с доступным количеством на распределительном центре: Article, DC_Stock",
+        key='dc_stock_file'
+    )
+    
+    # Иерархия магазин -> РЦ и буферы РЦ для расчета потребности и заказов РЦ
+    st.sidebar.file_uploader(
+        "Иерархия магазин → РЦ (необязательно)",
+        type=['xlsx', 'xls', 'csv', 'parquet', 'feather'],
+        help="Какой РЦ снабжает магазин: Store_ID, DC_ID",
+        key='dc_hierarchy_file'
+    )
+    st.sidebar.file_uploader(
+        "Буферы РЦ (необязательно)",
+        type=['xlsx', 'xls', 'csv', 'parquet', 'feather'],
+        help="Зоны буфера РЦ по артикулу: DC_ID, Article, Red_Zone, Yellow_Zone, Green_Zone, DC_Stock",
+        key='dc_buffers_file'
+    )
+    
+    # Кнопка загрузки
+    load_button = st.sidebar.button("🔄 Загрузить и рассчитать", type="primary")
+    
+    st.sidebar.markdown("---")
+    st.sidebar.markdown("### 📖 Легенда статусов")
+    st.sidebar.markdown("🔴 **RED** - Критический уровень")
+    st.sidebar.markdown("🟡 **YELLOW** - Требуется заказ")
+    st.sidebar.markdown("🟢 **GREEN** - Норма")
+    st.sidebar.markdown("🔵 **EXCESS** - Излишек")
+
+    # Общий реестр данных: освобождаем версии закрытых сессий
+    registry = get_dataset_registry()
+    session_id = current_session_id()
+    prune_closed_sessions(registry)
+
+    # Автообновление по расписанию (если настроено)
+    scheduler = get_auto_refresh_scheduler()
+    if scheduler is not None:
+        st.sidebar.markdown("---")
+        st.sidebar.markdown("### 🔁 Автообновление")
+        st.sidebar.caption(
+            f"Каждые {scheduler.refresh_seconds / 60:.0f} мин, остатки: "
+            f"{scheduler.stock_file or 'нет файла'}"
+        )
+        if scheduler.last_check is not None:
+            st.sidebar.caption(f"Последняя проверка: {scheduler.last_check:%H:%M:%S}")
+        for level, message in scheduler.last_messages:
+            if level in ('error', 'warning'):
+                getattr(st.sidebar, level)(message)
+
+    registry_stats = registry.stats()
+    st.sidebar.markdown("---")
+    st.sidebar.caption(
+        f"💾 Данные на сервере: {registry_stats['versions']} верс., "
+        f"{registry_stats['total_bytes'] / 1024 ** 2:,.1f} МБ, сессий: {registry_stats['sessions']}"
+    )
+
+    api_server = get_api_server()
+    if api_server is not None:
+        st.sidebar.caption(f"🌐 API: {api_server.url}")
+
+    metrics_server = get_metrics_server()
+    if metrics_server is not None:
+        st.sidebar.caption(f"📈 Метрики: {metrics_server.url}")
+    
+    # ========================
+    # ЗАГРУЗКА И ОБРАБОТКА
+    # ========================
+    
+    if load_button:
+        if not google_sheet_url:
+            st.error("❌ Укажите URL Google Sheets")
+            return
+        
+        if uploaded_file is None:
+            st.error("❌ Загрузите файл с остатками")
+            return
+        
+        # Тяжелый расчет выполняется в фоновом пуле; повторный запуск страницы его не прерывает
+        stock_bytes = uploaded_file.getvalue()
+        if SQL_BACKEND:
+            # Данные больше памяти: расчет во встроенной БД на диске
+            job = get_pipeline_worker().submit(
+                'sql-' + pipeline_job_key(google_sheet_url, stock_bytes),
+                run_sql_pipeline_job,
+                get_sql_datasets(),
+                google_sheet_url,
+                stock_bytes
+            )
+        else:
+            job = get_pipeline_worker().submit(
+                pipeline_job_key(google_sheet_url, stock_bytes),
+                run_pipeline_job,
+                registry,
+                google_sheet_url,
+                stock_bytes,
+                uploaded_file.name,
+                owner=session_id
+            )
+        st.session_state['pipeline_job_id'] = job.id
+
+    # Прогресс фонового задания и сообщения завершенного расчета
+    if 'pipeline_job_id' in st.session_state:
+        render_pipeline_job()
+
+    render_messages(st.session_state.pop('pipeline_messages', []))
+    
+    # ========================
+    # ОТОБРАЖЕНИЕ РЕЗУЛЬТАТОВ
+    # ========================
+    
+    # Набор, рассчитанный SQL-движком, просматривается постранично из БД
+    sql_dataset = get_sql_datasets().get(st.session_state.get('dataset_version'))
+    if sql_dataset is not None:
+        st.sidebar.caption(f"🕒 Данные обновлены: {sql_dataset.created_at:%d.%m.%Y %H:%M}")
+        render_sql_metrics(sql_dataset)
+        st.markdown("---")
+        render_sql_dataset(sql_dataset)
+        return
+
+    entry = None
+    refreshed_at = None
+    shared = get_shared_datasets()
+    if 'dataset_version' in st.session_state:
+        entry = registry.acquire(st.session_state['dataset_version'], session_id)
+
+        # Версия могла быть рассчитана другим процессом сервера (например, после перезапуска)
+        if entry is None and attach_shared_dataset(registry, shared, st.session_state['dataset_version']):
+            entry = registry.acquire(st.session_state['dataset_version'], session_id)
+
+        if entry is None:
+            # Версия удалена из реестра (например, после перезапуска сервера)
+            del st.session_state['dataset_version']
+            st.session_state.pop('run_source', None)
+            st.warning("⚠️ Данные сессии устарели. Загрузите данные повторно")
+        else:
+            refreshed_at = entry.created_at
+
+    elif scheduler is not None and scheduler.version is not None:
+        # Без ручной загрузки сессия показывает данные, рассчитанные планировщиком заранее
+        entry = registry.acquire(scheduler.version, session_id)
+        refreshed_at = scheduler.last_refresh
+
+    else:
+        # Текущая версия, опубликованная любым процессом сервера, - без загрузки и расчета
+        shared_entry = attach_shared_dataset(registry, shared)
+        if shared_entry is not None:
+            entry = registry.acquire(shared_entry.version, session_id)
+            refreshed_at = entry.created_at if entry is not None else None
+
+    if refreshed_at is not None:
+        st.sidebar.caption(f"🕒 Данные обновлены: {refreshed_at:%d.%m.%Y %H:%M}")
+
+    if entry is not None:
+        ddmrp_df = entry['ddmrp_df']
+        orders_df = entry['orders_df']
+        
+        # ========================
+        # КЛЮЧЕВЫЕ МЕТРИКИ
+        # ========================
+        
+        col1, col2, col3, col4, col5, col6 = st.columns(6)
+        
+        # Счетчики статусов - один проход по категориальной колонке
+        status_counts = ddmrp_df['Buffer_Status'].value_counts()
+        
+        with col1:
+            total_items = len(ddmrp_df)
+            st.metric("📦 Всего позиций", total_items)
+        
+        with col2:
+            red_count = int(status_counts.get('RED', 0))
+            st.metric("🔴 Критичных", red_count)
+        
+        with col3:
+            yellow_count = int(status_counts.get('YELLOW', 0))
+            st.metric("🟡 Требуют заказа", yellow_count)
+        
+        with col4:
+            green_count = int(status_counts.get('GREEN', 0))
+            st.metric("🟢 В норме", green_count)
+        
+        with col5:
+            total_order_qty = orders_df['Order_Qty'].sum() if not orders_df.empty else 0
+            st.metric("📋 К заказу (шт)", f"{int(total_order_qty)}")
+        
+        with col6:
+            total_stock_value = ddmrp_df['Stock_Value'].sum() if 'Stock_Value' in ddmrp_df.columns else 0
+            st.metric("💰 Остатки (₴)", f"{total_stock_value:,.0f}")
+        
+        st.markdown("---")
+        
+        # ========================
+        # ВКЛАДКИ
+        # ========================
+        
+        # Вкладки ленивые: содержимое считается только для открытой вкладки, а каждая
+        # вкладка - фрагмент, ее фильтры перезапускают только саму вкладку
+        tabs = st.tabs(list(MAIN_TABS), key='main_tab', on_change='rerun')
+        
+        for tab, renderer in zip(tabs, MAIN_TABS.values()):
+            if tab.open:
+                with tab:
+                    renderer(entry)
+    
+    else:
+        # ========================
+        # НАЧАЛЬНЫЙ ЭКРАН
+        # ========================
+        st.info("👆 Загрузите данные через боковую панель для начала работы")
+        
+        with st.expander("📖 Инструкция по использованию"):
+            st.markdown("""
+            ### Как использовать систему:
+            
+            1. **Подготовьте торговую матрицу** в Google Sheets со следующими колонками:
+               - `Article` - Артикул товара ⚠️
+               - `Describe` - Описание товара ⚠️
+               - `Store_ID` - Номер магазина (6, 9, 10...) ⚠️
+               - `Red_Zone` - Красная зона (шт) ⚠️
+               - `Yellow_Zone` - Желтая зона (шт) ⚠️
+               - `Green_Zone` - Зеленая зона (шт) ⚠️
+               - `Brand` - Бренд (опционально)
+               - `Avg_Daily_Usage` - Средний расход/день (опционально)
+               - `ABC_Class` - ABC-класс (опционально)
+               - и другие...
+            
+            2. **Подготовьте файл остатков** (Excel, CSV, Parquet или Feather) с колонками:
+               - `Art` → будет переименовано в `Article` ⚠️
+               - `Magazin` → будет переименовано в `Store_ID` ⚠️
+               - `Describe` - Описание ⚠️
+               - `к-во` → будет переименовано в `Current_Stock` ⚠️
+               - `Model` - Модель (опционально)
+            
+            3. **Вставьте URL** Google Sheets в боковую панель
+            
+            4. **Загрузите файл** с остатками
+            
+            5. **Нажмите "Загрузить и рассчитать"**
+            
+            6. **Анализируйте результаты** во вкладках:
+               - 📋 Заказы - список товаров для заказа
+               - 📊 Все товары - полный список с буферами
+               - 🏪 По магазинам - анализ по каждому магазину
+               - 📈 Аналитика - графики и визуализация
+               - ⚙️ Детали расчета - методология DDMRP
+            
+            ### Преимущества DDMRP:
+            - ✅ Динамическое управление запасами
+            - ✅ Снижение дефицита и излишков
+            - ✅ Приоритизация заказов
+            - ✅ Визуализация статусов
+            - ✅ Автоматический расчет количества для заказа
+            """)
+        
+        with st.expander("🎯 Пример структуры данных"):
+            st.markdown("#### Торговая матрица (Google Sheets):")
+            # Markdown-таблицы: стартовый экран не загружает pandas и pyarrow
+            st.markdown("""
+            | Article | Describe | Store_ID | Red_Zone | Yellow_Zone | Green_Zone | Brand |
+            |---|---|---|---|---|---|---|
+            | ART001 | Молоко 3.2% 1л | 6 | 10 | 20 | 30 | Простоквашино |
+            | ART002 | Хлеб белый | 6 | 15 | 25 | 35 | Хлебный дом |
+            | ART003 | Масло сливочное | 9 | 5 | 10 | 15 | Вологодское |
+            """)
+            
+            st.markdown("#### Остатки (Excel, CSV, Parquet, Feather):")
+            st.markdown("""
+            | Art | Magazin | Describe | к-во | Model |
+            |---|---|---|---|---|
+            | ART001 | 6 | Молоко 3.2% 1л | 8 | VPL 932 |
+            | ART002 | 6 | Хлеб белый | 45 | RB 4534 |
+            | ART003 | 9 | Масло сливочное | 12 | VOL 123 |
+            """)
+
+
+if __name__ == "__main__":
+    if get_script_run_ctx() is None and '--auto-refresh' in sys.argv[1:]:
+        sys.exit(run_auto_refresh_service())
+    main()
@@ -0,0 +1,111 @@
+"""Бенчмарк локального HTTP API: пропускная способность и задержка запросов
+
+Запуск:
+    python benchmarks/bench_api.py --stores 100 --articles 500 --clients 8 --requests 2000
+
+Скрипт публикует синтетический набор в реестр данных, поднимает ApiServer на свободном
+порту и отправляет запросы из нескольких потоков-клиентов (keep-alive соединение на клиента).
+Отдельно измеряются первый запрос (построение ответа), повторные запросы (кэш ответов)
+и условные запросы с If-None-Match (304 без тела).
+"""
+
+import argparse
+import http.client
+import logging
+import statistics
+import sys
+import threading
+import time
+
+from synthetic import make_dataset
+
+import app
+
+# Название -> (путь, заголовки)
+SCENARIOS = [
+    ('Сводка магазинов', '/api/stores?page_size=500', {}),
+    ('Заказы RED, стр. 1', '/api/orders?status=RED&page_size=100', {}),
+    ('Буферы магазина', '/api/buffers?store=6&page_size=500', {}),
+    ('SKU по артикулу', '/api/sku?article=ART000042', {}),
+    ('Заказы (Arrow)', '/api/orders?page_size=1000', {'Accept': app.ARROW_MIME})
+]
+
+
+def request(connection, path, headers):
+    connection.request('GET', path, headers=headers)
+    response = connection.getresponse()
+    body = response.read()
+    return response.status, response.getheader('ETag'), body
+
+
+def run_clients(host, port, path, headers, clients, total_requests):
+    """Параллельные клиенты; результат - (запросов в секунду, задержки в мс)"""
+    per_client = max(1, total_requests // clients)
+    latencies = [[] for _ in range(clients)]
+
+    def client(samples):
+        connection = http.client.HTTPConnection(host, port)
+        for _ in range(per_client):
+            started = time.perf_counter()
+            request(connection, path, headers)
+            samples.append((time.perf_counter() - started) * 1000)
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=(samples,)) for samples in latencies]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    samples = sorted(sample for client_samples in latencies for sample in client_samples)
+    return len(samples) / elapsed, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stores', type=int, default=100)
+    parser.add_argument('--articles', type=int, default=500)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    matrix, stock = make_dataset(args.stores, args.articles)
+    version = app.dataset_version(matrix, stock)
+    _, ddmrp_df, orders_df = app.run_ddmrp_pipeline(matrix.copy(), stock)
+
+    registry = app.DatasetRegistry()
+    registry.publish(version, app.build_dataset_frames(matrix, stock, ddmrp_df, orders_df))
+
+    server = app.ApiServer(('127.0.0.1', 0), app.DatasetApi(registry)).start()
+    host, port = server.server_address[:2]
+
+    print(f"Набор: {len(ddmrp_df):,} позиций, {len(orders_df):,} заказов; API: {server.url}")
+    print(f"{'Сценарий':<24}{'первый, мс':>12}{'зап/с':>10}{'p50, мс':>10}{'p99, мс':>10}{'304 зап/с':>12}")
+
+    try:
+        for title, path, headers in SCENARIOS:
+            connection = http.client.HTTPConnection(host, port)
+            started = time.perf_counter()
+            status, etag, _ = request(connection, path, headers)
+            first = (time.perf_counter() - started) * 1000
+            connection.close()
+            assert status == 200, (path, status)
+
+            rps, samples = run_clients(host, port, path, headers, args.clients, args.requests)
+            conditional_rps, _ = run_clients(
+                host, port, path, dict(headers, **{'If-None-Match': etag}), args.clients, args.requests
+            )
+
+            p50 = statistics.median(samples)
+            p99 = samples[int(len(samples) * 0.99) - 1]
+            print(f"{title:<24}{first:>12.1f}{rps:>10.0f}{p50:>10.2f}{p99:>10.2f}{conditional_rps:>12.0f}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
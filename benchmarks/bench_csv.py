@@ -0,0 +1,108 @@
+"""Бенчмарк чтения торговой матрицы: разбор CSV по схеме против чтения с угадыванием типов
+
+Запуск:
+    python benchmarks/bench_csv.py --stores 2000 --articles 1000
+
+Синтетическая матрица записывается во временный CSV (с альтернативными названиями колонок
+и лишней колонкой, как в реальных таблицах) и читается так же, как при загрузке из
+Google Sheets: байты порциями через StreamPipe, затем validate_matrix. Режимы:
+    inference - прежнее чтение: pd.read_csv с угадыванием типов всех колонок и маппингом названий
+    pandas    - чтение по схеме парсером pandas (только колонки схемы, текст без угадывания)
+    pyarrow   - чтение по схеме многопоточным парсером pyarrow
+"""
+
+import argparse
+import io
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+from synthetic import make_dataset
+
+import app
+
+MODES = ['inference', 'pandas', 'pyarrow']
+
+
+def feed_pipe(data):
+    """Канал, в который байты файла пишутся порциями из другого потока (как при потоковой загрузке)"""
+    pipe = app.StreamPipe()
+
+    def feed():
+        for start in range(0, len(data), app.DOWNLOAD_CHUNK_BYTES):
+            if not pipe.feed(data[start:start + app.DOWNLOAD_CHUNK_BYTES]):
+                return
+        pipe.finish()
+
+    threading.Thread(target=feed, daemon=True).start()
+    return pipe
+
+
+def read_with_inference(pipe):
+    """Прежний разбор: все колонки, типы угадываются, названия приводятся после чтения"""
+    reader = io.BufferedReader(pipe, app.DOWNLOAD_CHUNK_BYTES)
+    with pd.read_csv(reader, chunksize=app.CSV_CHUNK_ROWS) as chunks:
+        df = pd.concat(list(chunks), ignore_index=True)
+    return app.normalize_matrix_columns(df)
+
+
+def run(mode, data):
+    pipe = feed_pipe(data)
+
+    started = time.perf_counter()
+    if mode == 'inference':
+        df = read_with_inference(pipe)
+    else:
+        app.CSV_ENGINE = mode
+        df = app.parse_csv_stream(pipe)
+    parsed = time.perf_counter()
+
+    with app.capture_messages([]):
+        df = app.validate_matrix(df, copy=False)
+    validated = time.perf_counter()
+
+    return parsed - started, validated - parsed, df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stores', type=int, default=2000)
+    parser.add_argument('--articles', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=2)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    matrix, _ = make_dataset(args.stores, args.articles)
+    matrix = matrix.rename(columns={'Article': 'Артикул', 'Store_ID': 'Магазин', 'Red_Zone': 'red_zone'})
+    matrix['Notes'] = 'комментарий'
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'matrix.csv')
+        matrix.to_csv(path, index=False)
+        with open(path, 'rb') as source:
+            data = source.read()
+
+    print(f"Матрица: {len(matrix):,} строк, CSV {len(data) / 1024 ** 2:,.0f} МБ")
+    print(f"{'Режим':<12}{'Разбор, с':>12}{'Валидация, с':>15}{'Всего, с':>11}{'Память, МБ':>13}")
+
+    baseline = None
+    for mode in MODES:
+        results = [run(mode, data) for _ in range(args.repeat)]
+        parse_seconds = min(result[0] for result in results)
+        validate_seconds = min(result[1] for result in results)
+        total = parse_seconds + validate_seconds
+        memory = app.dataset_memory_bytes(results[-1][2]) / 1024 ** 2
+        baseline = baseline or total
+
+        print(f"{mode:<12}{parse_seconds:>12.2f}{validate_seconds:>15.2f}{total:>11.2f}{memory:>13,.0f}"
+              f"   ×{baseline / total:.1f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Бенчмарк общих наборов: подключение опубликованного расчета в новом процессе сервера
+
+Запуск:
+    python benchmarks/bench_shared.py --stores 1000 --articles 1000 --processes 4
+
+Расчет публикуется один раз (SharedDatasetStore, файлы Arrow IPC), затем каждый из
+--processes новых процессов подключает текущую версию, как это делает процесс сервера.
+Для сравнения те же процессы читают расчет из Parquet (копия в памяти каждого процесса).
+Частная память (RssAnon) - данные, скопированные в процесс; отображенные файлы в нее не входят.
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic import REPO_ROOT, make_dataset
+
+import app
+
+ATTACH_PROBE = '''
+import json, sys, time
+sys.path.insert(0, {root!r})
+
+def anon_kb():
+    with open('/proc/self/status') as status:
+        return next(int(line.split()[1]) for line in status if line.startswith('RssAnon'))
+
+import pandas, pyarrow, app
+before = anon_kb()
+started = time.perf_counter()
+if {mode!r} == 'shared':
+    store = app.SharedDatasetStore({directory!r})
+    frames = store.attach(store.current())
+    ddmrp_df = frames['ddmrp_df']
+else:
+    ddmrp_df = pandas.read_parquet({parquet!r})
+elapsed = time.perf_counter() - started
+ddmrp_df['Stock_Value'].sum()
+ddmrp_df['Article'].str.len().max()
+print(json.dumps({{'seconds': elapsed, 'private_mb': (anon_kb() - before) / 1024, 'rows': len(ddmrp_df)}}))
+'''
+
+
+def probe(code):
+    completed = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stores', type=int, default=1000)
+    parser.add_argument('--articles', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--directory', default='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    matrix, stock = make_dataset(args.stores, args.articles)
+    with app.capture_messages([]):
+        _, ddmrp_df, orders_df = app.run_ddmrp_pipeline(matrix, stock)
+    frames = app.build_dataset_frames(matrix, stock, ddmrp_df, orders_df)
+
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        store = app.SharedDatasetStore(os.path.join(directory, 'shared'))
+        started = time.perf_counter()
+        store.publish(app.dataset_version(matrix, stock), frames)
+        print(f"Расчет: {len(ddmrp_df):,} позиций, публикация {time.perf_counter() - started:.2f} с")
+
+        parquet = os.path.join(directory, 'ddmrp.parquet')
+        ddmrp_df.to_parquet(parquet, index=False)
+
+        print(f"{'Режим':<10}{'Подключение, мс':>17}{'Частная память, МБ':>21}")
+        for mode in ['shared', 'parquet']:
+            code = ATTACH_PROBE.format(
+                root=REPO_ROOT, mode=mode, directory=store.directory, parquet=parquet
+            )
+            results = [probe(code) for _ in range(args.processes)]
+            seconds = min(result['seconds'] for result in results) * 1000
+            private = max(result['private_mb'] for result in results)
+            print(f"{mode:<10}{seconds:>17.1f}{private:>21,.0f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
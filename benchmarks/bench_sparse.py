@@ -0,0 +1,85 @@
+"""Бенчмарк разреженной матрицы: строки артикула '*' с переопределениями магазинов против полной
+
+Запуск:
+    python benchmarks/bench_sparse.py --stores 1000 --articles 1000 --overrides 0.05
+
+Разреженная матрица - строка '*' на артикул и --overrides доля пар (артикул, магазин) со своими
+зонами и расходом (остальные колонки пустые - наследуются). Полная матрица - та же матрица,
+записанная строкой на каждую пару. Обе записываются в CSV и читаются, как при загрузке из
+Google Sheets (parse_csv_stream, validate_matrix), затем рассчитываются; результаты сравниваются.
+"""
+
+import argparse
+import io
+import logging
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from synthetic import make_dataset
+
+import app
+
+OVERRIDE_COLUMNS = ['Red_Zone', 'Yellow_Zone', 'Green_Zone', 'Avg_Daily_Usage']
+
+
+def make_sparse(matrix, share, seed=0):
+    """Разреженная матрица и равная ей полная: значения по умолчанию - первый магазин артикула"""
+    rng = np.random.default_rng(seed)
+
+    defaults = matrix.drop_duplicates('Article').assign(Store_ID=app.MATRIX_DEFAULT_STORE)
+    overridden = rng.random(len(matrix)) < share
+
+    overrides = matrix.loc[overridden, ['Article', 'Store_ID'] + OVERRIDE_COLUMNS]
+    sparse = pd.concat([defaults, overrides], ignore_index=True)[matrix.columns]
+
+    dense = matrix.copy()
+    inherited = ~overridden
+    default_rows = defaults.set_index('Article').loc[dense.loc[inherited, 'Article']]
+    for column in OVERRIDE_COLUMNS:
+        dense.loc[inherited, column] = default_rows[column].to_numpy()
+
+    return sparse, dense
+
+
+def run(data, stock):
+    started = time.perf_counter()
+    with app.capture_messages([]):
+        matrix_df = app.validate_matrix(app.parse_csv_stream(io.BytesIO(data)), copy=False)
+        loaded = time.perf_counter()
+        ddmrp_df = app.calculate_ddmrp_status(matrix_df, stock)
+    finished = time.perf_counter()
+    return loaded - started, finished - loaded, app.dataset_memory_bytes(matrix_df), ddmrp_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stores', type=int, default=1000)
+    parser.add_argument('--articles', type=int, default=1000)
+    parser.add_argument('--overrides', type=float, default=0.05)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    matrix, stock = make_dataset(args.stores, args.articles)
+    sparse, dense = make_sparse(matrix, args.overrides)
+
+    print(f"Пары артикул × магазин: {len(dense):,}, переопределений: {len(sparse) - args.articles:,}")
+    print(f"{'Матрица':<12}{'Строк':>12}{'CSV, МБ':>10}{'Загрузка, с':>13}{'Расчет, с':>11}{'Память, МБ':>13}")
+
+    results = {}
+    for title, frame in [('dense', dense), ('sparse', sparse)]:
+        data = frame.to_csv(index=False).encode('utf-8')
+        load_seconds, calc_seconds, memory, ddmrp_df = run(data, stock)
+        results[title] = ddmrp_df.sort_values(['Article', 'Store_ID']).reset_index(drop=True)
+        print(f"{title:<12}{len(frame):>12,}{len(data) / 1024 ** 2:>10,.1f}{load_seconds:>13.2f}"
+              f"{calc_seconds:>11.2f}{memory / 1024 ** 2:>13,.0f}")
+
+    # Развертка разреженной матрицы должна давать тот же расчет
+    pd.testing.assert_frame_equal(results['sparse'], results['dense'], check_dtype=False)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Бенчмарк SQL-движка: время и пиковая память расчета в pandas и во встроенной БД
+
+Запуск:
+    python benchmarks/bench_sql.py --stores 200 --articles 5000 --engine sqlite
+
+Матрица записывается во временный CSV. Каждый режим выполняется в отдельном процессе;
+память - пик резидентной памяти во время расчета (опрос /proc, Linux) сверх объема после
+загрузки остатков.
+pandas читает CSV целиком, SQL-движок - порциями по CSV_CHUNK_ROWS строк. После расчета из БД читается одна страница, результаты
+сравниваются с pandas по сводке магазинов и первой странице заказов.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from synthetic import REPO_ROOT, make_dataset
+
+PROBE = '''
+import json, logging, resource, sys, threading, time
+logging.disable(logging.WARNING)
+sys.path.insert(0, {root!r})
+import pandas as pd
+import app
+
+def resident_mb():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize() / 1024 ** 2
+
+def sample_peak(state):
+    while not state['done']:
+        state['peak'] = max(state['peak'], resident_mb())
+        time.sleep(0.01)
+
+stock_df = pd.read_pickle({stock!r})
+baseline_mb = resident_mb()
+state = {{'peak': baseline_mb, 'done': False}}
+sampler = threading.Thread(target=sample_peak, args=(state,))
+sampler.start()
+started = time.perf_counter()
+with app.capture_messages([]):
+    if {mode!r} == 'pandas':
+        _, ddmrp_df, orders_df = app.run_ddmrp_pipeline(pd.read_csv({matrix!r}), stock_df)
+        metrics = app.StoreIndex(ddmrp_df).metrics
+        page = orders_df.iloc[:100]
+    else:
+        chunks = pd.read_csv({matrix!r}, chunksize=app.CSV_CHUNK_ROWS)
+        dataset = app.run_sql_pipeline(chunks, stock_df, engine={mode!r})
+        metrics = dataset.store_metrics()
+        page = dataset.page('orders', None, 0, 100)
+elapsed = time.perf_counter() - started
+state['done'] = True
+sampler.join()
+print(json.dumps({{
+    'seconds': elapsed,
+    'peak_mb': state['peak'] - baseline_mb,
+    'metrics': metrics.reset_index().to_json(orient='records'),
+    'page': page.reset_index(drop=True).to_json(orient='records')
+}}))
+'''
+
+
+def run(mode, matrix_path, stock_path):
+    completed = subprocess.run(
+        [sys.executable, '-c', PROBE.format(root=REPO_ROOT, mode=mode, matrix=matrix_path, stock=stock_path)],
+        capture_output=True, text=True, check=True, cwd=REPO_ROOT
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stores', type=int, default=200)
+    parser.add_argument('--articles', type=int, default=5000)
+    parser.add_argument('--engine', default='sqlite', choices=['sqlite', 'duckdb'])
+    args = parser.parse_args()
+
+    matrix, stock = make_dataset(args.stores, args.articles)
+
+    with tempfile.TemporaryDirectory() as directory:
+        matrix_path = os.path.join(directory, 'matrix.csv')
+        stock_path = os.path.join(directory, 'stock.pkl')
+        matrix.to_csv(matrix_path, index=False)
+        stock.to_pickle(stock_path)
+        del matrix, stock
+
+        print(f"Матрица: {args.stores * args.articles:,} строк, CSV {os.path.getsize(matrix_path) / 1024 ** 2:,.1f} МБ")
+
+        results = {mode: run(mode, matrix_path, stock_path) for mode in ['pandas', args.engine]}
+
+    for mode, result in results.items():
+        print(f"{mode:<10}{result['seconds']:>10.1f} с   прирост пика памяти {result['peak_mb']:>8,.0f} МБ")
+
+    same = all(results['pandas'][key] == results[args.engine][key] for key in ('metrics', 'page'))
+    print("Сводка магазинов и страница заказов совпадают" if same else "❌ Результаты различаются")
+    return 0 if same else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
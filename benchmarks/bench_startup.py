@@ -0,0 +1,79 @@
+"""Бенчмарк холодного старта: время импорта app.py и время до первого рендера
+
+Запуск:
+    python benchmarks/bench_startup.py --repeat 5
+
+Каждое измерение выполняется в новом процессе интерпретатора (холодный старт воркера).
+Первый рендер - прогон стартового экрана (без данных) через streamlit.testing (AppTest).
+Для каждого замера выводится, какие тяжелые зависимости оказались загружены.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from synthetic import REPO_ROOT
+
+HEAVY_MODULES = ['pandas', 'numpy', 'pyarrow', 'plotly.express', 'requests', 'openpyxl']
+
+IMPORT_PROBE = '''
+import json, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'modules': [m for m in {modules!r} if m in sys.modules]}}))
+'''
+
+RENDER_PROBE = '''
+import json, logging, sys, time
+logging.disable(logging.WARNING)
+from streamlit.testing.v1 import AppTest
+loaded_before = set(sys.modules)
+started = time.perf_counter()
+at = AppTest.from_file({script!r}, default_timeout=120).run()
+elapsed = time.perf_counter() - started
+assert not at.exception, [e.value for e in at.exception]
+print(json.dumps({{'seconds': elapsed, 'modules': [m for m in {modules!r} if m in sys.modules and m not in loaded_before]}}))
+'''
+
+
+def probe(code):
+    """Запуск замера в отдельном процессе; результат - JSON в последней строке вывода"""
+    completed = subprocess.run(
+        [sys.executable, '-c', code],
+        capture_output=True, text=True, check=True, cwd=REPO_ROOT
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def report(title, results):
+    seconds = [result['seconds'] * 1000 for result in results]
+    modules = ', '.join(results[-1]['modules']) or '-'
+    print(f"{title:<28}{statistics.median(seconds):>8.0f} мс (мин {min(seconds):.0f})   загружено: {modules}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    script = os.path.join(REPO_ROOT, 'app.py')
+
+    # Импорт самого streamlit - нижняя граница, ниже которой старт приложения не опустится
+    for title, module in [("Импорт streamlit (база)", 'streamlit'), ("Импорт app.py", 'app')]:
+        imports = [
+            probe(IMPORT_PROBE.format(root=REPO_ROOT, module=module, modules=HEAVY_MODULES))
+            for _ in range(args.repeat)
+        ]
+        report(title, imports)
+
+    renders = [probe(RENDER_PROBE.format(script=script, modules=HEAVY_MODULES)) for _ in range(args.repeat)]
+    report("Первый рендер (AppTest)", renders)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Бенчмарк загрузки остатков: одни и те же данные в Excel, CSV, Parquet и Feather
+
+Запуск:
+    python benchmarks/bench_stock.py --stores 1000 --articles 1000
+    python benchmarks/bench_stock.py --formats csv parquet feather
+
+Синтетические остатки (по умолчанию 1 млн строк) записываются в каждом формате с названиями
+колонок, как в выгрузках учетных систем (Art, Magazin, к-во), и лишней колонкой. Измеряется
+load_stock_file на байтах файла, как в фоновом задании: определение формата, разбор, маппинг
+колонок и валидация. Запись Excel на 1 млн строк занимает несколько минут.
+"""
+
+import argparse
+import io
+import logging
+import sys
+import time
+
+import pandas as pd
+
+from synthetic import make_dataset
+
+import app
+
+FORMATS = ['excel', 'csv', 'parquet', 'feather']
+
+
+def write_stock(stock, file_format):
+    """Байты файла остатков в заданном формате"""
+    output = io.BytesIO()
+    if file_format == 'excel':
+        stock.to_excel(output, index=False, engine='openpyxl')
+    elif file_format == 'csv':
+        stock.to_csv(output, index=False)
+    elif file_format == 'parquet':
+        stock.to_parquet(output, index=False)
+    else:
+        stock.to_feather(output)
+    return output.getvalue()
+
+
+def run(data):
+    started = time.perf_counter()
+    with app.capture_messages([]):
+        df = app.load_stock_file(io.BytesIO(data))
+    return time.perf_counter() - started, df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stores', type=int, default=1000)
+    parser.add_argument('--articles', type=int, default=1000)
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=FORMATS)
+    parser.add_argument('--repeat', type=int, default=2)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    _, stock = make_dataset(args.stores, args.articles)
+    stock = stock.rename(columns={'Article': 'Art', 'Store_ID': 'Magazin', 'Current_Stock': 'к-во'})
+    stock['Warehouse_Cell'] = 'A-01'
+
+    print(f"Остатки: {len(stock):,} строк")
+    print(f"{'Формат':<10}{'Файл, МБ':>10}{'Запись, с':>11}{'Загрузка, с':>13}")
+
+    baseline = None
+    reference = None
+    for file_format in args.formats:
+        started = time.perf_counter()
+        data = write_stock(stock, file_format)
+        written = time.perf_counter() - started
+
+        # Excel - одно измерение: повтор добавил бы минуты без уточнения результата
+        repeat = 1 if file_format == 'excel' else args.repeat
+        results = [run(data) for _ in range(repeat)]
+        seconds = min(result[0] for result in results)
+        df = results[-1][1].reset_index(drop=True)
+
+        # Все форматы должны давать одинаковый результат
+        if reference is None:
+            reference = df
+        else:
+            pd.testing.assert_frame_equal(df, reference, check_dtype=False)
+
+        baseline = baseline or seconds
+        print(f"{file_format:<10}{len(data) / 1024 ** 2:>10,.1f}{written:>11.2f}{seconds:>13.2f}"
+              f"   ×{baseline / seconds:.1f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""Бенчмарк задержки интерфейса: первый рендер и взаимодействие с фильтрами вкладок
+
+Запуск:
+    python benchmarks/bench_ui.py --stores 100 --articles 500
+
+Скрипт публикует синтетический набор в реестр данных и выполняет app.main() через
+streamlit.testing (AppTest). Каждое взаимодействие измеряется как полный прогон
+скрипта - это верхняя оценка: в браузере фильтры внутри фрагмента вкладки
+перезапускают только свой фрагмент. Для фрагментов отдельно измеряется прогон
+одной вкладки (render_*_tab), что соответствует частичному перезапуску.
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from synthetic import make_dataset
+
+from streamlit.testing.v1 import AppTest
+
+import app
+
+APP_SCRIPT = '''
+import streamlit as st
+import app
+
+st.session_state.setdefault('dataset_version', {version!r})
+app.main()
+'''
+
+TAB_SCRIPT = '''
+import app
+
+entry = app.get_dataset_registry().get({version!r})
+app.{renderer}(entry)
+'''
+
+# Вкладка -> (метка виджета, действие)
+INTERACTIONS = [
+    ('📋 Заказы', 'Фильтр по статусу:', lambda widget: widget.set_value(['RED'])),
+    ('📊 Все товары', 'Поиск по артикулу/описанию:', lambda widget: widget.input('ART0001')),
+    ('🏪 По магазинам', 'Выберите магазин:', lambda widget: widget.set_value(widget.options[1]))
+]
+
+# Рендер одной вкладки - стоимость перезапуска фрагмента
+TAB_RENDERERS = ['render_orders_tab', 'render_all_items_tab', 'render_store_tab']
+
+
+def find_widget(at, label):
+    """Виджет текущего дерева AppTest по метке"""
+    for widget in list(at.multiselect) + list(at.text_input) + list(at.selectbox):
+        if widget.label == label:
+            return widget
+    return None
+
+
+def timed(func, repeat):
+    """Медиана времени выполнения (мс)"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def write_script(directory, name, content):
+    path = os.path.join(directory, name)
+    with open(path, 'w', encoding='utf-8') as script:
+        script.write(content)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stores', type=int, default=100)
+    parser.add_argument('--articles', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=600)
+    args = parser.parse_args()
+
+    # Предупреждения Streamlit вне сервера (нет runtime, устаревшие параметры) не нужны в отчете
+    logging.disable(logging.WARNING)
+
+    matrix, stock = make_dataset(args.stores, args.articles)
+    version = app.dataset_version(matrix, stock)
+    _, ddmrp_df, orders_df = app.run_ddmrp_pipeline(matrix.copy(), stock)
+    app.get_dataset_registry().publish(version, app.build_dataset_frames(matrix, stock, ddmrp_df, orders_df))
+
+    print(f"Набор: {len(ddmrp_df):,} позиций, {len(orders_df):,} заказов")
+
+    with tempfile.TemporaryDirectory() as directory:
+        script = write_script(directory, 'bench_app.py', APP_SCRIPT.format(version=version))
+
+        at = AppTest.from_file(script, default_timeout=args.timeout)
+        started = time.perf_counter()
+        at.run()
+        print(f"{'Первый рендер':<40}{(time.perf_counter() - started) * 1000:>10.0f} мс")
+
+        for tab_label, widget_label, action in INTERACTIONS:
+            # Открытие вкладки (для ленивых вкладок - через состояние st.tabs)
+            at.session_state['main_tab'] = tab_label
+            at.run()
+
+            def interact():
+                widget = find_widget(at, widget_label)
+                action(widget)
+                at.run()
+
+            elapsed = timed(interact, args.repeat)
+            print(f"{'Полный прогон: ' + widget_label:<40}{elapsed:>10.0f} мс")
+
+        for renderer in TAB_RENDERERS:
+            if not hasattr(app, renderer):
+                continue
+
+            tab_at = AppTest.from_file(
+                write_script(directory, f'{renderer}.py', TAB_SCRIPT.format(version=version, renderer=renderer)),
+                default_timeout=args.timeout
+            )
+            elapsed = timed(tab_at.run, args.repeat)
+            print(f"{'Фрагмент: ' + renderer:<40}{elapsed:>10.0f} мс")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""Синтетические наборы данных для бенчмарков (торговая матрица и остатки в формате app.py)"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+BRANDS = ['Простоквашино', 'Київхліб', 'Галичина', 'Моршинська', 'Рошен', 'Глобино']
+SEGMENTS = ['Молочні продукти', 'Хлібобулочні', 'Бакалія', 'Напої', "М'ясні вироби", '']
+
+
+def make_dataset(n_stores=100, n_articles=500, seed=0):
+    """Матрица и остатки n_stores × n_articles (колонки как после загрузки в app.py)"""
+    rng = np.random.default_rng(seed)
+    n_rows = n_stores * n_articles
+
+    articles = np.array([f'ART{i:06d}' for i in range(n_articles)], dtype=object)
+    stores = np.array([str(6 + i) for i in range(n_stores)], dtype=object)
+
+    article_col = np.tile(articles, n_stores)
+    store_col = np.repeat(stores, n_articles)
+
+    red = rng.integers(2, 20, n_rows)
+    yellow = rng.integers(5, 30, n_rows)
+    green = rng.integers(5, 40, n_rows)
+
+    matrix = pd.DataFrame({
+        'Article': article_col,
+        'Describe': np.char.add('Товар ', np.tile(np.arange(n_articles), n_stores).astype(str)),
+        'Store_ID': store_col,
+        'Red_Zone': red,
+        'Yellow_Zone': yellow,
+        'Green_Zone': green,
+        'Brand': np.tile(rng.choice(BRANDS, n_articles), n_stores),
+        'Retail_Price': np.tile(rng.integers(1000, 50000, n_articles) / 100, n_stores),
+        'Avg_Daily_Usage': rng.integers(0, 15, n_rows),
+        'ABC_Class': np.tile(rng.choice(['A', 'B', 'C'], n_articles), n_stores),
+        'Segment': np.tile(rng.choice(SEGMENTS, n_articles), n_stores)
+    })
+
+    stock = pd.DataFrame({
+        'Article': article_col,
+        'Store_ID': store_col,
+        'Describe': matrix['Describe'],
+        'Current_Stock': rng.integers(0, 120, n_rows),
+        'Model': np.tile(np.char.add('MDL-', np.arange(n_articles).astype(str)), n_stores)
+    })
+
+    return matrix, stock
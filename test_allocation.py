@@ -0,0 +1,106 @@
+"""Тесты распределения остатка РЦ по заказам магазинов (allocate_dc_stock)
+
+Запуск: python -m pytest test_allocation.py
+"""
+
+import pandas as pd
+import pytest
+
+import app
+
+
+def orders(rows):
+    """Строки расчета с заказом: (Store_ID, Article, Buffer_Status, Buffer_Fill_Percent, Order_Qty[, Pack_Size, MOQ])"""
+    columns = ['Store_ID', 'Article', 'Buffer_Status', 'Buffer_Fill_Percent', 'Order_Qty', 'Pack_Size', 'MOQ']
+    frame = pd.DataFrame([row if len(row) == 7 else row + (1, 0) for row in rows], columns=columns)
+    frame['Priority'] = frame['Buffer_Status'].map({'RED': 1, 'YELLOW': 2, 'GREEN': 3})
+    return frame
+
+
+def dc_stock(**stock):
+    return pd.DataFrame({'Article': list(stock), 'DC_Stock': list(stock.values())})
+
+
+def allocated(report):
+    return report.set_index(['Article', 'Store_ID'])['Allocated_Qty'].to_dict()
+
+
+def test_ample_stock_fills_every_order():
+    report, summary = app.allocate_dc_stock(
+        orders([('S1', 'A', 'RED', 10, 6), ('S2', 'A', 'YELLOW', 40, 5)]),
+        dc_stock(A=100)
+    )
+
+    assert allocated(report) == {('A', 'S1'): 6, ('A', 'S2'): 5}
+    assert report['Shortage_Qty'].eq(0).all()
+    assert summary.loc[0, 'DC_Leftover'] == 89
+    assert summary.loc[0, 'Fill_Rate_Percent'] == 100
+
+
+def test_scarce_stock_goes_to_deepest_penetration_first():
+    report, summary = app.allocate_dc_stock(
+        orders([
+            ('S1', 'A', 'RED', 10, 6),
+            ('S2', 'A', 'YELLOW', 40, 5),
+            ('S3', 'A', 'RED', 5, 6)
+        ]),
+        dc_stock(A=10)
+    )
+
+    # RED раньше YELLOW, внутри RED - меньшее заполнение буфера
+    assert report['Store_ID'].tolist() == ['S3', 'S1', 'S2']
+    assert allocated(report) == {('A', 'S3'): 6, ('A', 'S1'): 4, ('A', 'S2'): 0}
+    assert report['Shortage_Qty'].tolist() == [0, 2, 5]
+    assert summary.loc[0, 'DC_Leftover'] == 0
+    assert summary.loc[0, 'Fill_Rate_Percent'] == pytest.approx(58.8)
+
+
+def test_partial_grant_below_moq_is_cancelled():
+    report, summary = app.allocate_dc_stock(
+        orders([
+            ('S1', 'A', 'RED', 5, 10, 5, 15),
+            ('S2', 'A', 'RED', 20, 4)
+        ]),
+        dc_stock(A=12)
+    )
+
+    # S1 просит MOQ 15; 12 округляется вниз до 10 < MOQ - отгрузка отменяется,
+    # остаток переходит к следующему заказу
+    assert report['Requested_Qty'].tolist() == [15, 4]
+    assert allocated(report) == {('A', 'S1'): 0, ('A', 'S2'): 4}
+    assert summary.loc[0, 'DC_Leftover'] == 8
+
+
+def test_leftover_reaches_order_behind_many_blocked_rows():
+    # Восемь заказов с MOQ 15 не помещаются в 12 шт. и по одному выходят из очереди;
+    # остаток достается девятому заказу, сколько бы проходов это ни заняло
+    blocked = [(f'S{i}', 'A', 'RED', i, 10, 1, 15) for i in range(1, 9)]
+    report, summary = app.allocate_dc_stock(orders(blocked + [('S9', 'A', 'RED', 50, 4)]), dc_stock(A=12))
+
+    assert report.set_index('Store_ID')['Allocated_Qty'].to_dict() == {**{f'S{i}': 0 for i in range(1, 9)}, 'S9': 4}
+    assert summary.loc[0, 'DC_Leftover'] == 8
+
+
+def test_order_is_rounded_up_to_pack_size():
+    report, _ = app.allocate_dc_stock(orders([('S1', 'A', 'RED', 5, 7, 6, 0)]), dc_stock(A=100))
+
+    assert report.loc[0, 'Requested_Qty'] == 12
+    assert report.loc[0, 'Allocated_Qty'] == 12
+
+
+def test_article_without_dc_stock_gets_nothing():
+    report, summary = app.allocate_dc_stock(
+        orders([('S1', 'A', 'RED', 5, 6), ('S1', 'B', 'RED', 5, 3)]),
+        dc_stock(A=100)
+    )
+
+    assert allocated(report) == {('A', 'S1'): 6, ('B', 'S1'): 0}
+    assert summary.set_index('Article')['DC_Available'].to_dict() == {'A': 100, 'B': 0}
+
+
+def test_no_orders_returns_empty_frames():
+    frame = orders([('S1', 'A', 'GREEN', 90, 0)])
+
+    report, summary = app.allocate_dc_stock(frame, dc_stock(A=100))
+
+    assert report.empty and summary.empty
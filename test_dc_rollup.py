@@ -0,0 +1,79 @@
+"""Тесты свертки заказов магазинов в потребность РЦ (rollup_to_dc)
+
+Запуск: python -m pytest test_dc_rollup.py
+"""
+
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.fixture
+def ddmrp_df():
+    frame = pd.DataFrame([
+        ('S1', 'A', 'Молоко', 'RED', 2, 8, 20.0),
+        ('S2', 'A', 'Молоко', 'YELLOW', 5, 12, 50.0),
+        ('S3', 'A', 'Молоко', 'GREEN', 9, 0, 90.0),
+        ('S1', 'B', 'Хлеб', 'GREEN', 4, 0, 4.0),
+        ('S9', 'A', 'Молоко', 'RED', 0, 30, 0.0)
+    ], columns=['Store_ID', 'Article', 'Describe', 'Buffer_Status', 'Current_Stock', 'Order_Qty', 'Stock_Value'])
+    frame['Buffer_Status'] = pd.Categorical(frame['Buffer_Status'], categories=app.BUFFER_STATUSES)
+    return frame
+
+
+@pytest.fixture
+def hierarchy_df():
+    return pd.DataFrame({'Store_ID': ['S1', 'S2', 'S3'], 'DC_ID': ['DC1', 'DC1', 'DC2']})
+
+
+def rollup(ddmrp_df, hierarchy_df, dc_buffers_df=None):
+    messages = []
+    with app.capture_messages(messages):
+        result = app.rollup_to_dc(ddmrp_df, hierarchy_df, dc_buffers_df)
+    return result.set_index(['DC_ID', 'Article']), messages
+
+
+def test_store_orders_are_summed_per_dc(ddmrp_df, hierarchy_df):
+    result, _ = rollup(ddmrp_df, hierarchy_df)
+
+    assert result.index.tolist() == [('DC1', 'A'), ('DC1', 'B'), ('DC2', 'A')]
+    assert result.loc[('DC1', 'A'), ['Stores', 'Red_Stores', 'Store_Stock', 'Store_Order_Qty']].tolist() == [2, 1, 7, 20]
+    assert result.loc[('DC1', 'A'), 'Stock_Value'] == 70
+    assert result.loc[('DC1', 'B'), 'Describe'] == 'Хлеб'
+
+    # Без буферов РЦ статус не определен и заказа РЦ нет
+    assert (result['Buffer_Status'] == 'N/A').all()
+    assert (result['DC_Order_Qty'] == 0).all()
+
+
+def test_unmapped_stores_are_excluded_with_warning(ddmrp_df, hierarchy_df):
+    result, messages = rollup(ddmrp_df, hierarchy_df)
+
+    # Заказ S9 (30 шт.) не попадает ни в один РЦ
+    assert result['Store_Order_Qty'].sum() == 20
+    assert [level for level, _ in messages] == ['warning']
+
+
+def test_dc_buffers_drive_dc_orders(ddmrp_df, hierarchy_df):
+    dc_buffers_df = pd.DataFrame([
+        ('DC1', 'A', 10, 10, 10, 25),
+        ('DC2', 'A', 5, 5, 5, 20),
+        ('DC2', 'C', 1, 1, 1, 0)
+    ], columns=list(app.DC_BUFFER_COLUMNS))
+
+    result, _ = rollup(ddmrp_df, hierarchy_df, dc_buffers_df)
+
+    # DC1/A: чистый поток 25 - 20 = 5 в красной зоне, заказ до Top of Green 30
+    assert result.loc[('DC1', 'A'), ['Net_Flow', 'Top_of_Green', 'DC_Order_Qty']].tolist() == [5, 30, 25]
+    assert result.loc[('DC1', 'A'), 'Buffer_Status'] == 'RED'
+
+    # DC2/A: поток 20 выше Top of Green 15 - избыток, без заказа
+    assert result.loc[('DC2', 'A'), 'Buffer_Status'] == 'EXCESS'
+    assert result.loc[('DC2', 'A'), 'DC_Order_Qty'] == 0
+
+    # DC2/C: буфер без магазинов - пара есть в свертке, заказ по собственному буферу
+    assert result.loc[('DC2', 'C'), ['Stores', 'DC_Order_Qty']].tolist() == [0, 3]
+
+    # DC1/B: пара без буфера РЦ
+    assert result.loc[('DC1', 'B'), 'Buffer_Status'] == 'N/A'
@@ -0,0 +1,93 @@
+"""Тесты битовых карт фильтров (FilterIndex): тот же отбор, что и булевы фильтры pandas
+
+Запуск: python -m pytest test_filter_index.py
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+
+def dataset(n_rows, seed=0):
+    """Набор с числом строк, не кратным 8, и пропусками в текстовой колонке"""
+    rng = np.random.default_rng(seed)
+    brand = rng.choice(['Ферма', 'Пекарня', 'Сыроварня', None], n_rows).astype(object)
+    return pd.DataFrame({
+        'Store_ID': rng.choice(['1', '2', '10', '6'], n_rows),
+        'Buffer_Status': pd.Categorical(rng.choice(['RED', 'YELLOW', 'GREEN'], n_rows), categories=app.BUFFER_STATUSES),
+        'Brand': brand,
+        'Order_Qty': rng.integers(0, 20, n_rows)
+    })
+
+
+def pandas_filter(df, criteria):
+    mask = np.ones(len(df), dtype=bool)
+    for column, selected in criteria.items():
+        values = df[column].astype(object).where(df[column].notna(), app.EMPTY_FILTER_VALUE).astype(str)
+        mask &= values.isin([str(value) for value in selected]).to_numpy()
+    return df[mask]
+
+
+@pytest.fixture(params=['bitmap', 'positions'])
+def storage(request, monkeypatch):
+    """Обе формы индекса: упакованные битовые карты и списки позиций (большая кардинальность)"""
+    if request.param == 'positions':
+        monkeypatch.setattr(app, 'BITMAP_MAX_CARDINALITY', 0)
+    return request.param
+
+
+@pytest.mark.parametrize('n_rows', [1, 7, 13, 1001])
+def test_combinations_match_pandas(n_rows, storage):
+    df = dataset(n_rows)
+    index = app.FilterIndex(df)
+
+    choices = {
+        'Store_ID': [['1'], ['2', '10'], ['6', '1', '2']],
+        'Buffer_Status': [['RED'], ['YELLOW', 'GREEN']],
+        'Brand': [['Ферма'], [app.EMPTY_FILTER_VALUE, 'Сыроварня']]
+    }
+    for stores, statuses, brands in itertools.product(*choices.values()):
+        criteria = {'Store_ID': stores, 'Buffer_Status': statuses, 'Brand': brands}
+        pd.testing.assert_frame_equal(index.filter(df, criteria), pandas_filter(df, criteria))
+
+
+@pytest.mark.parametrize('n_rows', [5, 12])
+def test_padding_bits_do_not_become_rows(n_rows, storage):
+    df = dataset(n_rows)
+    index = app.FilterIndex(df)
+
+    # Все значения, кроме одного, - отбор по OR через всю упакованную карту, включая хвост байта
+    stores = [store for store in index.values('Store_ID') if store != df['Store_ID'].iloc[0]]
+    positions = index.select({'Store_ID': stores})
+
+    assert positions.max(initial=-1) < n_rows
+    np.testing.assert_array_equal(positions, np.flatnonzero(df['Store_ID'].isin(stores).to_numpy()))
+
+
+def test_empty_selection_gives_no_rows(storage):
+    df = dataset(13)
+    index = app.FilterIndex(df)
+
+    assert index.filter(df, {'Store_ID': []}).empty
+    assert index.filter(df, {'Store_ID': ['нет такого магазина']}).empty
+
+
+def test_all_values_or_no_criteria_keep_dataset(storage):
+    df = dataset(13)
+    index = app.FilterIndex(df)
+
+    assert index.select({}) is None
+    assert index.select({'Brand': index.values('Brand')}) is None
+    assert index.filter(df, {'Store_ID': index.values('Store_ID')}) is df
+
+
+def test_values_are_sorted_labels():
+    index = app.FilterIndex(dataset(50))
+
+    assert index.values('Store_ID') == ['1', '10', '2', '6']
+    assert app.EMPTY_FILTER_VALUE in index.values('Brand')
+    assert index.values('ABC_Class') == []
@@ -0,0 +1,74 @@
+"""Тесты Монте-Карло прогноза дефицита (simulate_stockout_risk)
+
+Запуск: python -m pytest test_monte_carlo.py
+"""
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+
+import app
+
+
+def positions(usage, stock, order_qty):
+    n = len(usage)
+    return pd.DataFrame({
+        'Article': [f'A{i}' for i in range(n)],
+        'Store_ID': 'S1',
+        'Avg_Daily_Usage': usage,
+        'Current_Stock': stock,
+        'Order_Qty': order_qty
+    })
+
+
+def test_deterministic_demand_gives_exact_shortage_days():
+    # Расход 10/день, остаток 35: запаса на 3.5 дня, на горизонте 7 дней - 4 дня дефицита.
+    # Заказ 100 приходит на 4-й день (lead time 3) - дефицита нет
+    result = app.simulate_stockout_risk(
+        positions([10.0], [35.0], [100.0]),
+        horizon_days=7, n_scenarios=20, lead_time_days=3, demand_cv=0, seed=0
+    )
+
+    row = result.iloc[0]
+    assert row['Stockout_Prob'] == 100
+    assert row['Expected_Days_Short'] == 4
+    assert row['Stockout_Prob_With_Order'] == 0
+    assert row['Expected_Days_Short_With_Order'] == 0
+
+
+def test_position_without_usage_has_no_risk():
+    result = app.simulate_stockout_risk(positions([0.0], [0.0], [0.0]), seed=0)
+
+    assert result.iloc[0, 2:].eq(0).all()
+
+
+def test_same_seed_is_reproducible():
+    frame = positions([5.0, 2.0, 8.0], [20.0, 3.0, 60.0], [30.0, 10.0, 0.0])
+
+    first = app.simulate_stockout_risk(frame, seed=42)
+    second = app.simulate_stockout_risk(frame, seed=42)
+
+    pdt.assert_frame_equal(first, second)
+
+
+def test_result_does_not_depend_on_workers(monkeypatch):
+    rng = np.random.default_rng(1)
+    frame = positions(rng.uniform(0, 10, 50), rng.uniform(0, 80, 50), rng.uniform(0, 40, 50))
+
+    # Порция на 3 SKU: 50 SKU считаются в 17 порциях
+    monkeypatch.setattr(app, 'SIMULATION_CHUNK_BYTES', 3 * 200 * 14 * 2)
+
+    single = app.simulate_stockout_risk(frame, seed=7, max_workers=1)
+    parallel = app.simulate_stockout_risk(frame, seed=7, max_workers=4)
+
+    pdt.assert_frame_equal(single, parallel)
+
+
+def test_order_never_increases_risk():
+    rng = np.random.default_rng(2)
+    frame = positions(rng.uniform(1, 10, 30), rng.uniform(0, 50, 30), rng.uniform(0, 60, 30))
+
+    result = app.simulate_stockout_risk(frame, seed=3)
+
+    assert (result['Stockout_Prob_With_Order'] <= result['Stockout_Prob']).all()
+    assert (result['Expected_Days_Short_With_Order'] <= result['Expected_Days_Short']).all()
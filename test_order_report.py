@@ -0,0 +1,62 @@
+"""Тесты отчета по заказам (generate_order_report): порядок строк и отбор самых срочных
+
+Запуск: python -m pytest test_order_report.py
+"""
+
+import io
+import os
+
+import pandas as pd
+import pytest
+
+import app
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), 'test_data')
+
+
+@pytest.fixture(scope='module')
+def result():
+    with open(os.path.join(TEST_DATA, 'stock_data.xlsx'), 'rb') as file, app.capture_messages([]):
+        stock_df = app.load_stock_file(io.BytesIO(file.read()))
+        with open(os.path.join(TEST_DATA, 'trade_matrix.csv'), 'rb') as matrix_file:
+            matrix_df = app.read_matrix_csv(matrix_file)
+        # Строки матрицы в произвольном порядке: порядок отчета не должен от него зависеть
+        matrix_df = matrix_df.sample(frac=1, random_state=0).reset_index(drop=True)
+        _, ddmrp_df, orders_df = app.run_ddmrp_pipeline(matrix_df, stock_df)
+    return ddmrp_df, orders_df
+
+
+def test_dataset_is_ordered_by_store_and_article(result):
+    ddmrp_df, _ = result
+
+    keys = list(zip(ddmrp_df['Store_ID'], ddmrp_df['Article']))
+    assert keys == sorted(keys)
+
+
+def test_report_order_is_priority_store_article(result):
+    ddmrp_df, orders_df = result
+
+    # Порядок выгрузки в Excel - как у полной сортировки (Priority, Store_ID, Article)
+    expected = ddmrp_df[ddmrp_df['Order_Qty'] > 0].sort_values(['Priority', 'Store_ID', 'Article'])
+    pd.testing.assert_frame_equal(orders_df, expected[orders_df.columns].reset_index(drop=True))
+
+
+def test_rows_are_partitioned_by_priority():
+    ddmrp_df = pd.DataFrame({
+        'Store_ID': ['S1', 'S1', 'S2', 'S2'],
+        'Article': ['A1', 'A2', 'A1', 'A2'],
+        'Order_Qty': [5, 0, 3, 7],
+        'Priority': [2, 3, 1, 2]
+    })
+
+    report = app.generate_order_report(ddmrp_df)
+
+    assert list(zip(report['Priority'], report['Store_ID'], report['Article'])) == [
+        (1, 'S2', 'A1'), (2, 'S1', 'A1'), (2, 'S2', 'A2')
+    ]
+
+
+def test_no_orders_gives_empty_report():
+    ddmrp_df = pd.DataFrame({'Store_ID': ['S1'], 'Article': ['A1'], 'Order_Qty': [0], 'Priority': [3]})
+
+    assert app.generate_order_report(ddmrp_df).empty
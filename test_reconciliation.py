@@ -0,0 +1,86 @@
+"""Тесты сверки ключей расчета и остатков (reconcile_keys, reconciliation_summary)
+
+Запуск: python -m pytest test_reconciliation.py
+"""
+
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.fixture
+def ddmrp_df():
+    return pd.DataFrame({
+        'Store_ID': ['S1', 'S1', 'S2', 'S2'],
+        'Article': ['A1', 'A2', 'A1', 'A3'],
+        'Describe': ['Молоко', 'Хлеб', 'Молоко', 'Сыр'],
+        'Brand': ['Ферма', 'Пекарня', 'Ферма', 'Сыроварня'],
+        'Retail_Price': [40.0, 25.0, 40.0, 300.0],
+        'Order_Qty': [0, 6, 3, 9]
+    })
+
+
+@pytest.fixture
+def stock_df():
+    return pd.DataFrame({
+        'Article': ['A1', 'A2', 'A1', 'A2', 'A9'],
+        'Store_ID': ['S1', 'S1', 'S2', 'S2', 'S1'],
+        'Describe': ['Молоко', 'Хлеб', 'Молоко', 'Хлеб белый', 'Новинка'],
+        'Current_Stock': [5, 2, 4, 7, 3]
+    })
+
+
+@pytest.fixture(params=['direct', 'hash'])
+def key_lookup(request, monkeypatch):
+    """Оба пути анти-соединения: таблица прямой адресации и хеш-таблица (Index.isin)"""
+    if request.param == 'hash':
+        monkeypatch.setattr(app, 'RECONCILIATION_TABLE_FACTOR', 0)
+    return request.param
+
+
+def test_both_directions_are_found(ddmrp_df, stock_df, key_lookup):
+    result = app.reconcile_keys(ddmrp_df, stock_df)
+
+    assert result.columns.tolist() == app.RECONCILIATION_COLUMNS
+    assert list(zip(result['Issue'].astype(str), result['Store_ID'], result['Article'])) == [
+        ('NOT_IN_MATRIX', 'S1', 'A9'),
+        ('NOT_IN_MATRIX', 'S2', 'A2'),
+        ('NO_STOCK', 'S2', 'A3')
+    ]
+
+
+def test_unlisted_stock_takes_brand_and_price_from_other_stores(ddmrp_df, stock_df, key_lookup):
+    result = app.reconcile_keys(ddmrp_df, stock_df).set_index(['Store_ID', 'Article'])
+
+    # S2/A2: артикул есть в матрице у S1 - бренд и цена оттуда, описание - из файла остатков
+    unlisted = result.loc[('S2', 'A2')]
+    assert (unlisted['Describe'], unlisted['Brand']) == ('Хлеб белый', 'Пекарня')
+    assert (unlisted['Current_Stock'], unlisted['Stock_Value'], unlisted['Order_Qty']) == (7, 175, 0)
+
+    # S1/A9: артикула нет в матрице - бренд пустой, стоимость 0
+    unknown = result.loc[('S1', 'A9')]
+    assert (unknown['Brand'], unknown['Stock_Value']) == ('', 0)
+
+
+def test_matrix_rows_without_stock_keep_their_order(ddmrp_df, stock_df, key_lookup):
+    result = app.reconcile_keys(ddmrp_df, stock_df).set_index(['Store_ID', 'Article'])
+
+    missing = result.loc[('S2', 'A3')]
+    assert (missing['Describe'], missing['Brand']) == ('Сыр', 'Сыроварня')
+    assert (missing['Current_Stock'], missing['Order_Qty']) == (0, 9)
+
+
+def test_matching_keys_give_empty_report(ddmrp_df, key_lookup):
+    stock_df = ddmrp_df[['Article', 'Store_ID', 'Describe']].assign(Current_Stock=1)
+
+    assert app.reconcile_keys(ddmrp_df, stock_df).empty
+
+
+def test_summary_by_store(ddmrp_df, stock_df):
+    summary = app.reconciliation_summary(app.reconcile_keys(ddmrp_df, stock_df), 'Store_ID').set_index('Store_ID')
+
+    assert summary.loc['S2', ['Not_In_Matrix', 'No_Stock', 'Issues']].tolist() == [1, 1, 2]
+    assert summary.loc['S2', 'Unlisted_Value'] == 175
+    assert summary.loc['S2', 'No_Stock_Order_Qty'] == 9
+    assert summary.index.tolist() == ['S2', 'S1']
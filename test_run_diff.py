@@ -0,0 +1,106 @@
+"""Тесты сравнения расчетов (diff_runs) и истории расчетов по источникам (RunHistory)
+
+Запуск: python -m pytest test_run_diff.py
+"""
+
+import pandas as pd
+import pytest
+
+import app
+
+
+def snapshot(rows):
+    """Снимок расчета: (Article, Store_ID, Buffer_Status, Order_Qty)"""
+    frame = pd.DataFrame(rows, columns=app.RUN_SNAPSHOT_COLUMNS)
+    frame['Buffer_Status'] = pd.Categorical(frame['Buffer_Status'], categories=app.BUFFER_STATUSES)
+    return frame
+
+
+@pytest.fixture
+def previous():
+    return snapshot([
+        ('A1', 'S1', 'GREEN', 0),
+        ('A2', 'S1', 'YELLOW', 5),
+        ('A3', 'S1', 'RED', 8),
+        ('A4', 'S1', 'RED', 4)
+    ])
+
+
+@pytest.fixture
+def current():
+    return snapshot([
+        ('A1', 'S1', 'RED', 10),
+        ('A2', 'S1', 'GREEN', 0),
+        ('A3', 'S1', 'RED', 8),
+        ('A5', 'S2', 'YELLOW', 3)
+    ])
+
+
+def test_transitions_count_each_position_once(previous, current):
+    transitions, _ = app.diff_runs(previous, current)
+
+    assert transitions.loc['GREEN', 'RED'] == 1
+    assert transitions.loc['YELLOW', 'GREEN'] == 1
+    assert transitions.loc['RED', 'RED'] == 1
+    assert transitions.loc['RED', app.RUN_REMOVED_LABEL] == 1
+    assert transitions.loc[app.RUN_NEW_LABEL, 'YELLOW'] == 1
+    assert transitions.to_numpy().sum() == 5
+
+
+def test_delta_lists_only_changed_orders(previous, current):
+    _, delta = app.diff_runs(previous, current)
+
+    rows = list(zip(delta['Change'].astype(str), delta['Store_ID'], delta['Article'], delta['Delta_Qty']))
+    assert rows == [
+        ('NEW', 'S1', 'A1', 10),
+        ('NEW', 'S2', 'A5', 3),
+        ('CANCELLED', 'S1', 'A2', -5),
+        ('CANCELLED', 'S1', 'A4', -4)
+    ]
+
+
+def test_identical_runs_have_no_delta(previous):
+    transitions, delta = app.diff_runs(previous, previous.copy())
+
+    assert delta.empty
+    assert transitions.to_numpy().trace() == len(previous)
+
+
+def test_excess_is_not_part_of_the_downgrade_axis():
+    transitions, _ = app.diff_runs(
+        snapshot([('A1', 'S1', 'EXCESS', 0), ('A2', 'S1', 'GREEN', 0), ('A3', 'S1', 'EXCESS', 0), ('A4', 'S1', 'YELLOW', 2)]),
+        snapshot([('A1', 'S1', 'GREEN', 0), ('A2', 'S1', 'EXCESS', 0), ('A3', 'S1', 'RED', 9), ('A4', 'S1', 'RED', 6)])
+    )
+
+    # EXCESS -> GREEN - возврат к целевой зоне; GREEN -> EXCESS - переход в избыток
+    assert app.status_downgrades(transitions) == 2
+    assert app.status_excess_moves(transitions) == 1
+
+
+@pytest.mark.parametrize('on_disk', [False, True])
+def test_history_is_kept_per_source(on_disk, tmp_path, previous, current):
+    history = app.RunHistory(str(tmp_path) if on_disk else None)
+    network = app.run_source_key('https://docs.google.com/spreadsheets/d/net', 'stock.xlsx')
+    other = app.run_source_key('https://docs.google.com/spreadsheets/d/net', 'other.xlsx')
+
+    history.save(network, 'v1', previous)
+    history.save(other, 'v2', current)
+
+    # Расчет другого источника не становится предыдущим для этой сети
+    version, saved = history.previous(network, 'v3')
+    assert version == 'v1'
+    pd.testing.assert_frame_equal(saved, previous, check_categorical=False)
+
+    # Текущая версия не сравнивается сама с собой
+    assert history.previous(other, 'v2') == (None, None)
+
+
+def test_history_keeps_last_runs(tmp_path, previous):
+    history = app.RunHistory(str(tmp_path), keep=2)
+    source = app.run_source_key('url', 'dir')
+
+    for version in ['v1', 'v2', 'v3']:
+        history.save(source, version, previous)
+
+    assert sorted(path.stem for path in (tmp_path / 'runs' / source).iterdir()) == ['v2', 'v3']
+    assert history.previous(source, 'v3')[0] == 'v2'
@@ -0,0 +1,170 @@
+"""Тесты SQL-движка (run_sql_pipeline, SqlDataset): совпадение с расчетом pandas
+
+Запуск: python -m pytest test_sql_backend.py
+"""
+
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), 'test_data')
+
+
+@pytest.fixture(scope='module')
+def stock_df():
+    with open(os.path.join(TEST_DATA, 'stock_data.xlsx'), 'rb') as file, app.capture_messages([]):
+        return app.load_stock_file(io.BytesIO(file.read()))
+
+
+def matrix_chunks(data, rows):
+    """Матрица порциями по rows строк - как при потоковом чтении"""
+    raw = app.read_matrix_csv(io.BytesIO(data))
+    return [raw.iloc[start:start + rows].reset_index(drop=True) for start in range(0, len(raw), rows)]
+
+
+def pandas_result(data, stock_df):
+    with app.capture_messages([]):
+        _, ddmrp_df, orders_df = app.run_ddmrp_pipeline(app.read_matrix_csv(io.BytesIO(data)), stock_df)
+    return ddmrp_df, orders_df
+
+
+def sql_dataset(chunks, stock_df, report=None):
+    with app.capture_messages([]):
+        return app.run_sql_pipeline(chunks, stock_df, report=report, engine='sqlite')
+
+
+def assert_same_rows(expected, page):
+    columns = [column for column in expected.columns if column in page.columns]
+    pd.testing.assert_frame_equal(
+        expected[columns].reset_index(drop=True),
+        page[columns].reset_index(drop=True),
+        check_dtype=False, check_categorical=False
+    )
+
+
+@pytest.mark.parametrize('matrix_file', ['trade_matrix.csv', 'trade_matrix_sparse.csv'])
+def test_sql_matches_pandas(matrix_file, stock_df):
+    with open(os.path.join(TEST_DATA, matrix_file), 'rb') as file:
+        data = file.read()
+
+    ddmrp_df, orders_df = pandas_result(data, stock_df)
+    dataset = sql_dataset(matrix_chunks(data, 7), stock_df)
+    try:
+        assert dataset.count('ddmrp') == len(ddmrp_df)
+        assert dataset.count('orders') == len(orders_df)
+        assert_same_rows(ddmrp_df, dataset.page('ddmrp', limit=len(ddmrp_df)))
+        assert_same_rows(orders_df, dataset.page('orders', limit=len(orders_df)))
+    finally:
+        dataset.close()
+
+
+def test_page_count_and_summary(stock_df):
+    with open(os.path.join(TEST_DATA, 'trade_matrix.csv'), 'rb') as file:
+        data = file.read()
+
+    ddmrp_df, _ = pandas_result(data, stock_df)
+    dataset = sql_dataset(matrix_chunks(data, 1000), stock_df)
+    try:
+        store = ddmrp_df['Store_ID'].iloc[0]
+        in_store = ddmrp_df[ddmrp_df['Store_ID'] == store]
+
+        assert dataset.count('ddmrp', {'Store_ID': [store]}) == len(in_store)
+        assert_same_rows(in_store.iloc[2:5], dataset.page('ddmrp', {'Store_ID': [store]}, offset=2, limit=3))
+        assert_same_rows(ddmrp_df.iloc[10:20], dataset.page('ddmrp', offset=10, limit=10))
+
+        summary = dataset.summary()
+        counts = ddmrp_df['Buffer_Status'].value_counts()
+        assert summary['status_counts'] == {status: count for status, count in counts.items() if count}
+        assert summary['order_qty'] == ddmrp_df['Order_Qty'].sum()
+        assert summary['stock_value'] == pytest.approx(ddmrp_df['Stock_Value'].sum())
+    finally:
+        dataset.close()
+
+
+def test_late_and_repeated_default_rows_match_pandas(stock_df):
+    data = (
+        b"Article,Describe,Store_ID,Red_Zone,Yellow_Zone,Green_Zone\n"
+        b"A1,,S1,,1,1\n"
+        b"A1,x,*,5,5,5\n"
+        b"A2,y,*,2,2,2\n"
+        b"A2,,S1,7,,\n"
+        b"A2,z,*,3,4,6\n"
+    )
+
+    # Строки '*' пришли после строк магазинов (в других порциях): наследуется последняя, как в pandas
+    ddmrp_df, orders_df = pandas_result(data, stock_df)
+    dataset = sql_dataset(matrix_chunks(data, 1), stock_df)
+    try:
+        page = dataset.page('ddmrp', {'Store_ID': ['S1']}).set_index('Article')
+        assert page.loc['A1', ['Describe', 'Red_Zone', 'Yellow_Zone']].tolist() == ['x', 5, 1]
+        assert page.loc['A2', ['Describe', 'Red_Zone', 'Yellow_Zone', 'Green_Zone']].tolist() == ['z', 7, 4, 6]
+
+        # Пустые колонки (Model, дни до нуля) в pandas - NaN, в SQL - None: сравниваются колонки матрицы
+        columns = ['Store_ID', 'Article', 'Describe', 'Red_Zone', 'Yellow_Zone', 'Green_Zone', 'Buffer_Status', 'Order_Qty']
+        assert_same_rows(ddmrp_df[columns], dataset.page('ddmrp', limit=len(ddmrp_df)))
+        assert_same_rows(orders_df[orders_df.columns.intersection(columns)], dataset.page('orders', limit=len(orders_df)))
+    finally:
+        dataset.close()
+
+
+@pytest.fixture
+def sql_job(monkeypatch, stock_df):
+    """SQL-конвейер с матрицей из переменной вместо Google Sheets"""
+    with open(os.path.join(TEST_DATA, 'stock_data.xlsx'), 'rb') as file:
+        stock_bytes = file.read()
+    matrix = {}
+
+    def download(url, on_rows=None, **kwargs):
+        for chunk in matrix_chunks(matrix['data'], 50):
+            on_rows(chunk)
+        return list(chunk.columns)
+
+    monkeypatch.setattr(app, 'download_google_sheet_streaming', download)
+    datasets = app.SqlDatasetStore()
+
+    def run(data):
+        matrix['data'] = data
+        job = app.PipelineJob('session', 'sql-key')
+        with app.capture_messages([]):
+            return app.run_sql_pipeline_job(job, datasets, 'https://docs.google.com/spreadsheets/d/x', stock_bytes)
+
+    yield run, datasets
+    for version in list(datasets._datasets):
+        datasets.get(version).close()
+
+
+def test_sql_version_follows_content(sql_job):
+    run, datasets = sql_job
+    with open(os.path.join(TEST_DATA, 'trade_matrix.csv'), 'rb') as file:
+        data = file.read()
+
+    version = run(data)
+    assert version.startswith('sql-') and not version.startswith('sql-sql-')
+
+    # Те же данные - общая копия; измененная таблица по тому же URL - новый расчет
+    assert run(data) == version
+    changed = run(data.replace(b'ART001,', b'ART001X,', 1))
+    assert changed != version
+    assert datasets.get(version) is not None and datasets.get(changed) is not None
+
+
+def test_default_row_is_inherited_by_store_rows(stock_df):
+    data = (
+        b"Article,Describe,Store_ID,Red_Zone,Yellow_Zone,Green_Zone,Avg_Daily_Usage\n"
+        b"A1,x,*,5,5,5,2\n"
+        b"A1,,S1,8,,,\n"
+    )
+
+    dataset = sql_dataset(matrix_chunks(data, 1), stock_df)
+    try:
+        page = dataset.page('ddmrp', {'Store_ID': ['S1']})
+        row = page.iloc[0]
+        assert (row['Red_Zone'], row['Yellow_Zone'], row['Green_Zone']) == (8, 5, 5)
+        assert np.isclose(row['Avg_Daily_Usage'], 2)
+    finally:
+        dataset.close()
@@ -0,0 +1,103 @@
+"""Тесты загрузки остатков: Excel, CSV, Parquet и Feather дают одинаковый результат
+
+Запуск: python -m pytest test_stock_formats.py
+"""
+
+import io
+import os
+
+import pandas as pd
+import pytest
+
+import app
+
+STOCK_FILE = os.path.join(os.path.dirname(__file__), 'test_data', 'stock_data.xlsx')
+
+
+def load(data):
+    report = app.ValidationReport()
+    with app.capture_messages([]):
+        df = app.load_stock_file(io.BytesIO(data), report)
+    return df, report
+
+
+def written(frame, file_format):
+    """Таблица в байтах файла заданного формата"""
+    buffer = io.BytesIO()
+    if file_format == 'csv':
+        frame.to_csv(buffer, index=False)
+    elif file_format == 'parquet':
+        frame.to_parquet(buffer, index=False)
+    elif file_format == 'feather':
+        frame.to_feather(buffer)
+    else:
+        frame.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope='module')
+def source():
+    return pd.read_excel(STOCK_FILE)
+
+
+@pytest.fixture(scope='module')
+def from_excel():
+    with open(STOCK_FILE, 'rb') as file:
+        df, _ = load(file.read())
+    return df.reset_index(drop=True)
+
+
+@pytest.mark.parametrize('file_format', ['csv', 'parquet', 'feather'])
+def test_formats_match_excel(file_format, source, from_excel):
+    data = written(source, file_format)
+
+    assert app.detect_file_format(io.BytesIO(data)) == file_format
+
+    df, report = load(data)
+    pd.testing.assert_frame_equal(df.reset_index(drop=True), from_excel, check_dtype=False)
+    assert len(report) == 0
+
+
+@pytest.mark.parametrize('file_format', ['excel', 'csv', 'parquet'])
+def test_header_aliases_and_extra_columns(file_format):
+    frame = pd.DataFrame({
+        'Артикул': ['A1', 'A2'],
+        ' магазин ': [1, 2],
+        'Описание': ['Молоко', 'Хлеб'],
+        'Qty': [5, 7],
+        'Комментарий': ['x', 'y']
+    })
+
+    df, _ = load(written(frame, file_format))
+
+    assert df.columns.tolist() == ['Article', 'Store_ID', 'Describe', 'Current_Stock']
+    assert df['Store_ID'].tolist() == ['1', '2']
+    assert df['Current_Stock'].tolist() == [5, 7]
+    assert df.attrs['skipped_columns'] == ['Комментарий']
+
+
+@pytest.mark.parametrize('file_format', ['csv', 'parquet'])
+def test_bad_rows_are_reported_the_same_way(file_format):
+    frame = pd.DataFrame({
+        'Art': ['A1', '', 'A3'],
+        'Magazin': ['S1', 'S1', 'S1'],
+        'Describe': ['Молоко', 'Хлеб', None],
+        'к-во': ['5', '2', 'много']
+    })
+
+    df, report = load(written(frame, file_format))
+
+    # Строка без артикула удаляется, пустое описание и невалидное число - предупреждения
+    assert df['Article'].tolist() == ['A1', 'A3']
+    assert df['Current_Stock'].tolist() == [5, 0]
+    assert report.count('empty_key', 'Article') == 1
+    assert report.count('empty_text', 'Describe') == 1
+    assert report.count('invalid_number', 'Current_Stock') == 1
+
+
+def test_file_without_schema_columns_is_rejected():
+    df, report = load(written(pd.DataFrame({'Foo': [1], 'Bar': [2]}), 'csv'))
+
+    assert df is None
+    assert report.has_errors
+    assert [issue['Column'] for issue in report] == ['Article', 'Store_ID', 'Describe', 'Current_Stock']
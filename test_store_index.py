@@ -0,0 +1,87 @@
+"""Тесты индекса магазинов (StoreIndex): диапазоны строк против отбора булевой маской
+
+Запуск: python -m pytest test_store_index.py
+"""
+
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), 'test_data')
+
+
+@pytest.fixture(scope='module')
+def ddmrp_df():
+    """Расчет по матрице с перемешанными строками - набор упорядочивает calculate_ddmrp_status"""
+    with open(os.path.join(TEST_DATA, 'stock_data.xlsx'), 'rb') as file, app.capture_messages([]):
+        stock_df = app.load_stock_file(io.BytesIO(file.read()))
+        with open(os.path.join(TEST_DATA, 'trade_matrix.csv'), 'rb') as matrix_file:
+            matrix_df = app.read_matrix_csv(matrix_file)
+        matrix_df = matrix_df.sample(frac=1, random_state=1).reset_index(drop=True)
+        _, ddmrp_df, _ = app.run_ddmrp_pipeline(matrix_df, stock_df)
+    return ddmrp_df
+
+
+def test_ranges_match_mask_selection(ddmrp_df):
+    index = app.StoreIndex(ddmrp_df)
+
+    assert index.stores == sorted(ddmrp_df['Store_ID'].unique())
+    for store in index.stores:
+        expected = ddmrp_df[ddmrp_df['Store_ID'] == store]
+        pd.testing.assert_frame_equal(index.slice(ddmrp_df, store), expected)
+
+
+def test_ranges_cover_dataset_without_gaps(ddmrp_df):
+    index = app.StoreIndex(ddmrp_df)
+
+    bounds = [index.ranges[store] for store in index.stores]
+    assert bounds[0][0] == 0 and bounds[-1][1] == len(ddmrp_df)
+    assert all(stop == start for (_, stop), (start, _) in zip(bounds, bounds[1:]))
+
+
+def test_absent_store_gives_empty_slice(ddmrp_df):
+    index = app.StoreIndex(ddmrp_df)
+
+    result = index.slice(ddmrp_df, 'нет такого магазина')
+
+    assert result.empty
+    assert result.columns.tolist() == ddmrp_df.columns.tolist()
+
+
+def test_numeric_store_id_is_found_as_string():
+    ddmrp_df = pd.DataFrame({
+        'Store_ID': ['10', '10', '6'],
+        'Buffer_Status': ['RED', 'GREEN', 'YELLOW'],
+        'Order_Qty': [4, 0, 2],
+        'Stock_Value': [10.0, 20.0, 5.0]
+    })
+
+    index = app.StoreIndex(ddmrp_df)
+
+    assert len(index.slice(ddmrp_df, 10)) == 2
+    assert index.store_metrics(6)['YELLOW'] == 1
+
+
+def test_metrics_match_groupby(ddmrp_df):
+    index = app.StoreIndex(ddmrp_df)
+
+    grouped = ddmrp_df.groupby('Store_ID', observed=True)
+    status = ddmrp_df['Buffer_Status'].astype(str)
+    np.testing.assert_array_equal(index.metrics['SKU'], grouped.size().to_numpy())
+    np.testing.assert_array_equal(index.metrics['RED'], (status == 'RED').groupby(ddmrp_df['Store_ID']).sum().to_numpy())
+    np.testing.assert_allclose(index.metrics['Order_Qty'], grouped['Order_Qty'].sum().to_numpy())
+    np.testing.assert_allclose(index.metrics['Stock_Value'], grouped['Stock_Value'].sum().to_numpy())
+
+
+def test_empty_dataset():
+    ddmrp_df = pd.DataFrame({'Store_ID': [], 'Buffer_Status': [], 'Order_Qty': []})
+
+    index = app.StoreIndex(ddmrp_df)
+
+    assert index.stores == [] and index.metrics.empty
+    assert index.slice(ddmrp_df, 'S1').empty
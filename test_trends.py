@@ -0,0 +1,101 @@
+"""Тесты дневных агрегатов трендов (daily_rollup, DailyRollups) и их сохранения конвейером
+
+Запуск: python -m pytest test_trends.py
+"""
+
+import io
+import os
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import app
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), 'test_data')
+
+
+def rollup(day, positions):
+    frame = pd.DataFrame({'Store_ID': ['S1'], 'Buffer_Status': ['RED'], 'Current_Stock': [1],
+                          'Stock_Value': [1.0], 'Order_Qty': [positions]})
+    frame['Buffer_Status'] = pd.Categorical(frame['Buffer_Status'], categories=app.BUFFER_STATUSES)
+    return app.daily_rollup(frame.loc[frame.index.repeat(positions)], day)
+
+
+@pytest.mark.parametrize('on_disk', [False, True])
+def test_sources_are_kept_apart(on_disk, tmp_path):
+    rollups = app.DailyRollups(str(tmp_path) if on_disk else None)
+
+    rollups.save('network', date(2026, 10, 1), rollup(date(2026, 10, 1), 3))
+    rollups.save('network', date(2026, 10, 2), rollup(date(2026, 10, 2), 4))
+    rollups.save('test-file', date(2026, 10, 2), rollup(date(2026, 10, 2), 9))
+    if on_disk:
+        path = tmp_path / 'rollups' / 'test-file' / '2026-10-02.parquet'
+        os.utime(path, (path.stat().st_atime, path.stat().st_mtime + 60))
+
+    assert rollups.load('network')['Positions'].tolist() == [3, 4]
+    assert rollups.load('network', days=1)['Positions'].tolist() == [4]
+    assert rollups.load('test-file')['Positions'].tolist() == [9]
+    assert rollups.load('unknown').empty
+    assert rollups.latest_source() == 'test-file'
+
+
+def test_latest_source_on_disk_follows_file_times(tmp_path):
+    rollups = app.DailyRollups(str(tmp_path))
+    day = date(2026, 10, 1)
+    for source in ['network', 'test-file']:
+        rollups.save(source, day, rollup(day, 1))
+
+    # Агрегат другого процесса, записанный позже
+    path = tmp_path / 'rollups' / 'network' / '2026-10-01.parquet'
+    os.utime(path, (path.stat().st_atime, path.stat().st_mtime + 60))
+
+    assert app.DailyRollups(str(tmp_path)).latest_source() == 'network'
+
+
+def test_last_run_of_the_day_replaces_rollup(tmp_path):
+    rollups = app.DailyRollups(str(tmp_path))
+    day = date(2026, 10, 1)
+
+    rollups.save('network', day, rollup(day, 3))
+    rollups.save('network', day, rollup(day, 5))
+
+    # Другой процесс с тем же каталогом видит тот же агрегат
+    assert app.DailyRollups(str(tmp_path)).load('network')['Positions'].tolist() == [5]
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Конвейер с матрицей из test_data вместо Google Sheets и отдельными реестром и агрегатами"""
+    with open(os.path.join(TEST_DATA, 'trade_matrix.csv'), 'rb') as file:
+        matrix_bytes = file.read()
+    with open(os.path.join(TEST_DATA, 'stock_data.xlsx'), 'rb') as file:
+        stock_bytes = file.read()
+
+    rollups = app.DailyRollups()
+    monkeypatch.setattr(app, 'download_google_sheet_streaming',
+                        lambda url, **kwargs: app.read_matrix_csv(io.BytesIO(matrix_bytes)))
+    monkeypatch.setattr(app, 'get_daily_rollups', lambda: rollups)
+    monkeypatch.setattr(app, 'get_shared_datasets', lambda: None)
+    registry = app.DatasetRegistry()
+
+    def run(owner, stock_source):
+        job = app.PipelineJob(owner, 'key')
+        job.owners.add(owner)
+        with app.capture_messages([]):
+            version = app.run_pipeline_job(job, registry, 'https://docs.google.com/spreadsheets/d/x', stock_bytes, stock_source)
+        return version, job.source
+
+    return run, rollups
+
+
+def test_manual_runs_and_repeated_data_are_rolled_up(pipeline):
+    run, rollups = pipeline
+
+    version, source = run('session-a', 'stock.xlsx')
+    assert rollups.load(source)['Positions'].sum() == 60
+
+    # Те же данные из другого источника: расчет не повторяется, но день попадает в его тренд
+    same_version, other_source = run('session-b', 'copy.xlsx')
+    assert same_version == version and other_source != source
+    assert rollups.load(other_source)['Positions'].sum() == 60
@@ -0,0 +1,118 @@
+"""Тесты валидации матрицы и отчета ValidationReport
+
+Запуск: python -m pytest test_validation.py
+"""
+
+import pandas as pd
+
+import app
+
+
+def matrix(**columns):
+    base = {
+        'Article': ['A1', 'A2', 'A3', 'A4'],
+        'Describe': ['Товар'] * 4,
+        'Store_ID': ['S1'] * 4,
+        'Red_Zone': ['5'] * 4,
+        'Yellow_Zone': ['5'] * 4,
+        'Green_Zone': ['5'] * 4
+    }
+    return pd.DataFrame(dict(base, **columns))
+
+
+def validate(df):
+    report = app.ValidationReport()
+    with app.capture_messages([]):
+        result = app.validate_matrix(df, report=report)
+    return result, report
+
+
+def test_rules_are_reported_with_file_row_numbers():
+    result, report = validate(matrix(
+        Article=['A1', ' ', 'A3', 'A4'],
+        Red_Zone=['5', 'abc', '-2', '0'],
+        Yellow_Zone=['5', '5', '5', '0'],
+        Green_Zone=['5', '5', '5', '0']
+    ))
+
+    issues = {(issue['Rule'], issue['Column']): issue['Sample_Rows'] for issue in report}
+
+    # Номер строки в файле = позиция + 2 (заголовок и нумерация с 1)
+    assert issues == {
+        ('empty_key', 'Article'): [3],
+        ('invalid_number', 'Red_Zone'): [3],
+        ('negative', 'Red_Zone'): [4],
+        ('zero_buffer', 'Red_Zone+Yellow_Zone+Green_Zone'): [5]
+    }
+    assert not report.has_errors
+    assert result['Red_Zone'].tolist() == [5, 0, 0, 0]
+
+
+def test_missing_and_blank_keys_are_empty():
+    result, report = validate(matrix(
+        Article=['A1', None, '   ', 'None'],
+        Store_ID=['S1', 'S1', '\t', pd.NA]
+    ))
+
+    assert report.count('empty_key', 'Article') == 3
+    assert report.count('empty_key', 'Store_ID') == 2
+    assert result['Article'].tolist() == ['A1', '', '', '']
+    assert result['Store_ID'].tolist() == ['S1', 'S1', '', '']
+
+
+def test_clean_matrix_has_no_issues():
+    result, report = validate(matrix())
+
+    assert len(report) == 0
+    assert len(result) == 4
+
+
+def test_missing_column_is_an_error():
+    result, report = validate(matrix().drop(columns='Green_Zone'))
+
+    assert result is None
+    assert report.has_errors
+    assert report.count('missing_column', 'Green_Zone') == 4
+
+
+def test_sample_rows_are_limited_but_count_is_complete():
+    _, report = validate(pd.concat([matrix(Red_Zone=['x'] * 4)] * 3, ignore_index=True))
+
+    assert report.count('invalid_number') == 12
+    assert report.issues[0]['Sample_Rows'] == [2, 3, 4, 5, 6][:app.VALIDATION_SAMPLE_ROWS]
+
+
+def test_merge_shifts_chunk_rows_and_adds_counts():
+    total = app.ValidationReport()
+
+    for offset, values in [(0, ['5', 'x', '5', '5']), (4, ['x', '5', '5', 'x'])]:
+        _, chunk = validate(matrix(Red_Zone=values))
+        total.merge(chunk, row_offset=offset)
+
+    assert total.count('invalid_number', 'Red_Zone') == 3
+    assert total.issues[0]['Sample_Rows'] == [3, 6, 9]
+
+
+def test_duplicate_rows_keep_original_row_numbers():
+    report = app.ValidationReport()
+    stock = pd.DataFrame({
+        'Article': ['A1', 'A2', 'A1', 'A1'],
+        'Store_ID': ['S1', 'S1', 'S1', 'S1'],
+        'Current_Stock': [1, 2, 3, 4]
+    }, index=[0, 2, 3, 5])
+
+    with app.capture_messages([]):
+        result = app.consolidate_duplicates(stock, "Остатки", report, policy='sum', sum_columns=['Current_Stock'])
+
+    # Строки 1 и 4 уже удалены до консолидации: примеры - по исходным позициям 3 и 5
+    assert report.issues[0]['Sample_Rows'] == [5, 7]
+    assert result.set_index('Article')['Current_Stock'].to_dict() == {'A1': 8, 'A2': 2}
+
+
+def test_to_frame_joins_sample_rows():
+    _, report = validate(matrix(Red_Zone=['x', '5', 'x', '5']))
+
+    frame = report.to_frame()
+
+    assert frame.columns.tolist() == app.ValidationReport.COLUMNS
+    assert frame.loc[0, 'Sample_Rows'] == '2, 4'